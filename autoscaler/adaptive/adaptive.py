@@ -0,0 +1,185 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Adaptive handles deciding whether a running load test has gathered enough
+results to be confident whether each target is above or below its threshold,
+allowing the load test to stop early
+"""
+import math
+from histogram.histogram import from_response_times, count, count_at_or_below, variance
+from plan.plan import (TargetIndex, compile_targets, failure_ratio, TARGET_MEAN, TARGET_MAX,
+                       TARGET_MIN, TARGET_REQUESTS, TARGET_FAILURES, TARGET_FAILURE_RATIO)
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_SAMPLES = 100
+
+ABOVE = "above"
+BELOW = "below"
+
+def z_score(confidence):
+    """
+    z_score returns the two sided standard normal critical value for the
+    confidence provided, e.g. 1.96 for 0.95
+    """
+    if not 0 < confidence < 1:
+        raise Exception(f"Invalid adaptive confidence: {confidence}")
+    # bisect the normal CDF, avoids needing scipy for the inverse
+    target = (1 + confidence) / 2
+    low, high = 0.0, 10.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < target:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+def wilson_interval(proportion, total, critical_value):
+    """
+    wilson_interval returns the centre and margin of the Wilson score interval
+    around the proportion of the total provided, which holds up for
+    proportions close to 0 or 1
+    """
+    z_squared = critical_value ** 2
+    centre = (proportion + z_squared / (2 * total)) / (1 + z_squared / total)
+    margin = (critical_value / (1 + z_squared / total)) * math.sqrt(
+        proportion * (1 - proportion) / total + z_squared / (4 * total ** 2))
+    return centre, margin
+
+def look_confidence(confidence, looks):
+    """
+    look_confidence returns the confidence each of the looks provided must be
+    tested at for the chance of any of them wrongly deciding a target to stay
+    within the confidence provided, splitting the error rate evenly between
+    them (a Bonferroni correction)
+    """
+    return 1 - (1 - confidence) / max(1, looks)
+
+class Adaptive:
+    """
+    Adaptive abstracts sampling load test stats while the test runs, deciding
+    for each target whether it is confidently above or below its threshold.
+    A target is tested at every sample, so each test is made at a higher
+    confidence to keep the chance of a wrong decision over the whole run,
+    the looks provided, within the confidence configured
+    """
+    def __init__(self, eval_config, index=None, looks=1):
+        adaptive_config = eval_config.get("adaptive")
+        self.targets = eval_config.get("targets")
+        self.index = index
+        self.confidence = float(adaptive_config.get("confidence", DEFAULT_CONFIDENCE))
+        self.min_samples = int(adaptive_config.get("minSamples", DEFAULT_MIN_SAMPLES))
+        self.looks = looks
+        self.z_score = z_score(look_confidence(self.confidence, looks))
+
+    def sample(self, stats, elapsed):
+        """
+        sample takes the current stats of the running load test and the
+        seconds it has run, returning True if every target has been decided
+        and the test can stop
+        """
+        if self.index is None:
+            self.index = TargetIndex(compile_targets(self.targets))
+        # stopping before the longest window has passed would leave windowed
+        # targets judged on a partial window
+        if elapsed < self.__longest_window():
+            return False
+        requests = stats.get("requests", {})
+        for target, request in zip(self.index.targets, self.index.select(requests)):
+            if self.__decide(target, request) is None:
+                return False
+        return True
+
+    def __longest_window(self):
+        return max((target.window_seconds for target in self.index.targets
+                    if target.window is not None and target.weight != 0), default=0)
+
+    def __decide(self, target, # pylint: disable=too-many-return-statements,too-many-branches
+                 request):
+        if target.weight == 0:
+            # never breached, nothing to wait for
+            return BELOW
+        if request is None:
+            return None
+        # locust counts failed requests apart from successful ones, and only times successful ones
+        samples = request.get("num_requests", 0)
+        if target.type == TARGET_FAILURE_RATIO:
+            samples += request.get("num_failures", 0)
+        if samples < self.min_samples:
+            return None
+
+        target_type = target.type
+        target_value = target.value
+
+        if target_type == TARGET_MAX:
+            # the max only grows, so can only ever be decided once it's over
+            if request.get("max_response_time") > target_value:
+                return ABOVE
+            return None
+        if target_type == TARGET_MIN:
+            # the min only falls, so can only ever be decided once it's under
+            min_response_time = request.get("min_response_time")
+            if min_response_time is not None and min_response_time < target_value:
+                return BELOW
+            return None
+        if target_type in (TARGET_REQUESTS, TARGET_FAILURES):
+            # counts only grow, so can only ever be decided once they're over
+            if request.get(target.field, 0) > target_value:
+                return ABOVE
+            return None
+        if target_type == TARGET_FAILURE_RATIO:
+            ratio = failure_ratio(request.get("num_requests", 0), request.get("num_failures", 0))
+            centre, margin = wilson_interval(ratio, samples, self.z_score)
+            if centre - margin > target_value:
+                return ABOVE
+            if centre + margin < target_value:
+                return BELOW
+            return None
+        if not target.latency:
+            # the rate a load test reaches isn't known until it has finished
+            return None
+
+        # stats sampled from the running test still have the raw response times
+        response_times = request.get("response_times")
+        if response_times is None:
+            return None
+        histogram = from_response_times(response_times)
+        if count(histogram) == 0:
+            return None
+
+        if target_type == TARGET_MEAN:
+            return self.__decide_mean(request.get("avg_response_time"), histogram, target_value)
+        return self.__decide_percentile(target.percent, histogram, target_value)
+
+    def __decide_mean(self, mean, histogram, target_value):
+        # normal confidence interval around the mean
+        margin = self.z_score * math.sqrt(variance(histogram) / count(histogram))
+        if mean - margin > target_value:
+            return ABOVE
+        if mean + margin < target_value:
+            return BELOW
+        return None
+
+    def __decide_percentile(self, percent, histogram, target_value):
+        # the percentile is above the target if fewer than percent of requests
+        # were at or below the target, use a Wilson score interval on that
+        # proportion as it holds up for the extreme proportions of p99 and up
+        total = count(histogram)
+        proportion = count_at_or_below(histogram, target_value) / total
+        centre, margin = wilson_interval(proportion, total, self.z_score)
+        if centre + margin < percent / 100:
+            return ABOVE
+        if centre - margin > percent / 100:
+            return BELOW
+        return None
@@ -0,0 +1,326 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import pytest
+from .adaptive import Adaptive, z_score, look_confidence
+from loadtest.loadtest import add_request_failures
+
+def failures(occurrences):
+    # invokust only reports failures by error, not per request
+    return {"GET_/test": {"method": "GET", "name": "/test", "error": "ConnectionError()", "occurrences": occurrences}}
+
+def test_z_score(subtests):
+    test_cases = [
+        {
+            "description": "Invalid confidence",
+            "expected_exception": Exception("Invalid adaptive confidence: 1"),
+            "confidence": 1
+        },
+        {
+            "description": "95% confidence",
+            "expected": 1.960,
+            "confidence": 0.95
+        },
+        {
+            "description": "99% confidence",
+            "expected": 2.576,
+            "confidence": 0.99
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    z_score(test_case["confidence"])
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == round(z_score(test_case["confidence"]), 3)
+
+def test_look_confidence(subtests):
+    test_cases = [
+        {
+            "description": "Single look, confidence unchanged",
+            "expected": 0.95,
+            "confidence": 0.95,
+            "looks": 1
+        },
+        {
+            "description": "No looks planned, treated as one",
+            "expected": 0.95,
+            "confidence": 0.95,
+            "looks": 0
+        },
+        {
+            "description": "Error rate split across looks",
+            "expected": 0.9975,
+            "confidence": 0.95,
+            "looks": 20
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == pytest.approx(look_confidence(test_case["confidence"], test_case["looks"]))
+
+def wrong_decisions(looks, runs=200, per_look=20):
+    # a target right on its value should never be decided, every early stop is wrong
+    rng = random.Random(1)
+    stopped = 0
+    for _ in range(runs):
+        adaptive = Adaptive({
+            "targets": [{"method": "GET", "endpoint": "/test", "type": "mean", "target": 100}],
+            "adaptive": {"confidence": 0.95, "minSamples": 20}
+        }, looks=looks)
+        response_times = {}
+        for look in range(looks):
+            for _ in range(per_look):
+                response_time = max(0, round(rng.gauss(100, 30)))
+                response_times[response_time] = response_times.get(response_time, 0) + 1
+            num_requests = (look + 1) * per_look
+            avg = sum(time * count for time, count in response_times.items()) / num_requests
+            stats = {"requests": {"GET_/test": {"num_requests": num_requests, "avg_response_time": avg,
+                                                "response_times": dict(response_times)}}}
+            if adaptive.sample(stats, look + 1):
+                stopped += 1
+                break
+    return stopped / runs
+
+def test_adaptive_error_rate():
+    # testing at the configured confidence at every look would be wrong far
+    # more often than 5% of the time, split across the looks it stays within
+    assert wrong_decisions(30) <= 0.05
+
+def test_adaptive_sample(subtests):
+    test_cases = [
+        {
+            "description": "Unknown target type",
+            "expected_exception": Exception("Unknown target type: invalid"),
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "invalid", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "response_times": {10: 200}}
+            }
+        },
+        {
+            "description": "No results for target yet, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}
+            ],
+            "requests": {}
+        },
+        {
+            "description": "Fewer than min samples, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 99, "avg_response_time": 30, "response_times": {30: 99}}
+            }
+        },
+        {
+            "description": "Mean confidently above target, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 30, "response_times": {20: 100, 40: 100}}
+            }
+        },
+        {
+            "description": "Mean confidently below target, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 5, "response_times": {4: 100, 6: 100}}
+            }
+        },
+        {
+            "description": "Mean too close to target to call, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 11, "response_times": {2: 100, 20: 100}}
+            }
+        },
+        {
+            "description": "Max above target, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "max", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "max_response_time": 11}
+            }
+        },
+        {
+            "description": "Max below target can never be decided, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "max", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "max_response_time": 2}
+            }
+        },
+        {
+            "description": "Median and p99 decided, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "median", "target": 10},
+                {"method": "GET", "endpoint": "/test", "type": "p99", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 1000, "response_times": {5: 900, 50: 100}}
+            }
+        },
+        {
+            "description": "p95 too close to target to call, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "median", "target": 10},
+                {"method": "GET", "endpoint": "/test", "type": "p95", "target": 10}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 1000, "response_times": {5: 950, 50: 50}}
+            }
+        },
+        {
+            "description": "Failure ratio confidently above target, all failed, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 0}
+            },
+            "failures": failures(200)
+        },
+        {
+            "description": "Failure ratio confidently below target, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 1000}
+            },
+            "failures": failures(1)
+        },
+        {
+            "description": "Failure ratio close to target, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 190}
+            },
+            "failures": failures(10)
+        },
+        {
+            "description": "Failures over target, min under target, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "failures", "target": 5},
+                {"method": "GET", "endpoint": "/test", "type": "min", "target": 5}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "min_response_time": 2}
+            },
+            "failures": failures(6)
+        },
+        {
+            "description": "Request rate only known at the end, weight 0 target ignored, continue",
+            "expected": False,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "rps", "target": 5},
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 5, "weight": 0}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "total_rps": 50}
+            }
+        },
+        {
+            "description": "Decided before the longest window has passed, continue",
+            "expected": False,
+            "elapsed": 29,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10},
+                {"method": "GET", "endpoint": "/test", "type": "p99", "target": 10, "window": {"seconds": 30}}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 30, "response_times": {30: 200}}
+            }
+        },
+        {
+            "description": "Decided once the longest window has passed, stop",
+            "expected": True,
+            "elapsed": 30,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10, "window": {"seconds": 10}},
+                {"method": "GET", "endpoint": "/test", "type": "p99", "target": 10, "window": {"seconds": 30}}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 30, "response_times": {30: 200}}
+            }
+        },
+        {
+            "description": "Window of weight 0 target not waited for, stop",
+            "expected": True,
+            "elapsed": 1,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10},
+                {"method": "GET", "endpoint": "/test", "type": "p99", "target": 10, "weight": 0,
+                 "window": {"seconds": 30}}
+            ],
+            "requests": {
+                "GET_/test": {"num_requests": 200, "avg_response_time": 30, "response_times": {30: 200}}
+            }
+        },
+        {
+            "description": "Weight 0 target not waited for, stop",
+            "expected": True,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "rps", "target": 5, "weight": 0}
+            ],
+            "requests": {}
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            adaptive = Adaptive({
+                "targets": test_case["targets"],
+                "adaptive": {
+                    "confidence": 0.95,
+                    "minSamples": 100
+                }
+            })
+            stats = add_request_failures({"requests": test_case["requests"], "failures": test_case.get("failures", {})})
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    adaptive.sample(stats, test_case.get("elapsed", 1))
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == adaptive.sample(stats, test_case.get("elapsed", 1))
@@ -16,19 +16,77 @@ Entrypoint for the locust autoscaler, routes to required logic
 based on mode provided, gathers environment variables and reads
 stdin
 """
+import time
+# taken before anything else is imported, to time the autoscaler's own imports
+IMPORT_START = time.perf_counter()
+# pylint: disable=wrong-import-position
+import io
 import os
 import sys
 import json
+import math
+import tempfile
+import threading
 import argparse
 import yaml
-import invokust
 
 from metric.metric import Metric
 from evaluate.evaluate import Evaluate
 from decay.decay import DecayHandler
+from state.state import StateStore
+from plan.plan import PlanCache
+from history.history import History, DEFAULT_HISTORY_SIZE
+from adaptive.adaptive import Adaptive
+from timeseries.timeseries import TimeSeries
+from sizing.sizing import LoadSizer, LOAD_FIXED
+from loadtest.loadtest import (SampledLoadTest, create_locust_load_test, parse_run_time,
+                               ENGINE_LOCUST, ENGINE_NATIVE, DEFAULT_TIMEOUT)
+from multiprocess.multiprocess import (MultiProcessLoadTest, locust_worker, native_worker,
+                                       split_load, available_cores)
+from worker.worker import Worker, WarmProcess, DEFAULT_SOCKET_PATH
+from batch.batch import Batch, parse_batch_config, settings_getenv
+from telemetry.telemetry import (Telemetry, RUNS_TOTAL, RUN_FAILURES_TOTAL, METRIC_CACHE_HITS_TOTAL,
+                                 METRIC_CACHE_MISSES_TOTAL)
+from resultcache.resultcache import (ResultCache, cache_key, file_hash, DEFAULT_CACHE_DIRECTORY,
+                                     DEFAULT_CACHE_MAX_ENTRIES)
+from stagger.stagger import (Stagger, stagger_timeout, FileLeaseStore, KubernetesLeaseStore,
+                             STAGGER_NONE, STAGGER_FILE, STAGGER_KUBERNETES, DEFAULT_STAGGER_SLOTS,
+                             DEFAULT_METRIC_TIMEOUT, DEFAULT_LEASE_GRACE,
+                             DEFAULT_STAGGER_DIRECTORY, DEFAULT_LEASE_NAME)
+from profiling.profiling import (Profiler, parse_modes, PROFILE_DETERMINISTIC,
+                                 DEFAULT_PROFILE_DIRECTORY, DEFAULT_PROFILE_MAX_BYTES,
+                                 DEFAULT_SAMPLING_INTERVAL)
+# pylint: enable=wrong-import-position
+
+# environment variables used to size the load test
+SIZING_SETTINGS = ["locustUsers", "locustHatchRate", "locustUsersPerReplica",
+                   "locustRequestRateSource", "locustRequestsPerUser", "locustMinUsers",
+                   "locustMaxUsers"]
 
 METRIC_MODE = "metric"
 EVALUATE_MODE = "evaluate"
+BATCH_MODE = "batch"
+WORKER_MODE = "worker"
+# a child started ahead of time by the worker, told which mode to run once it is needed
+CHILD_MODE = "child"
+
+# set by the worker for the modes it runs in a child process, where the child
+# hands its telemetry back for the worker to accumulate and export
+WORKER_TELEMETRY_PATH = "workerTelemetryPath"
+
+# state stores are kept between runs in worker mode, so unchanged state is not re-read
+STATE_STORES = {}
+# compiled evaluation configs are kept between runs in worker mode, so an unchanged
+# config is not re-parsed
+PLAN_CACHES = {}
+
+# use the libyaml parser where it is available, falling back to pure Python
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader) # pylint: disable=invalid-name
+
+# phase timings and load test results, kept for the life of the process so
+# they accumulate across runs in worker mode
+TELEMETRY = Telemetry()
+TELEMETRY.observe("import", time.perf_counter() - IMPORT_START)
 
 def main():
     """
@@ -39,15 +97,58 @@ def main():
     parser.add_argument("mode")
     args = parser.parse_args()
 
+    mode = args.mode
+    if mode == CHILD_MODE:
+        prepare_child()
+        # blocks until the worker has a request for this child
+        data = sys.stdin.read()
+        if data == "":
+            # the worker stopped without using this child
+            return
+        request = json.loads(data)
+        mode = request["mode"]
+        os.environ[WORKER_TELEMETRY_PATH] = request["telemetry_path"]
+        sys.stdin = io.StringIO(request["stdin"])
+
     # determine evaluation or metric based on mode
-    if args.mode == METRIC_MODE:
-        gather_metric()
-    elif args.mode == EVALUATE_MODE:
-        gather_evaluation()
+    profiler = create_profiler()
+    if mode == METRIC_MODE:
+        instrumented(METRIC_MODE, profiler.wrap(METRIC_MODE, gather_metric))()
+    elif mode == EVALUATE_MODE:
+        instrumented(EVALUATE_MODE, profiler.wrap(EVALUATE_MODE, gather_evaluation))()
+    elif mode == BATCH_MODE:
+        instrumented(BATCH_MODE, profiler.wrap(BATCH_MODE, gather_batch))()
+    elif mode == WORKER_MODE:
+        serve_worker()
     else:
-        sys.stderr.write(f"Unknown mode: {args.mode}")
+        sys.stderr.write(f"Unknown mode: {mode}")
         sys.exit(1)
 
+def prepare_child():
+    """
+    prepare_child does the work a metric run would otherwise start with, importing
+    the configured load test engine and compiling the evaluation config, so
+    that a child started ahead of time is ready to load test straight away
+    """
+    # pylint: disable=import-outside-toplevel,unused-import
+    try:
+        if os.getenv("loadTestEngine", default=ENGINE_LOCUST) == ENGINE_NATIVE:
+            import httpload.httpload
+        else:
+            # importing locust patches the process with gevent, only ever done in a child
+            import invokust
+            import gevent
+            from locust import runners
+    except ImportError:
+        # left for the run itself to report
+        pass
+    try:
+        if os.path.exists(evaluation_config_path()):
+            read_evaluation_plan()
+    except Exception: # pylint: disable=broad-except
+        # an invalid config is reported by the run that uses it
+        pass
+
 def gather_metric():
     """
     gather_metrics retrieves environment variables and feeds them
@@ -55,72 +156,447 @@ def gather_metric():
     stdout
     """
     # get k8s resource
-    resource = json.loads(sys.stdin.read())
+    with TELEMETRY.span("metric_input"):
+        resource = json.loads(sys.stdin.read())
 
     # get env vars
-    host = os.getenv("locustHost", default=None)
-    run_time = os.getenv("locustRunTime", default="20")
-    file_path = os.getenv("locustFilePath", default="/locustfile.py")
     try:
-        user_count = int(os.getenv("locustUsers", default=None))
-        hatch_rate = int(os.getenv("locustHatchRate", default=None))
+        settings = metric_settings(resource, os.getenv)
     except ValueError as err:
         sys.stderr.write(f"Error parsing locust settings: {str(err)}")
         sys.exit(1)
 
-    # set up locust
-    settings = invokust.create_settings(
-        locustfile=file_path,
-        host=host,
-        num_clients=user_count,
-        hatch_rate=hatch_rate,
-        run_time=run_time
-    )
-    load_test = invokust.LocustLoadTest(settings)
-
-    # set up metric gatherer
-    metric_gatherer = Metric(load_test)
     # get metric
-    result = metric_gatherer.get(resource)
-    # write to stdout
-    sys.stdout.write((json.dumps(result)))
+    result = run_metric(resource, settings, os.getenv)
+    # write compact JSON to stdout
+    with TELEMETRY.span("metric_output"):
+        sys.stdout.write((json.dumps(result, separators=(",", ":"))))
+
+def metric_settings(resource, getenv):
+    """
+    metric_settings reads and parses the load test settings using the getenv
+    provided, sizing the load test to the resource provided
+    """
+    # size the load test, either fixed or to the resource being scaled
+    load_sizer = LoadSizer(getenv("locustLoadMode", LOAD_FIXED), {
+        name: getenv(name, None) for name in SIZING_SETTINGS
+    })
+    processes = getenv("locustProcesses", "1")
+    engine = getenv("loadTestEngine", ENGINE_LOCUST)
+    if engine not in (ENGINE_LOCUST, ENGINE_NATIVE):
+        raise ValueError(f"Unknown load test engine: {engine}")
+    user_count, hatch_rate = load_sizer.get(resource)
+    # reusing recent results is opt in, a TTL of 0 always runs a load test
+    cache = None
+    cache_ttl = float(getenv("metricCacheTTL", "0"))
+    if cache_ttl > 0:
+        cache = ResultCache(getenv("metricCacheDirectory", DEFAULT_CACHE_DIRECTORY), cache_ttl,
+                            int(getenv("metricCacheMaxEntries", str(DEFAULT_CACHE_MAX_ENTRIES))))
+    sample_interval = float(getenv("locustSampleInterval", "1"))
+    if sample_interval <= 0:
+        raise ValueError(f"Invalid sample interval: {sample_interval}")
+    run_time = parse_run_time(getenv("locustRunTime", "20"))
+    warm_up = parse_run_time(getenv("locustWarmUp", "0"))
+    return {
+        "engine": engine,
+        "wait_time": float(getenv("loadTestWaitTime", "0")),
+        "timeout": float(getenv("loadTestTimeout", str(DEFAULT_TIMEOUT))),
+        "host": getenv("locustHost", None),
+        "file_path": getenv("locustFilePath", "/locustfile.py"),
+        "sample_interval": sample_interval,
+        "processes": available_cores() if processes == "auto" else int(processes),
+        "run_time": run_time,
+        "warm_up": warm_up,
+        "time_series": parse_bool(getenv("locustTimeSeries", "false")),
+        "user_count": user_count,
+        "hatch_rate": hatch_rate,
+        "cache": cache,
+        "stagger": create_stagger(getenv, warm_up + run_time)
+    }
+
+def create_stagger(getenv, load_test_seconds):
+    """
+    create_stagger returns the stagger configured with the getenv provided,
+    leasing slots for the seconds the load test runs for by default, or None
+    if load tests are not staggered
+    """
+    backend = getenv("loadTestStagger", STAGGER_NONE)
+    if backend == STAGGER_NONE:
+        return None
+    if backend == STAGGER_FILE:
+        store = FileLeaseStore(getenv("loadTestStaggerDirectory", DEFAULT_STAGGER_DIRECTORY))
+    elif backend == STAGGER_KUBERNETES:
+        store = KubernetesLeaseStore.in_cluster(
+            getenv("loadTestStaggerLeaseName", DEFAULT_LEASE_NAME),
+            getenv("loadTestStaggerNamespace", None))
+    else:
+        raise ValueError(f"Unknown load test stagger backend: {backend}")
+    # the Custom Pod Autoscaler kills the hook once its timeout is up, waiting for a slot must
+    # leave time for the load test to run within it
+    jitter = float(getenv("loadTestStaggerJitter", "0"))
+    timeout = getenv("loadTestStaggerTimeout", None)
+    timeout = None if timeout is None else float(timeout)
+    timeout = stagger_timeout(float(getenv("metricTimeout", str(DEFAULT_METRIC_TIMEOUT))),
+                              load_test_seconds, jitter, timeout)
+    return Stagger(store, int(getenv("loadTestStaggerSlots", str(DEFAULT_STAGGER_SLOTS))),
+                   float(getenv("loadTestStaggerLeaseDuration",
+                                str(load_test_seconds + DEFAULT_LEASE_GRACE))),
+                   timeout, jitter=jitter, telemetry=TELEMETRY)
+
+def run_metric(resource, settings, getenv):
+    """
+    run_metric returns the metric gathered by running the load test described
+    by the parsed settings provided against the resource provided, reusing a
+    cached result of the same load test if caching is enabled and it is fresh
+    """
+    cache = settings["cache"]
+    if cache is None:
+        return run_load_test_metric(resource, settings, getenv)
 
+    with TELEMETRY.span("metric_cache"):
+        key = metric_cache_key(resource, settings, getenv)
+    result, cached = cache.fetch(key, lambda: run_load_test_metric(resource, settings, getenv))
+    TELEMETRY.inc(METRIC_CACHE_HITS_TOTAL if cached else METRIC_CACHE_MISSES_TOTAL)
+    return result
+
+def metric_cache_key(resource, settings, getenv):
+    """
+    metric_cache_key returns the key of the load test described by the parsed
+    settings provided against the resource provided, changing if the resource,
+    its replica count, the load settings, the locustfile or the evaluation
+    config change
+    """
+    metadata = resource.get("metadata", {})
+    identity = [resource.get("apiVersion"), resource.get("kind"), metadata.get("namespace"),
+                metadata.get("name"), resource.get("spec", {}).get("replicas")]
+    load_settings = {name: value for name, value in settings.items()
+                     if name not in ("cache", "stagger")}
+    locustfile = file_hash(settings["file_path"]) if settings["engine"] == ENGINE_LOCUST else None
+    return cache_key(identity, load_settings, locustfile, file_hash(evaluation_config_path(getenv)))
+
+def run_load_test_metric(resource, settings, getenv): # pylint: disable=too-many-locals
+    """
+    run_load_test_metric runs the load test described by the parsed settings
+    provided against the resource provided, returning the metric gathered
+    """
+    # get evaluation config, targets are needed to decide when to stop adaptive runs
+    eval_config = {}
+    index = None
+    if os.path.exists(evaluation_config_path(getenv)):
+        with TELEMETRY.span("metric_config"):
+            plan = read_evaluation_plan(getenv)
+        eval_config = plan.config
+        index = plan.index
+
+    samplers = []
+    if eval_config.get("adaptive") is not None:
+        # every sample is a look at the results, so the confidence is split across all of them
+        looks = math.ceil(settings["run_time"] / settings["sample_interval"])
+        samplers.append(Adaptive(eval_config, index, looks))
+    # record a time series if asked to, or if a target is evaluated over a window of it
+    time_series = None
+    windowed = index is not None and any(target.window is not None for target in index.targets)
+    if settings["time_series"] or windowed:
+        time_series = TimeSeries()
+        samplers.append(time_series)
+
+    # set up the load test, spreading load generation across processes if configured
+    if settings["engine"] == ENGINE_NATIVE:
+        if index is None:
+            raise Exception("Native load engine requires an evaluation config with targets to "
+                            "request")
+        # the native engine requests the targets directly rather than running a locustfile, only
+        # import it when it is used so the evaluate path stays light
+        from httpload.httpload import ( # pylint: disable=import-outside-toplevel
+            create_native_load_test, load_requests)
+        requests = load_requests(index.targets)
+        load_settings = {
+            "host": settings["host"],
+            "users": settings["user_count"],
+            "hatch_rate": settings["hatch_rate"],
+            "wait_time": settings["wait_time"],
+            "timeout": settings["timeout"]
+        }
+        worker, worker_args, users_key = native_worker, {"requests": requests}, "users"
+    else:
+        load_settings = {
+            "locustfile": settings["file_path"],
+            "host": settings["host"],
+            "num_clients": settings["user_count"],
+            "hatch_rate": settings["hatch_rate"]
+        }
+        worker, worker_args, users_key = locust_worker, {}, "num_clients"
+    sample_interval = settings["sample_interval"]
+    run_time_seconds = settings["run_time"]
+    warm_up_seconds = settings["warm_up"]
+    with TELEMETRY.span("load_test_setup"):
+        if settings["processes"] > 1:
+            loads = split_load(settings["user_count"], settings["hatch_rate"],
+                               settings["processes"])
+            load_test = MultiProcessLoadTest(worker, [
+                dict(worker_args,
+                     settings=dict(load_settings, hatch_rate=rate, **{users_key: users}),
+                     interval=sample_interval, run_time=run_time_seconds, warm_up=warm_up_seconds)
+                for users, rate in loads
+            ])
+            if samplers:
+                # each worker excludes its own warm up, only wait it out here
+                load_test = SampledLoadTest(
+                    load_test, samplers, sample_interval, run_time_seconds,
+                    spawn=lambda target: threading.Thread(target=target, daemon=True).start(),
+                    sleep=time.sleep, stop=load_test.stop, warm_up=warm_up_seconds,
+                    warm_up_excluded=True, telemetry=TELEMETRY)
+        elif settings["engine"] == ENGINE_NATIVE:
+            load_test = create_native_load_test(requests, load_settings, samplers,
+                                                sample_interval, run_time_seconds,
+                                                warm_up_seconds, TELEMETRY)
+        else:
+            load_test = create_locust_load_test(load_settings, samplers, sample_interval,
+                                                run_time_seconds, warm_up_seconds, TELEMETRY)
+
+    # set up metric gatherer, projecting results to what the targets need if
+    # there are targets to project to
+    metric_gatherer = Metric(load_test, index=index, time_series=time_series, telemetry=TELEMETRY)
+    if settings["stagger"] is None:
+        return metric_gatherer.get(resource)
+    # only hold a slot while load testing, so a cache hit or a failed setup never waits for one
+    with settings["stagger"].slot():
+        return metric_gatherer.get(resource)
 
 def gather_evaluation():
     """
     gather_evaluation retrieves stdin and feeds it to the evaluation
     logic, outputting the results to stdout
     """
-
-    # get evaluation config
-    eval_config_file_path = os.getenv("evaluationConfigFilePath", default="/evaluation_config.yaml")
-    eval_config = None
-    with open(eval_config_file_path, "r") as eval_config_file:
-        # parse YAML into dict
-        eval_config = yaml.load(eval_config_file, Loader=yaml.FullLoader)
-
     # get provided metrics
-    resource_metrics = json.loads(sys.stdin.read())
-    metrics = resource_metrics.get("metrics")
-    metric = metrics[0]
-    metric_value = json.loads(metric.get("value"))
+    with TELEMETRY.span("evaluate_input"):
+        resource_metrics = json.loads(sys.stdin.read())
+        metrics = resource_metrics.get("metrics")
+        metric = metrics[0]
+        metric_value = json.loads(metric.get("value"))
     run_type = resource_metrics.get("run_type")
 
-    # open decay info file
-    decay_info_file_path = os.getenv("decayInfoFilePath", default="/decay_info.json")
-    # create empty file if doesn't exist
-    open(decay_info_file_path, "a").close()
-    # open file in read-write mode
-    with open(decay_info_file_path, "r+") as decay_info_file:
-        # set up decay handler
-        decay_handler = DecayHandler(decay_info_file)
-
-        # set up evaluator and get evaluation
-        evaluater = Evaluate(decay_handler, eval_config, run_type)
-        result = evaluater.get(metric_value)
-        sys.stdout.write((json.dumps({
-            "target_replicas": result
-        })))
+    result = run_evaluation(metric_value, run_type, os.getenv)
+    sys.stdout.write((json.dumps({
+        "target_replicas": result
+    })))
+
+def run_evaluation(metric_value, run_type, getenv):
+    """
+    run_evaluation evaluates the metric provided using the config and state
+    files found with the getenv provided, returning the target replica count
+    """
+    # get compiled evaluation config
+    with TELEMETRY.span("evaluate_config"):
+        plan = read_evaluation_plan(getenv)
+    eval_config = plan.config
+
+    # set up decay handler, backed by the decay info state file
+    decay_info_file_path = getenv("decayInfoFilePath", "/decay_info.json")
+    decay_handler = DecayHandler(state_store(decay_info_file_path), TELEMETRY)
+
+    # open history of past results if configured
+    history = None
+    history_config = eval_config.get("history")
+    if history_config is not None:
+        history_file_path = getenv("historyFilePath", "/history.bin")
+        history = History(history_file_path, history_config.get("size", DEFAULT_HISTORY_SIZE),
+                          len(eval_config.get("targets")))
+
+    # set up evaluator and get evaluation
+    try:
+        evaluater = Evaluate(decay_handler, eval_config, run_type, history, plan.index, TELEMETRY)
+        return evaluater.get(metric_value)
+    finally:
+        if history is not None:
+            history.close()
+
+def gather_batch():
+    """
+    gather_batch retrieves the resources to scale from stdin, load testing
+    and evaluating each with the settings in the batch config, outputting
+    the target replica count of each to stdout
+    """
+    batch_config_file_path = os.getenv("batchConfigFilePath", default="/batch_config.yaml")
+    with open(batch_config_file_path, "r") as batch_config_file:
+        batch_config = yaml.load(batch_config_file, Loader=YAML_LOADER)
+    parallelism, settings = parse_batch_config(batch_config, os.getenv)
+
+    # get the k8s resources to scale, keyed by resource name
+    request = json.loads(sys.stdin.read())
+    resources = request.get("resources")
+    if not isinstance(resources, dict):
+        raise Exception("Batch input must have a mapping of resources")
+
+    batch = Batch(run_batch_metric, run_batch_evaluation, parallelism)
+    result = batch.get(resources, settings, request.get("run_type", "scaler"))
+    sys.stdout.write((json.dumps({
+        "resources": result
+    })))
+
+def run_batch_metric(resource, settings):
+    """
+    run_batch_metric runs the metric stage for a resource in a batch, with the
+    resource's own settings
+    """
+    getenv = settings_getenv(settings)
+    try:
+        parsed_settings = metric_settings(resource, getenv)
+    except ValueError as err:
+        raise Exception(f"Error parsing locust settings: {str(err)}")
+    return run_metric(resource, parsed_settings, getenv)
+
+def run_batch_evaluation(metric_value, settings, run_type):
+    """
+    run_batch_evaluation runs the evaluate stage for a resource in a batch,
+    with the resource's own config and state files
+    """
+    return run_evaluation(metric_value, run_type, settings_getenv(settings))
+
+def instrumented(mode, handler):
+    """
+    instrumented wraps the handler for the mode provided, timing and counting
+    its runs and exporting telemetry once each run finishes
+    """
+    def run():
+        TELEMETRY.inc(RUNS_TOTAL, mode=mode)
+        try:
+            with TELEMETRY.span(mode):
+                handler()
+        except SystemExit as err:
+            if err.code not in (None, 0):
+                TELEMETRY.inc(RUN_FAILURES_TOTAL, mode=mode)
+            raise
+        except Exception:
+            TELEMETRY.inc(RUN_FAILURES_TOTAL, mode=mode)
+            raise
+        finally:
+            export_telemetry()
+    return run
+
+def export_telemetry():
+    """
+    export_telemetry writes telemetry to the configured textfile, if any
+    """
+    worker_telemetry_path = os.getenv(WORKER_TELEMETRY_PATH, default=None)
+    if worker_telemetry_path:
+        with open(worker_telemetry_path, "w") as snapshot_file:
+            json.dump(TELEMETRY.snapshot(), snapshot_file)
+        return
+    telemetry_file_path = os.getenv("telemetryFilePath", default=None)
+    if not telemetry_file_path:
+        return
+    try:
+        TELEMETRY.write(telemetry_file_path)
+    except OSError as err:
+        # failing to export telemetry must not fail the run
+        sys.stderr.write(f"Failed to write telemetry to {telemetry_file_path}: {str(err)}\n")
+
+def create_profiler():
+    """
+    create_profiler returns a profiler for the modes configured to be
+    profiled, profiling no modes if the profiling settings are invalid
+    """
+    try:
+        return Profiler(parse_modes(os.getenv("profileModes", default="")),
+                        directory=os.getenv("profileDirectory", default=DEFAULT_PROFILE_DIRECTORY),
+                        profile_type=os.getenv("profileType", default=PROFILE_DETERMINISTIC),
+                        sample_rate=float(os.getenv("profileSampleRate", default="1")),
+                        max_bytes=int(os.getenv("profileMaxBytes",
+                                                default=str(DEFAULT_PROFILE_MAX_BYTES))),
+                        sampling_interval=float(os.getenv("profileSamplingInterval",
+                                                          default=str(DEFAULT_SAMPLING_INTERVAL))))
+    except ValueError as err:
+        # profiling is diagnostic, a mistake configuring it must not stop scaling
+        sys.stderr.write(f"Error parsing profiling settings, not profiling: {str(err)}\n")
+        return Profiler(set())
+
+def evaluation_config_path(getenv=os.getenv):
+    """
+    evaluation_config_path returns the configured evaluation config file path
+    """
+    return getenv("evaluationConfigFilePath", "/evaluation_config.yaml")
+
+def read_evaluation_plan(getenv=os.getenv):
+    """
+    read_evaluation_plan returns the compiled evaluation config, only parsing
+    and compiling the YAML again if the file has changed
+    """
+    path = evaluation_config_path(getenv)
+    if path not in PLAN_CACHES:
+        PLAN_CACHES[path] = PlanCache(path, lambda data: yaml.load(data, Loader=YAML_LOADER))
+    return PLAN_CACHES[path].get()
+
+def parse_bool(value):
+    """
+    parse_bool converts a true/false config value into a bool
+    """
+    if value.strip().lower() in ("true", "1", "yes"):
+        return True
+    if value.strip().lower() in ("false", "0", "no", ""):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+def state_store(path):
+    """
+    state_store returns the state store for the path provided
+    """
+    if path not in STATE_STORES:
+        STATE_STORES[path] = StateStore(path)
+    return STATE_STORES[path]
+
+def run_child(children, mode, stdin, cancelled):
+    """
+    run_child runs the mode provided in a warm child autoscaler process for
+    the worker, adding the telemetry it recorded to the worker's
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        telemetry_path = os.path.join(directory, "telemetry.json")
+        response = children.run(json.dumps({
+            "mode": mode,
+            "stdin": stdin,
+            "telemetry_path": telemetry_path
+        }), cancelled)
+        # a child killed part way through leaves no telemetry
+        if os.path.exists(telemetry_path):
+            with open(telemetry_path, "r") as telemetry_file:
+                TELEMETRY.merge(json.load(telemetry_file))
+            export_telemetry()
+    return response
+
+def serve_worker():
+    """
+    serve_worker starts a long-lived worker, serving metric and evaluate
+    requests sent over a Unix socket by the client entrypoint
+    """
+    socket_path = os.getenv("workerSocketPath", default=DEFAULT_SOCKET_PATH)
+    profiler = create_profiler()
+    # locust monkey patches the whole process with gevent and can only run one
+    # load test per process, so load tests run in a child process, which is
+    # stopped if the hook waiting on it is killed. The child is started ahead
+    # of time, so its imports are done by the time a load test is asked for
+    children = WarmProcess([sys.executable, os.path.abspath(__file__), CHILD_MODE])
+    children.warm()
+    worker = Worker({
+        EVALUATE_MODE: instrumented(EVALUATE_MODE, profiler.wrap(EVALUATE_MODE, gather_evaluation))
+    }, {
+        METRIC_MODE: lambda stdin, cancelled: run_child(children, METRIC_MODE, stdin, cancelled),
+        BATCH_MODE: lambda stdin, cancelled: run_child(children, BATCH_MODE, stdin, cancelled)
+    })
+    # serve telemetry for scraping if configured
+    telemetry_port = os.getenv("telemetryPort", default=None)
+    if telemetry_port:
+        telemetry_host = os.getenv("telemetryHost", default="127.0.0.1")
+        telemetry_server = TELEMETRY.listen((telemetry_host, int(telemetry_port)))
+        threading.Thread(target=telemetry_server.serve_forever, daemon=True).start()
+    server = worker.listen(socket_path)
+    try:
+        # handlers run on the main thread, where the sampling profiler can take samples
+        worker.serve(server)
+    finally:
+        children.close()
+        server.server_close()
+        os.unlink(socket_path)
 
 if __name__ == "__main__":
     main()
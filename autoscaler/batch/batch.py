@@ -0,0 +1,144 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Batch handles load testing and evaluating many resources in a single run,
+each with its own settings and state, running their load tests concurrently
+"""
+import os
+import re
+
+DEFAULT_PARALLELISM = 4
+
+# resource names are used in file names, so are kept to safe characters
+RESOURCE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+# state files that must not be shared between resources, with their defaults
+RESOURCE_FILES = {
+    "decayInfoFilePath": "/decay_info.json",
+    "historyFilePath": "/history.bin"
+}
+
+def resource_file_path(path, name):
+    """
+    resource_file_path returns the path provided with the resource name
+    inserted before its extension, e.g. /decay_info.json becomes
+    /decay_info.fibonacci.json
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{name}{extension}"
+
+def parse_batch_config(batch_config, getenv):
+    """
+    parse_batch_config validates the batch config, returning the parallelism
+    and the settings of each resource, any setting a resource doesn't set
+    falling back to the environment. Each resource gets its own state files
+    unless they are set explicitly
+    """
+    if not isinstance(batch_config, dict):
+        raise Exception("Invalid batch config: must be a mapping")
+    parallelism = batch_config.get("parallelism", DEFAULT_PARALLELISM)
+    if not isinstance(parallelism, int) or isinstance(parallelism, bool) or parallelism < 1:
+        raise Exception("Invalid batch config: parallelism must be a positive integer, "
+                        f"got {parallelism}")
+    resources = batch_config.get("resources")
+    if not isinstance(resources, dict) or not resources:
+        raise Exception("Invalid batch config: resources must be a non-empty mapping")
+
+    settings = {}
+    for name, resource_settings in resources.items():
+        if not isinstance(name, str) or RESOURCE_NAME.match(name) is None:
+            raise Exception(f"Invalid batch config: invalid resource name: {name}")
+        if resource_settings is None:
+            resource_settings = {}
+        if not isinstance(resource_settings, dict):
+            raise Exception(f"Invalid batch config: resources.{name} must be a mapping")
+        # settings are read the same way as environment variables, as strings
+        resolved = {
+            key: str(value) for key, value in resource_settings.items() if value is not None
+        }
+        for key, default in RESOURCE_FILES.items():
+            if key not in resolved:
+                resolved[key] = resource_file_path(getenv(key, default), name)
+        # load tests already run in their own processes, which can't start more
+        processes = resolved.get("locustProcesses", getenv("locustProcesses", "1"))
+        if processes != "1":
+            raise Exception(f"Invalid batch config: resources.{name}: locustProcesses is not "
+                            "supported in batch mode, use parallelism")
+        settings[name] = resolved
+    return parallelism, settings
+
+def settings_getenv(settings, getenv=os.getenv):
+    """
+    settings_getenv returns a function that looks up a setting like
+    os.getenv, from the settings provided before the environment
+    """
+    def lookup(name, default=None):
+        if name in settings:
+            return settings[name]
+        return getenv(name, default)
+    return lookup
+
+def spawn_pool(processes):
+    """
+    spawn_pool returns a pool of the number of processes provided, spawned
+    rather than forked as forking a process with a running gevent hub isn't
+    safe, with a fresh process for every task as locust can only run a
+    single load test per process
+    """
+    # only batch runs use a pool, keep multiprocessing out of evaluate's startup
+    import multiprocessing # pylint: disable=import-outside-toplevel
+    return multiprocessing.get_context("spawn").Pool(processes, maxtasksperchild=1)
+
+class Batch:
+    """
+    Batch abstracts running the metric stage of many resources in a pool of
+    processes, at most parallelism at a time as locust can only run a single
+    load test per process, then evaluating each resource's results. A
+    resource failing is reported alongside the others' replica counts rather
+    than failing the batch
+    """
+    def __init__(self, run_metric, run_evaluation, parallelism, pool=spawn_pool):
+        self.run_metric = run_metric
+        self.run_evaluation = run_evaluation
+        self.parallelism = parallelism
+        self.pool = pool
+
+    def get(self, resources, settings, run_type):
+        """
+        get returns the target replica count, or error, of each resource
+        provided, keyed by resource name
+        """
+        results = {}
+        runnable = []
+        for name in resources:
+            if name in settings:
+                runnable.append(name)
+            else:
+                results[name] = {"error": f"No batch config for resource: {name}"}
+        if not runnable:
+            return results
+
+        with self.pool(min(self.parallelism, len(runnable))) as pool:
+            pending = {
+                name: pool.apply_async(self.run_metric, (resources[name], settings[name]))
+                for name in runnable
+            }
+            for name in runnable:
+                try:
+                    metric = pending[name].get()
+                    target_replicas = self.run_evaluation(metric, settings[name], run_type)
+                except Exception as err: # pylint: disable=broad-except
+                    results[name] = {"error": str(err)}
+                    continue
+                results[name] = {"target_replicas": target_replicas}
+        return results
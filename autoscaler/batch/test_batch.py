@@ -0,0 +1,226 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+from .batch import Batch, parse_batch_config, resource_file_path, settings_getenv, spawn_pool
+
+class FakeResult:
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def get(self):
+        return self.func(*self.args)
+
+class FakePool:
+    def __init__(self, processes):
+        self.processes = processes
+        self.submitted = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def apply_async(self, func, args):
+        self.submitted.append(args)
+        return FakeResult(func, args)
+
+def test_resource_file_path(subtests):
+    test_cases = [
+        {
+            "description": "Name inserted before extension",
+            "expected": "/decay/decay_info.fibonacci.json",
+            "path": "/decay/decay_info.json"
+        },
+        {
+            "description": "No extension, name appended",
+            "expected": "/history.fibonacci",
+            "path": "/history"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == resource_file_path(test_case["path"], "fibonacci")
+
+def test_parse_batch_config(subtests):
+    test_cases = [
+        {
+            "description": "Not a mapping",
+            "expected_exception": Exception("Invalid batch config: must be a mapping"),
+            "batch_config": ["fibonacci"],
+            "env": {}
+        },
+        {
+            "description": "Invalid parallelism",
+            "expected_exception": Exception("Invalid batch config: parallelism must be a positive integer, got 0"),
+            "batch_config": {"parallelism": 0, "resources": {"fibonacci": {}}},
+            "env": {}
+        },
+        {
+            "description": "No resources",
+            "expected_exception": Exception("Invalid batch config: resources must be a non-empty mapping"),
+            "batch_config": {"resources": {}},
+            "env": {}
+        },
+        {
+            "description": "Resource name unsafe in a file name",
+            "expected_exception": Exception("Invalid batch config: invalid resource name: ../fibonacci"),
+            "batch_config": {"resources": {"../fibonacci": {}}},
+            "env": {}
+        },
+        {
+            "description": "Resource settings not a mapping",
+            "expected_exception": Exception("Invalid batch config: resources.fibonacci must be a mapping"),
+            "batch_config": {"resources": {"fibonacci": ["locustUsers"]}},
+            "env": {}
+        },
+        {
+            "description": "Multiple load test processes from the environment",
+            "expected_exception": Exception("Invalid batch config: resources.fibonacci: locustProcesses is not "
+                                            "supported in batch mode, use parallelism"),
+            "batch_config": {"resources": {"fibonacci": {}}},
+            "env": {"locustProcesses": "auto"}
+        },
+        {
+            "description": "Defaults, separate state files per resource",
+            "expected": (4, {
+                "fibonacci": {
+                    "decayInfoFilePath": "/decay_info.fibonacci.json",
+                    "historyFilePath": "/history.fibonacci.bin"
+                },
+                "users": {
+                    "decayInfoFilePath": "/decay_info.users.json",
+                    "historyFilePath": "/history.users.bin"
+                }
+            }),
+            "batch_config": {"resources": {"fibonacci": None, "users": {}}},
+            "env": {}
+        },
+        {
+            "description": "Settings as strings, state files from the environment or set explicitly",
+            "expected": (2, {
+                "fibonacci": {
+                    "locustUsers": "50",
+                    "locustProcesses": "1",
+                    "decayInfoFilePath": "/decay/fibonacci.json",
+                    "historyFilePath": "/history/history.fibonacci.bin"
+                }
+            }),
+            "batch_config": {"parallelism": 2, "resources": {"fibonacci": {
+                "locustUsers": 50,
+                "locustProcesses": 1,
+                "decayInfoFilePath": "/decay/fibonacci.json"
+            }}},
+            "env": {"historyFilePath": "/history/history.bin", "locustProcesses": "2"}
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            getenv = lambda name, default=None, env=test_case["env"]: env.get(name, default)
+            if "expected_exception" in test_case:
+                with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                    parse_batch_config(test_case["batch_config"], getenv)
+            else:
+                assert test_case["expected"] == parse_batch_config(test_case["batch_config"], getenv)
+
+def test_settings_getenv():
+    getenv = settings_getenv({"locustUsers": "50"}, lambda name, default=None: {"locustUsers": "5",
+                                                                               "locustHost": "host"}.get(name, default))
+    assert getenv("locustUsers") == "50"
+    assert getenv("locustHost") == "host"
+    assert getenv("locustRunTime", "20") == "20"
+
+def test_spawn_pool():
+    # locust runs a single load test per process, so every task gets a fresh one
+    with spawn_pool(1) as pool:
+        pids = [pool.apply_async(os.getpid).get(30) for _ in range(2)]
+    assert pids[0] != pids[1]
+
+def test_batch_get(subtests):
+    def run_metric(resource, settings):
+        if settings.get("fail") == "metric":
+            raise Exception("fail to run load test")
+        return {"current_replicas": resource["spec"]["replicas"], "decay": settings["decayInfoFilePath"]}
+
+    def run_evaluation(metric, settings, run_type):
+        if settings.get("fail") == "evaluate":
+            raise Exception("fail to evaluate")
+        assert metric["decay"] == settings["decayInfoFilePath"]
+        return metric["current_replicas"] + (1 if run_type == "scaler" else 0)
+
+    settings = {
+        "fibonacci": {"decayInfoFilePath": "/decay_info.fibonacci.json"},
+        "users": {"decayInfoFilePath": "/decay_info.users.json"},
+        "broken": {"decayInfoFilePath": "/decay_info.broken.json", "fail": "metric"},
+        "invalid": {"decayInfoFilePath": "/decay_info.invalid.json", "fail": "evaluate"}
+    }
+    test_cases = [
+        {
+            "description": "No configured resources, nothing run",
+            "expected": {"unknown": {"error": "No batch config for resource: unknown"}},
+            "expected_processes": None,
+            "resources": {"unknown": {"spec": {"replicas": 1}}},
+            "parallelism": 4
+        },
+        {
+            "description": "Each resource evaluated with its own settings, failures reported per resource",
+            "expected": {
+                "fibonacci": {"target_replicas": 3},
+                "users": {"target_replicas": 6},
+                "broken": {"error": "fail to run load test"},
+                "invalid": {"error": "fail to evaluate"},
+                "unknown": {"error": "No batch config for resource: unknown"}
+            },
+            "expected_processes": 4,
+            "resources": {
+                "fibonacci": {"spec": {"replicas": 2}},
+                "users": {"spec": {"replicas": 5}},
+                "broken": {"spec": {"replicas": 1}},
+                "invalid": {"spec": {"replicas": 1}},
+                "unknown": {"spec": {"replicas": 1}}
+            },
+            "parallelism": 8
+        },
+        {
+            "description": "Parallelism bounds the pool",
+            "expected": {
+                "fibonacci": {"target_replicas": 3},
+                "users": {"target_replicas": 6}
+            },
+            "expected_processes": 1,
+            "resources": {
+                "fibonacci": {"spec": {"replicas": 2}},
+                "users": {"spec": {"replicas": 5}}
+            },
+            "parallelism": 1
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            pools = []
+
+            def pool(processes):
+                pools.append(FakePool(processes))
+                return pools[-1]
+
+            batch = Batch(run_metric, run_evaluation, test_case["parallelism"], pool)
+            assert test_case["expected"] == batch.get(test_case["resources"], settings, "scaler")
+            assert [created.processes for created in pools] == (
+                [] if test_case["expected_processes"] is None else [test_case["expected_processes"]])
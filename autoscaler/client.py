@@ -0,0 +1,98 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Thin client entrypoint for the locust autoscaler, forwards the mode and stdin
+to the worker over a Unix socket, starting the worker and running the mode
+directly if no worker is listening yet
+"""
+import os
+import sys
+import socket
+import argparse
+import subprocess
+
+from worker.worker import send_request, DEFAULT_SOCKET_PATH
+
+AUTOSCALER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autoscaler.py")
+
+# milliseconds the Custom Pod Autoscaler gives each hook, as set in config.yaml
+DEFAULT_EVALUATE_TIMEOUT = 2500
+DEFAULT_METRIC_TIMEOUT = 60000
+# seconds of the hook's time kept back, so a worker that doesn't respond is
+# reported before the hook is killed
+CLIENT_TIMEOUT_MARGIN = 0.5
+
+def main():
+    """
+    Main method for the client, forwards the mode to the worker
+    """
+    # get mode
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode")
+    args = parser.parse_args()
+
+    socket_path = os.getenv("workerSocketPath", default=DEFAULT_SOCKET_PATH)
+    timeout = client_timeout(args.mode, os.getenv)
+    stdin = sys.stdin.read()
+
+    try:
+        response = send_request(socket_path, args.mode, stdin, timeout)
+    except socket.timeout:
+        sys.stderr.write(f"Worker did not respond within {timeout:g}s")
+        sys.exit(1)
+    except OSError:
+        # no worker listening, start one for future calls and run this one directly
+        start_worker()
+        response = run_direct(args.mode, stdin)
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    sys.exit(response["exit_code"])
+
+def client_timeout(mode, getenv):
+    """
+    client_timeout returns how many seconds to wait for the worker to respond
+    to the mode provided, within the timeout of the hook running it
+    """
+    if mode == "evaluate":
+        hook_timeout = float(getenv("evaluateTimeout", str(DEFAULT_EVALUATE_TIMEOUT)))
+    else:
+        hook_timeout = float(getenv("metricTimeout", str(DEFAULT_METRIC_TIMEOUT)))
+    return max(hook_timeout / 1000 - CLIENT_TIMEOUT_MARGIN, CLIENT_TIMEOUT_MARGIN)
+
+def start_worker():
+    """
+    start_worker starts a detached worker process in the background
+    """
+    with open(os.devnull, "r+") as devnull:
+        subprocess.Popen([sys.executable, AUTOSCALER_PATH, "worker"],
+                         stdin=devnull, stdout=devnull, stderr=devnull,
+                         start_new_session=True)
+
+def run_direct(mode, stdin):
+    """
+    run_direct runs the mode in a new autoscaler process, returning its output
+    in the same form as a worker response
+    """
+    process = subprocess.run([sys.executable, AUTOSCALER_PATH, mode],
+                             input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=False)
+    return {
+        "exit_code": process.returncode,
+        "stdout": process.stdout,
+        "stderr": process.stderr
+    }
+
+if __name__ == "__main__":
+    main()
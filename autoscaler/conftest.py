@@ -0,0 +1,22 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Shared pytest configuration for the autoscaler packages
+"""
+import os
+import sys
+
+# packages import each other as top level packages, as they are when run
+# through autoscaler.py, so put the autoscaler directory on the path for tests
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
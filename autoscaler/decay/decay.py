@@ -12,35 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """
-Decay handles interactions with the decay info file, for storing decay
+Decay handles interactions with the decay state, for storing decay
 information such as number of runs since a scaling change
 """
-import json
+from telemetry.telemetry import Telemetry
+
+DEFAULT_DECAY_INFO = {
+    "runs_since_change": 0
+}
 
 class DecayHandler:
     """
-    DecayHandler abstracts interactions with the file system to get
-    and update the decay info file
+    DecayHandler abstracts interactions with the state store to get
+    and update the decay info
     """
-    def __init__(self, decay_file):
-        self.decay_file = decay_file
+    def __init__(self, state_store, telemetry=None):
+        self.state_store = state_store
+        self.telemetry = Telemetry() if telemetry is None else telemetry
 
     def get(self):
         """
-        get returns the decay info parsed into a JSON dict
+        get returns the decay info as a dict, filling in defaults for any
+        fields not yet stored
         """
-        # if empty, create a new JSON decay info
-        self.decay_file.seek(0)
-        data = self.decay_file.read()
-        if data == "":
-            return {
-                "runs_since_change": 0
-            }
-        return json.loads(data)
+        decay_info = dict(DEFAULT_DECAY_INFO)
+        with self.telemetry.span("decay_read"):
+            decay_info.update(self.state_store.get())
+        return decay_info
 
     def update(self, decay_info):
         """
-        update writes the provided decay_info to the decay info file
+        update stores the provided decay_info
         """
-        self.decay_file.seek(0)
-        self.decay_file.write(json.dumps(decay_info))
+        with self.telemetry.span("decay_write"):
+            self.state_store.update(decay_info)
@@ -15,52 +15,51 @@
 import pytest
 from .decay import DecayHandler
 
-class FakeDecayFile:
-    def __init__(self, seek_reactor, read_reactor, write_reactor):
-        self.seek_reactor = seek_reactor
-        self.read_reactor = read_reactor
-        self.write_reactor = write_reactor
+class FakeStateStore:
+    def __init__(self, get_reactor, update_reactor):
+        self.get_reactor = get_reactor
+        self.update_reactor = update_reactor
 
-    def seek(self, pos):
-        return self.seek_reactor(pos)
+    def get(self):
+        return self.get_reactor()
 
-    def read(self):
-        return self.read_reactor()
-
-    def write(self, data):
-        return self.write_reactor(data)
+    def update(self, state):
+        return self.update_reactor(state)
 
 def test_decay_get(subtests):
     test_cases = [
         {
-            "description": "Fail to seek",
-            "expected_exception": Exception("fail to seek"),
-            "decay_file": FakeDecayFile(lambda pos: (_ for _ in ()).throw(Exception("fail to seek")), None, None),
-        },
-        {
-            "description": "Fail to read",
-            "expected_exception": Exception("fail to read"),
-            "decay_file": FakeDecayFile(lambda pos: None, lambda: (_ for _ in ()).throw(Exception("fail to read")), None),
+            "description": "Fail to get state",
+            "expected_exception": Exception("fail to get state"),
+            "state_store": FakeStateStore(lambda: (_ for _ in ()).throw(Exception("fail to get state")), None),
         },
         {
-            "description": "Empty file, return starter JSON",
+            "description": "Empty state, return starter JSON",
             "expected": {
                 "runs_since_change": 0
             },
-            "decay_file": FakeDecayFile(lambda pos: None, lambda: "", None),
+            "state_store": FakeStateStore(lambda: {}, None),
         },
         {
             "description": "Success",
             "expected": {
                 "runs_since_change": 3
             },
-            "decay_file": FakeDecayFile(lambda pos: None, lambda: "{\"runs_since_change\": 3}", None),
+            "state_store": FakeStateStore(lambda: {"runs_since_change": 3}, None),
+        },
+        {
+            "description": "Success, other fields kept",
+            "expected": {
+                "runs_since_change": 0,
+                "other": "value"
+            },
+            "state_store": FakeStateStore(lambda: {"other": "value"}, None),
         }
     ]
 
     for i, test_case in enumerate(test_cases):
         with subtests.test(msg=test_case["description"], i=i):
-            decay_handler = DecayHandler(test_case["decay_file"])
+            decay_handler = DecayHandler(test_case["state_store"])
             if "expected_exception" in test_case.keys():
                 with pytest.raises(type(test_case["expected_exception"])) as ex:
                     decay_handler.get()
@@ -71,20 +70,12 @@ def test_decay_get(subtests):
 def test_decay_update(subtests):
     test_cases = [
         {
-            "description": "Fail to seek",
-            "expected_exception": Exception("fail to seek"),
-            "decay_info": {
-                "runs_since_change": 1
-            },
-            "decay_file": FakeDecayFile(lambda pos: (_ for _ in ()).throw(Exception("fail to seek")), None, None),
-        },
-        {
-            "description": "Fail to write",
-            "expected_exception": Exception("fail to write"),
+            "description": "Fail to update state",
+            "expected_exception": Exception("fail to update state"),
             "decay_info": {
                 "runs_since_change": 1
             },
-            "decay_file": FakeDecayFile(lambda pos: None, None, lambda data: (_ for _ in ()).throw(Exception("fail to write"))),
+            "state_store": FakeStateStore(None, lambda state: (_ for _ in ()).throw(Exception("fail to update state"))),
         },
         {
             "description": "Success",
@@ -92,16 +83,16 @@ def test_decay_update(subtests):
             "decay_info": {
                 "runs_since_change": 3
             },
-            "decay_file": FakeDecayFile(lambda pos: None, None, lambda data: None),
+            "state_store": FakeStateStore(None, lambda state: None),
         }
     ]
 
     for i, test_case in enumerate(test_cases):
         with subtests.test(msg=test_case["description"], i=i):
-            decay_handler = DecayHandler(test_case["decay_file"])
+            decay_handler = DecayHandler(test_case["state_store"])
             if "expected_exception" in test_case.keys():
                 with pytest.raises(type(test_case["expected_exception"])) as ex:
                     decay_handler.update(test_case["decay_info"])
                 assert str(ex.value) == str(test_case["expected_exception"])
             else:
-                assert test_case["expected"] == decay_handler.update(test_case["decay_info"])
\ No newline at end of file
+                assert test_case["expected"] == decay_handler.update(test_case["decay_info"])
@@ -16,92 +16,317 @@
 Evaluate handles calculating the number of replicas a resource should have,
 based on the locust metric results and targets provided
 """
+import math
+import time
+from plan.plan import (TargetIndex, compile_targets, SCALING_STEP, SCALING_PROPORTIONAL,
+                       DECAY_FIXED, DECAY_HEADROOM, DEFAULT_DECAY_HEADROOM,
+                       DEFAULT_DECAY_BREACH_MEMORY, BREACH_ABOVE, DEFAULT_UPPER_BAND,
+                       DEFAULT_LOWER_BAND, failure_ratio)
+from predict.predict import Predict
+from timeseries.timeseries import select_intervals, lookup_intervals
+from telemetry.telemetry import Telemetry
 
-TARGET_MEAN = "mean"
-TARGET_MEDIAN = "median"
-TARGET_MAX = "max"
+# version of the projected metric payload this evaluation reads
+PAYLOAD_VERSION = 1
 
 class Evaluate:
     """
     Evaluate abstracts calculating an evaluation, handling comparing
     targets with requests and determining decay
     """
-    def __init__(self, decay_handler, eval_config, run_type):
+    def __init__(self, decay_handler, eval_config, run_type, history=None, index=None,
+                 telemetry=None):
         self.decay_handler = decay_handler
         self.eval_config = eval_config
         self.run_type = run_type
+        self.history = history
+        self.index = index
+        self.telemetry = Telemetry() if telemetry is None else telemetry
 
     def get(self, metrics):
         """
         get handles comparing targets and locust results and scaling
         as needed
         """
+        version = metrics.get("version")
+        if version is not None and version != PAYLOAD_VERSION:
+            raise Exception(f"Unsupported metric payload version: {version}")
+
         current_replicas = metrics.get("current_replicas")
 
-        target_replica_count = self.__determine_target(metrics)
-        target_replica_count = self.__determine_decay(target_replica_count, current_replicas)
+        # targets compiled ahead of time are used as is, otherwise compile them from the config
+        index = self.index
+        if index is None:
+            index = TargetIndex(compile_targets(self.eval_config.get("targets")))
+
+        with self.telemetry.span("evaluate_targets"):
+            results = self.__target_results(index, metrics)
+            max_ratio = self.__max_ratio(index.targets, results)
+            target_replica_count = self.__determine_target(max_ratio, current_replicas)
+        with self.telemetry.span("evaluate_predict"):
+            target_replica_count = self.__determine_predicted(index.targets, target_replica_count,
+                                                              results, current_replicas)
+        with self.telemetry.span("evaluate_decay"):
+            target_replica_count = self.__determine_decay(target_replica_count, current_replicas,
+                                                          max_ratio)
+
+        if self.history is not None and self.run_type != "api_dry_run":
+            with self.telemetry.span("evaluate_history"):
+                self.__record(metrics, results, target_replica_count)
 
         return target_replica_count
 
-    def __determine_target(self, metrics):
+    def __scaling_config(self):
+        scaling_config = self.eval_config.get("scaling")
+        if scaling_config is None:
+            return {}
+        return scaling_config
+
+    def __stabilization_config(self):
+        stabilization_config = self.eval_config.get("stabilization")
+        if stabilization_config is None:
+            return {}
+        return stabilization_config
+
+    @staticmethod
+    def __target_results(index, metrics):
+        # a versioned payload already has each target's result aggregated under
+        # its name, matching pattern targets again would count requests twice,
+        # only an unversioned payload of every request needs matching
+        projected = metrics.get("version") is not None
         requests = metrics.get("requests")
-        targets = self.eval_config.get("targets")
+        time_series = metrics.get("time_series")
+        interval_requests = None
+        if time_series is not None and any(target.window is not None for target in index.targets):
+            select = lookup_intervals if projected else select_intervals
+            interval_requests = select(index, time_series)
 
-        current_replicas = metrics.get("current_replicas")
-        target_replica_count = current_replicas
-
-        # Iterate through targets, for each one compare target with results,
-        # if target below result, set target replicas to current replicas + 1
-        for target in targets:
-            # get target values
-            target_method = target.get("method")
-            target_endpoint = target.get("endpoint")
-            target_type = target.get("type")
-            target_value = target.get("target")
-
-            # build request name, check if target matches a request
-            target_name = f"{target_method}_{target_endpoint}"
-            if target_name not in requests:
-                raise Exception(f"No results for target: {target_name}")
-
-            # get matching request
-            request = requests.get(target_name)
-            result_value = None
-            if target_type == TARGET_MEAN:
-                result_value = request.get("avg_response_time")
-            elif target_type == TARGET_MEDIAN:
-                result_value = request.get("median_response_time")
-            elif target_type == TARGET_MAX:
-                result_value = request.get("max_response_time")
-            else:
-                raise Exception(f"Unknown target type: {target_type}")
+        # get the result value for each target from the request it reads, or
+        # from the time series for targets over a window
+        results = []
+        selected = index.lookup(requests) if projected else index.select(requests)
+        for i, (target, request) in enumerate(zip(index.targets, selected)):
+            if target.window is None:
+                if request is None:
+                    raise Exception(f"No results for target: {target.name}")
+                results.append(target.extract(request))
+                continue
+            if interval_requests is None:
+                raise Exception(f"No time series for target: {target.name}")
+            value = target.window_value(time_series["elapsed"],
+                                        [interval[i] for interval in interval_requests])
+            if value is None:
+                raise Exception(f"No results for target: {target.name}")
+            results.append(value)
+        return results
 
-            if result_value > target_value:
-                target_replica_count = current_replicas + 1
+    @staticmethod
+    def __max_ratio(targets, results):
+        # compare each target with its result, keeping the largest ratio of
+        # result to target, over 1 if any target is breached
+        return max([target.ratio(result_value)
+                    for target, result_value in zip(targets, results)] + [0])
+
+    def __determine_target(self, max_ratio, current_replicas):
+        # all targets met, or within the upper band, leave scaling down to the decay
+        if max_ratio <= float(self.__stabilization_config().get("upperBand", DEFAULT_UPPER_BAND)):
+            return current_replicas
+
+        scaling_config = self.__scaling_config()
+        scaling_mode = scaling_config.get("mode", SCALING_STEP)
+        max_step = scaling_config.get("maxStep")
+
+        if scaling_mode == SCALING_STEP:
+            # target breached, scale up by one
+            return current_replicas + 1
+        if scaling_mode != SCALING_PROPORTIONAL:
+            raise Exception(f"Unknown scaling mode: {scaling_mode}")
+
+        # scale in proportion to how far over target the worst target is, if the
+        # target is met at the current replica count it should be met at this count
+        if math.isinf(max_ratio):
+            target_replica_count = current_replicas + (1 if max_step is None else int(max_step))
+        else:
+            target_replica_count = max(math.ceil(current_replicas * max_ratio),
+                                       current_replicas + 1)
+        if max_step is not None:
+            target_replica_count = min(target_replica_count, current_replicas + int(max_step))
         return target_replica_count
 
-    def __determine_decay(self, target_replica_count, current_replicas):
+    def __determine_predicted(self, targets, target_replica_count, results, current_replicas):
+        predictive_config = self.eval_config.get("predictive")
+        if predictive_config is None:
+            return target_replica_count
+        if self.history is None:
+            raise Exception("Predictive scaling requires history to be enabled")
+
+        # only latency that breaches by rising is forecast, with the demand model latency follows
+        predict = Predict(predictive_config, [
+            target_config
+            if target.latency and target.breach == BREACH_ABOVE and target.weight > 0 else None
+            for target_config, target in zip(self.eval_config.get("targets"), targets)
+        ])
+        predicted_replica_count = predict.get(self.history.latest(predict.window), results,
+                                              current_replicas)
+        if predicted_replica_count <= target_replica_count:
+            return target_replica_count
+
+        # pre-scale, within the same step limit as a reactive scale up
+        max_step = self.__scaling_config().get("maxStep")
+        if max_step is not None:
+            predicted_replica_count = min(predicted_replica_count,
+                                          current_replicas + int(max_step))
+        return max(predicted_replica_count, target_replica_count)
+
+    def __determine_decay(self, target_replica_count, # pylint: disable=too-many-branches
+                          current_replicas, max_ratio):
         # get decay config
         decay_config = self.eval_config.get("decay")
-        decay_replicas = decay_config.get("replicas")
+        decay_mode = decay_config.get("mode", DECAY_FIXED)
+        if decay_mode not in (DECAY_FIXED, DECAY_HEADROOM):
+            raise Exception(f"Unknown decay mode: {decay_mode}")
         decay_unchanged_runs = int(decay_config.get("unchangedRuns"))
 
         # get decay info
         decay_info = self.decay_handler.get()
         runs_since_change = int(decay_info["runs_since_change"])
+        breaches = None
+        if decay_mode == DECAY_HEADROOM:
+            breaches = self.__remember_breaches(decay_info, decay_config, current_replicas,
+                                                max_ratio)
+        stabilization_config = self.eval_config.get("stabilization")
+        scale_up_held = False
+        if stabilization_config is not None:
+            target_replica_count, scale_up_held = self.__stabilize(
+                target_replica_count, current_replicas, max_ratio, decay_info, stabilization_config)
+
+        # if unchanged replica count, with every target under the lower band and no scale up held
+        # back, check for decay conditions
+        lower_band = float(self.__stabilization_config().get("lowerBand", DEFAULT_LOWER_BAND))
+        unchanged = target_replica_count == current_replicas and not scale_up_held
+        if unchanged and max_ratio <= lower_band:
+            if runs_since_change >= decay_unchanged_runs and self.__scale_down_cooled(decay_info):
+                if decay_mode == DECAY_HEADROOM:
+                    # enough runs have passed without change, search down for the fewest replicas
+                    # that meet the targets
+                    target_replica_count = self.__determine_headroom(current_replicas, max_ratio,
+                                                                     breaches, decay_config)
+                else:
+                    # enough runs have passed without change, decay by configured amount
+                    target_replica_count = current_replicas - decay_config.get("replicas")
 
-        # if unchanged replica count, check for decay conditions
-        if target_replica_count == current_replicas:
-            if runs_since_change >= decay_unchanged_runs:
-                # enough runs have passed without change, decay by configured amount
-                target_replica_count = current_replicas - decay_replicas
+        # keep within configured bounds before recording whether the count changed
+        target_replica_count = self.__bound(target_replica_count)
 
         if self.run_type != "api_dry_run":
-            if target_replica_count == current_replicas:
+            if scale_up_held:
+                # a scale up was only held back, the replicas are not settled enough to decay later
+                decay_info["runs_since_change"] = 0
+            elif target_replica_count == current_replicas:
                 # replica count unchanged, increment runs since change
                 decay_info["runs_since_change"] = runs_since_change + 1
             else:
                 # replica count changed, reset runs since change
                 decay_info["runs_since_change"] = 0
+            if breaches is not None:
+                decay_info["breaches"] = breaches
+            if stabilization_config is not None:
+                runs_since_scale_up = decay_info.get("runs_since_scale_up")
+                if target_replica_count > current_replicas:
+                    decay_info["runs_since_scale_up"] = 0
+                elif runs_since_scale_up is not None:
+                    decay_info["runs_since_scale_up"] = int(runs_since_scale_up) + 1
             self.decay_handler.update(decay_info)
         return target_replica_count
+
+    @staticmethod
+    def __stabilize(target_replica_count, current_replicas, max_ratio, decay_info,
+                    stabilization_config):
+        # count the runs in a row the worst target has been over the upper band
+        upper_band = float(stabilization_config.get("upperBand", DEFAULT_UPPER_BAND))
+        consecutive_breaches = 0
+        if max_ratio > upper_band:
+            consecutive_breaches = int(decay_info.get("consecutive_breaches", 0)) + 1
+        decay_info["consecutive_breaches"] = consecutive_breaches
+        if target_replica_count <= current_replicas:
+            return target_replica_count, False
+
+        # hold back a scale up until a breach has lasted, a predicted scale up is already based on
+        # a trend, and until replicas added by the last scale up have had time to start
+        required_breaches = int(stabilization_config.get("consecutiveBreaches", 1))
+        if max_ratio > upper_band and consecutive_breaches < required_breaches:
+            return current_replicas, True
+        runs_since_scale_up = decay_info.get("runs_since_scale_up")
+        if runs_since_scale_up is not None and \
+                int(runs_since_scale_up) < int(stabilization_config.get("scaleUpCooldownRuns", 0)):
+            return current_replicas, True
+        return target_replica_count, False
+
+    def __scale_down_cooled(self, decay_info):
+        # a scale up is not undone until it has had time to settle
+        runs_since_scale_up = decay_info.get("runs_since_scale_up")
+        cooldown_runs = int(self.__stabilization_config().get("scaleDownCooldownRuns", 0))
+        return runs_since_scale_up is None or int(runs_since_scale_up) >= cooldown_runs
+
+    @staticmethod
+    def __remember_breaches(decay_info, decay_config, current_replicas, max_ratio):
+        # age the replica counts that breached a target, as [replicas, runs ago] pairs, forgetting
+        # them once they are too old to say anything about the current load
+        breach_memory = int(decay_config.get("breachMemory", DEFAULT_DECAY_BREACH_MEMORY))
+        breaches = [[replicas, runs_ago + 1]
+                    for replicas, runs_ago in decay_info.get("breaches", [])
+                    if runs_ago + 1 < breach_memory]
+        if current_replicas is None:
+            return breaches
+        if max_ratio > 1:
+            return ([breach for breach in breaches if breach[0] != current_replicas]
+                    + [[current_replicas, 0]])
+        # the targets are met at the current count, so breaches at or above it are out of date
+        return [breach for breach in breaches if breach[0] < current_replicas]
+
+    def __determine_headroom(self, current_replicas, max_ratio, breaches, decay_config):
+        # the fewest replicas that could meet the targets, one above the most recent count known to
+        # breach them
+        min_replicas = self.__scaling_config().get("minReplicas")
+        lowest = max([replicas for replicas, _ in breaches] + [0]) + 1
+        lowest = max(lowest, 1 if min_replicas is None else int(min_replicas))
+        if lowest >= current_replicas:
+            return current_replicas
+
+        if max_ratio > float(decay_config.get("headroom", DEFAULT_DECAY_HEADROOM)):
+            # too close to a target to jump, probe one replica lower
+            return current_replicas - 1
+        # plenty of headroom, bisect between the lowest possible count and the current count, which
+        # meets the targets, within the max step
+        target_replica_count = (lowest + current_replicas) // 2
+        max_step = decay_config.get("maxStep")
+        if max_step is not None:
+            target_replica_count = max(target_replica_count, current_replicas - int(max_step))
+        return target_replica_count
+
+    def __record(self, metrics, results, target_replica_count):
+        num_requests = metrics.get("num_requests", 0)
+        run_time = metrics.get("run_time")
+        start_time = metrics.get("start_time")
+        end_time = metrics.get("end_time")
+        if run_time is None and start_time is not None and end_time is not None:
+            run_time = end_time - start_time
+        self.history.append({
+            "timestamp": time.time(),
+            "replicas": metrics.get("current_replicas"),
+            "target_replicas": target_replica_count,
+            "rps": num_requests / run_time if run_time else 0,
+            # locust doesn't count failed requests in num_requests
+            "failure_rate": failure_ratio(num_requests, metrics.get("num_requests_fail", 0)),
+            "latencies": results
+        })
+
+    def __bound(self, target_replica_count):
+        scaling_config = self.__scaling_config()
+        min_replicas = scaling_config.get("minReplicas")
+        max_replicas = scaling_config.get("maxReplicas")
+        if min_replicas is not None:
+            target_replica_count = max(target_replica_count, int(min_replicas))
+        if max_replicas is not None:
+            target_replica_count = min(target_replica_count, int(max_replicas))
+        return target_replica_count
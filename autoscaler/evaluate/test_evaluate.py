@@ -14,6 +14,9 @@
 
 import pytest
 from .evaluate import Evaluate
+from plan.plan import Plan, TargetIndex, compile_targets
+from metric.metric import Metric
+from loadtest.loadtest import LocustLoadTest
 
 class FakeDecayHandler:
     def __init__(self, get_reactor, update_reactor):
@@ -307,14 +310,1272 @@ def test_metric_get(subtests):
                 }
             },
         },
+        {
+            "description": "Unknown scaling mode",
+            "expected_exception": Exception("Unknown scaling mode: invalid"),
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "invalid"
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 10
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Proportional, worst target 3x over, scale to 3x replicas",
+            "expected": 6,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "proportional"
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 10
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 30
+                    }
+                }
+            },
+        },
+        {
+            "description": "Proportional, slightly over target, scale up by at least 1",
+            "expected": 11,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "proportional"
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 10,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 5.1
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Proportional, all under target, no decay",
+            "expected": 4,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "proportional"
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 4,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Proportional, limited by max step",
+            "expected": 4,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "proportional",
+                    "maxStep": 2
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 25
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Proportional, limited by max replicas",
+            "expected": 5,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "mode": "proportional",
+                    "maxReplicas": 5
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 25
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Step, decay limited by min replicas",
+            "expected": 2,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 4}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    },
+                    {
+                        "method": "POST",
+                        "endpoint": "/test2",
+                        "type": "max",
+                        "target": 10
+                    },
+                ],
+                "decay": {
+                    "replicas": 2,
+                    "unchangedRuns": 4,
+                },
+                "scaling": {
+                    "minReplicas": 2
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 3,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 5
+                    }
+                }
+            },
+        },
+        {
+            "description": "Invalid percentile target",
+            "expected_exception": Exception("Unknown target type: p101"),
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "p101",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 3,
+                        "response_time_histogram": [[1, 50], [2, 40], [10, 9], [100, 1]]
+                    }
+                }
+            },
+        },
+        {
+            "description": "Percentile target without distribution",
+            "expected_exception": Exception("No response time distribution for target: GET_/test"),
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "p95",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 3
+                    }
+                }
+            },
+        },
+        {
+            "description": "p50 under target, no scaling",
+            "expected": 2,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "p50",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 3,
+                        "response_time_histogram": [[1, 50], [2, 40], [10, 9], [100, 1]]
+                    }
+                }
+            },
+        },
+        {
+            "description": "p95 over target, scale up",
+            "expected": 3,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "p95",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 3,
+                        "response_time_histogram": [[1, 50], [2, 40], [10, 9], [100, 1]]
+                    }
+                }
+            },
+        },
+        {
+            "description": "p99.9 over target, scale up",
+            "expected": 3,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "p99.9",
+                        "target": 50
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 3,
+                        "response_time_histogram": [[1, 50], [2, 40], [10, 9], [100, 1]]
+                    }
+                }
+            },
+        },
+        {
+            "description": "Unsupported metric payload version",
+            "expected_exception": Exception("Unsupported metric payload version: 2"),
+            "decay_handler": None,
+            "eval_config": {
+                "targets": []
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "version": 2,
+                "current_replicas": 2,
+                "requests": {}
+            },
+        },
+        {
+            "description": "Projected metric payload, over target, scale up",
+            "expected": 3,
+            "decay_handler": FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+            "eval_config": {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            },
+            "run_type": "autoscaler",
+            "metrics": {
+                "version": 1,
+                "current_replicas": 2,
+                "run_time": 5.5,
+                "stopped_early": True,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 6
+                    }
+                }
+            },
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            evaluator = Evaluate(test_case["decay_handler"], test_case["eval_config"], test_case["run_type"])
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    evaluator.get(test_case["metrics"])
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == evaluator.get(test_case["metrics"])
+
+def test_evaluate_compiled_targets():
+    # compiled targets are used in place of compiling the config's targets
+    index = TargetIndex(compile_targets([{"method": "GET", "endpoint": "/test", "type": "max", "target": 5}]))
+    eval_config = {
+        "targets": [{"method": "GET", "endpoint": "/test", "type": "invalid", "target": 5}],
+        "decay": {"replicas": 1, "unchangedRuns": 3}
+    }
+    evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+                         eval_config, "autoscaler", index=index)
+    assert evaluator.get({"current_replicas": 2, "requests": {"GET_/test": {"max_response_time": 6}}}) == 3
+
+def test_evaluate_pattern_target():
+    # requests matching a pattern target are aggregated, weighted by request count, a mean of 5 rather than
+    # the unweighted 6, and unmatched requests left out
+    eval_config = {
+        "targets": [{"method": "GET", "endpoint": "/users/[0-9]*", "match": "glob", "type": "mean", "target": 5.5}],
+        "decay": {"replicas": 1, "unchangedRuns": 3}
+    }
+    evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+                         eval_config, "autoscaler")
+    assert evaluator.get({"current_replicas": 2, "requests": {
+        "GET_/users/1": {"num_requests": 3, "avg_response_time": 4},
+        "GET_/users/2": {"num_requests": 1, "avg_response_time": 8},
+        "GET_/health": {"num_requests": 100, "avg_response_time": 100}
+    }}) == 2
+
+def test_evaluate_projected_pattern_target(subtests):
+    # the metric stage aggregates pattern targets under their names, evaluate reads them without matching again
+    test_cases = [
+        {
+            "description": "Pattern and exact targets both under target, not double counted",
+            "expected": 2,
+            "requests_target": 25
+        },
+        {
+            "description": "Pattern target over target, scale up",
+            "expected": 3,
+            "requests_target": 15
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            plan = Plan({
+                "targets": [
+                    {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "requests",
+                     "target": test_case["requests_target"], "breach": "above"},
+                    {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "mean", "target": 7},
+                    {"method": "GET", "endpoint": "/users/1", "type": "max", "target": 100}
+                ],
+                "decay": {"replicas": 1, "unchangedRuns": 3}
+            })
+            load_test = LocustLoadTest(FakeInvokustLoadTest({
+                "requests": {
+                    "GET_/users/1": {"num_requests": 10, "avg_response_time": 4, "max_response_time": 4},
+                    "GET_/users/2": {"num_requests": 10, "avg_response_time": 8, "max_response_time": 8}
+                },
+                "failures": {}
+            }))
+            payload = Metric(load_test, index=plan.index).get({"spec": {"replicas": 2}})
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+                                 plan.config, "autoscaler", None, plan.index)
+            assert test_case["expected"] == evaluator.get(payload)
+
+def test_evaluate_window_target(subtests):
+    test_cases = [
+        {
+            "description": "No time series for window target",
+            "expected_exception": Exception("No time series for target: GET_/test"),
+            "metrics": {"current_replicas": 2, "requests": {"GET_/test": {"avg_response_time": 1}}}
+        },
+        {
+            "description": "No requests in the time series",
+            "expected_exception": Exception("No results for target: GET_/test"),
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {},
+                "time_series": {"elapsed": [1, 2], "requests": {}}
+            }
+        },
+        {
+            "description": "Worst window over target, though overall mean under, scale up",
+            "expected": 3,
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {"GET_/test": {"avg_response_time": 4}},
+                "time_series": {
+                    "elapsed": [1, 2, 3, 4],
+                    "requests": {
+                        "GET_/test": {
+                            "num_requests": [10, 10, 10, 10],
+                            "avg_response_time": [1, 1, 1, 13]
+                        }
+                    }
+                }
+            }
+        },
     ]
 
     for i, test_case in enumerate(test_cases):
         with subtests.test(msg=test_case["description"], i=i):
-            evaluator = Evaluate(test_case["decay_handler"], test_case["eval_config"], test_case["run_type"])
+            eval_config = {
+                "targets": [{"method": "GET", "endpoint": "/test", "type": "mean", "target": 5,
+                             "window": {"seconds": 1}}],
+                "decay": {"replicas": 1, "unchangedRuns": 3}
+            }
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+                                 eval_config, "autoscaler")
             if "expected_exception" in test_case.keys():
                 with pytest.raises(type(test_case["expected_exception"])) as ex:
                     evaluator.get(test_case["metrics"])
                 assert str(ex.value) == str(test_case["expected_exception"])
             else:
                 assert test_case["expected"] == evaluator.get(test_case["metrics"])
+
+class FakeHistory:
+    def __init__(self, entries=None):
+        self.entries = [] if entries is None else entries
+
+    def append(self, entry):
+        self.entries.append(entry)
+
+    def latest(self, count):
+        return self.entries[-count:]
+
+def test_evaluate_record_history(subtests):
+    test_cases = [
+        {
+            "description": "Dry run, not recorded",
+            "expected": [],
+            "run_type": "api_dry_run",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 6
+                    }
+                }
+            }
+        },
+        {
+            "description": "Recorded, no request counts",
+            "expected": [
+                {
+                    "replicas": 2,
+                    "target_replicas": 3,
+                    "rps": 0,
+                    "failure_rate": 0,
+                    "latencies": [6]
+                }
+            ],
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 6
+                    }
+                }
+            }
+        },
+        {
+            "description": "Recorded, rps from run time",
+            "expected": [
+                {
+                    "replicas": 2,
+                    "target_replicas": 2,
+                    "rps": 20,
+                    "failure_rate": 0.2,
+                    "latencies": [4]
+                }
+            ],
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "num_requests": 200,
+                "num_requests_fail": 50,
+                "run_time": 10,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    }
+                }
+            }
+        },
+        {
+            "description": "Recorded, every request failed",
+            "expected": [
+                {
+                    "replicas": 2,
+                    "target_replicas": 2,
+                    "rps": 0,
+                    "failure_rate": 1,
+                    "latencies": [4]
+                }
+            ],
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "num_requests": 0,
+                "num_requests_fail": 50,
+                "run_time": 10,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    }
+                }
+            }
+        },
+        {
+            "description": "Recorded, rps from start and end time",
+            "expected": [
+                {
+                    "replicas": 2,
+                    "target_replicas": 2,
+                    "rps": 10,
+                    "failure_rate": 0,
+                    "latencies": [4]
+                }
+            ],
+            "run_type": "autoscaler",
+            "metrics": {
+                "current_replicas": 2,
+                "num_requests": 200,
+                "num_requests_fail": 0,
+                "start_time": 100,
+                "end_time": 120,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    }
+                }
+            }
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            history = FakeHistory()
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None), {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                }
+            }, test_case["run_type"], history)
+            evaluator.get(test_case["metrics"])
+            for entry in history.entries:
+                assert entry.pop("timestamp") > 0
+            assert test_case["expected"] == history.entries
+
+def test_evaluate_predictive(subtests):
+    test_cases = [
+        {
+            "description": "Predictive without history",
+            "expected_exception": Exception("Predictive scaling requires history to be enabled"),
+            "history": None,
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Rising trend under target, pre-scale",
+            "expected": 3,
+            "history": FakeHistory([
+                {"latencies": [5], "replicas": 2},
+                {"latencies": [6], "replicas": 2}
+            ]),
+            "scaling": {},
+            "latency": 7
+        },
+        {
+            "description": "Steep rising trend, pre-scale limited by max step",
+            "expected": 3,
+            "history": FakeHistory([
+                {"latencies": [1], "replicas": 2},
+                {"latencies": [4], "replicas": 2}
+            ]),
+            "scaling": {"maxStep": 1},
+            "latency": 7
+        },
+        {
+            "description": "Flat trend under target, no scaling",
+            "expected": 2,
+            "history": FakeHistory([
+                {"latencies": [5], "replicas": 2},
+                {"latencies": [5], "replicas": 2}
+            ]),
+            "scaling": {},
+            "latency": 5
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None), {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 7.5
+                    }
+                ],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 4,
+                },
+                "scaling": test_case["scaling"],
+                "predictive": {
+                    "method": "linear"
+                }
+            }, "autoscaler", test_case["history"])
+            metrics = {
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": test_case["latency"]
+                    }
+                }
+            }
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    evaluator.get(metrics)
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == evaluator.get(metrics)
+
+def test_evaluate_headroom_decay(subtests):
+    test_cases = [
+        {
+            "description": "Not enough unchanged runs, no decay, breaches aged",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 2, "breaches": [[6, 2]]},
+            "decay_info": {"runs_since_change": 1, "breaches": [[6, 1]]},
+            "decay": {},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Plenty of headroom, bisect down to the lowest possible count",
+            "expected": 5,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3},
+            "decay": {},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Plenty of headroom, bisect down to a count above a remembered breach",
+            "expected": 8,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": [[6, 5]]},
+            "decay_info": {"runs_since_change": 3, "breaches": [[6, 4]]},
+            "decay": {},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Close to target, probe one replica lower",
+            "expected": 9,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3},
+            "decay": {},
+            "scaling": {},
+            "latency": 9
+        },
+        {
+            "description": "Custom headroom, bisect",
+            "expected": 5,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3},
+            "decay": {"headroom": 0.95},
+            "scaling": {},
+            "latency": 9
+        },
+        {
+            "description": "Count below breached, no decay",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 4, "breaches": [[9, 1]]},
+            "decay_info": {"runs_since_change": 3, "breaches": [[9, 0]]},
+            "decay": {},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Breach forgotten after breach memory runs, bisect",
+            "expected": 5,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3, "breaches": [[9, 9]]},
+            "decay": {"breachMemory": 10},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Targets met, breaches at or above current count out of date",
+            "expected": 8,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": [[6, 1]]},
+            "decay_info": {"runs_since_change": 3, "breaches": [[12, 0], [10, 0], [6, 0]]},
+            "decay": {},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Bisect within max step",
+            "expected": 8,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3},
+            "decay": {"maxStep": 2},
+            "scaling": {},
+            "latency": 5
+        },
+        {
+            "description": "Bisect down to min replicas",
+            "expected": 7,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": []},
+            "decay_info": {"runs_since_change": 3},
+            "decay": {},
+            "scaling": {"minReplicas": 4},
+            "latency": 5
+        },
+        {
+            "description": "Breached, scale up and remember the breach",
+            "expected": 11,
+            "expected_decay_info": {"runs_since_change": 0, "breaches": [[6, 3], [10, 0]]},
+            "decay_info": {"runs_since_change": 3, "breaches": [[10, 7], [6, 2]]},
+            "decay": {},
+            "scaling": {},
+            "latency": 12
+        },
+        {
+            "description": "Dry run, decay without updating decay info",
+            "expected": 5,
+            "expected_decay_info": None,
+            "decay_info": {"runs_since_change": 3},
+            "decay": {},
+            "scaling": {},
+            "latency": 5,
+            "run_type": "api_dry_run"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            updated = []
+            evaluator = Evaluate(FakeDecayHandler(lambda: dict(test_case["decay_info"]), updated.append), {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 10
+                    }
+                ],
+                "decay": dict({"mode": "headroom", "unchangedRuns": 3}, **test_case["decay"]),
+                "scaling": test_case["scaling"]
+            }, test_case.get("run_type", "autoscaler"))
+            assert test_case["expected"] == evaluator.get({
+                "current_replicas": 10,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": test_case["latency"]
+                    }
+                }
+            })
+            assert ([] if test_case["expected_decay_info"] is None else [test_case["expected_decay_info"]]) == updated
+
+def test_evaluate_stabilization(subtests):
+    test_cases = [
+        {
+            "description": "Within upper band, hold, no decay, breach not counted",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 4, "consecutive_breaches": 0},
+            "decay_info": {"runs_since_change": 3, "consecutive_breaches": 1},
+            "stabilization": {"upperBand": 1.2},
+            "latency": 11
+        },
+        {
+            "description": "Over upper band, scale up",
+            "expected": 13,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 1, "runs_since_scale_up": 0},
+            "decay_info": {"runs_since_change": 3},
+            "stabilization": {"upperBand": 1.2},
+            "latency": 13
+        },
+        {
+            "description": "First breach, held until consecutive breaches reached, runs since change reset",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 1},
+            "decay_info": {"runs_since_change": 3},
+            "stabilization": {"consecutiveBreaches": 2},
+            "latency": 13
+        },
+        {
+            "description": "Consecutive breaches reached, scale up",
+            "expected": 13,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 2, "runs_since_scale_up": 0},
+            "decay_info": {"runs_since_change": 4, "consecutive_breaches": 1},
+            "stabilization": {"consecutiveBreaches": 2},
+            "latency": 13
+        },
+        {
+            "description": "Breach within scale up cool-down, held, runs since change reset",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 2, "runs_since_scale_up": 1},
+            "decay_info": {"runs_since_change": 0, "consecutive_breaches": 1, "runs_since_scale_up": 0},
+            "stabilization": {"scaleUpCooldownRuns": 2},
+            "latency": 13
+        },
+        {
+            "description": "Breach after scale up cool-down, scale up",
+            "expected": 13,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 3, "runs_since_scale_up": 0},
+            "decay_info": {"runs_since_change": 1, "consecutive_breaches": 2, "runs_since_scale_up": 2},
+            "stabilization": {"scaleUpCooldownRuns": 2},
+            "latency": 13
+        },
+        {
+            "description": "Targets met within scale down cool-down, no decay",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 4, "consecutive_breaches": 0, "runs_since_scale_up": 4},
+            "decay_info": {"runs_since_change": 3, "runs_since_scale_up": 3},
+            "stabilization": {"scaleDownCooldownRuns": 5},
+            "latency": 5
+        },
+        {
+            "description": "Targets met after scale down cool-down, decay",
+            "expected": 9,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 0, "runs_since_scale_up": 6},
+            "decay_info": {"runs_since_change": 3, "runs_since_scale_up": 5},
+            "stabilization": {"scaleDownCooldownRuns": 5},
+            "latency": 5
+        },
+        {
+            "description": "Targets met within lower band, no decay",
+            "expected": 10,
+            "expected_decay_info": {"runs_since_change": 4, "consecutive_breaches": 0},
+            "decay_info": {"runs_since_change": 3},
+            "stabilization": {"lowerBand": 0.8},
+            "latency": 9
+        },
+        {
+            "description": "Targets met under lower band, decay",
+            "expected": 9,
+            "expected_decay_info": {"runs_since_change": 0, "consecutive_breaches": 0},
+            "decay_info": {"runs_since_change": 3},
+            "stabilization": {"lowerBand": 0.8},
+            "latency": 7
+        },
+        {
+            "description": "Dry run, held without updating decay info",
+            "expected": 10,
+            "expected_decay_info": None,
+            "decay_info": {"runs_since_change": 3},
+            "stabilization": {"consecutiveBreaches": 2},
+            "latency": 13,
+            "run_type": "api_dry_run"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            updated = []
+            evaluator = Evaluate(FakeDecayHandler(lambda: dict(test_case["decay_info"]), updated.append), {
+                "targets": [
+                    {
+                        "method": "GET",
+                        "endpoint": "/test",
+                        "type": "mean",
+                        "target": 10
+                    }
+                ],
+                "decay": {"replicas": 1, "unchangedRuns": 3},
+                "scaling": {"mode": "proportional", "maxStep": 5},
+                "stabilization": test_case["stabilization"]
+            }, test_case.get("run_type", "autoscaler"))
+            assert test_case["expected"] == evaluator.get({
+                "current_replicas": 10,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": test_case["latency"]
+                    }
+                }
+            })
+            assert ([] if test_case["expected_decay_info"] is None else [test_case["expected_decay_info"]]) == updated
+
+class FakeInvokustLoadTest:
+    def __init__(self, stats):
+        self.statistics = stats
+
+    def run(self):
+        pass
+
+    def stats(self):
+        return self.statistics
+
+def invokust_stats(num_requests, avg_response_time, min_response_time, total_rps, failures=0):
+    # the shape invokust reports, with failures only reported by error
+    return {
+        "requests": {
+            "GET_/test": {
+                "request_type": "GET",
+                "num_requests": num_requests,
+                "min_response_time": min_response_time,
+                "median_response_time": avg_response_time,
+                "avg_response_time": avg_response_time,
+                "max_response_time": avg_response_time,
+                "response_times": {avg_response_time: num_requests},
+                "response_time_percentiles": {95: avg_response_time},
+                "total_rps": total_rps,
+                "total_rpm": total_rps * 60
+            }
+        },
+        "failures": {} if failures == 0 else {
+            "GET_/test": {"method": "GET", "name": "/test", "error": "ConnectionError()", "occurrences": failures}
+        },
+        "num_requests": num_requests,
+        "num_requests_fail": failures
+    }
+
+def test_evaluate_stabilization_held_breaches_no_decay():
+    # breaches held back by stabilization don't count as runs without change, a quiet run straight after
+    # them doesn't decay
+    decay_info = {"runs_since_change": 0}
+
+    def update(updated):
+        decay_info.clear()
+        decay_info.update(updated)
+
+    evaluator = Evaluate(FakeDecayHandler(lambda: dict(decay_info), update), {
+        "targets": [{"method": "GET", "endpoint": "/test", "type": "mean", "target": 10}],
+        "decay": {"replicas": 1, "unchangedRuns": 3},
+        "stabilization": {"consecutiveBreaches": 10}
+    }, "autoscaler")
+    replicas = [evaluator.get({"current_replicas": 5, "requests": {"GET_/test": {"avg_response_time": latency}}})
+                for latency in [15, 15, 15, 15, 5]]
+    assert [5, 5, 5, 5, 5] == replicas
+    assert 1 == decay_info["runs_since_change"]
+
+def test_evaluate_throughput_targets(subtests):
+    test_cases = [
+        {
+            "description": "Failure ratio over target, latency met, step up",
+            "expected": 5,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 100},
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05}
+            ],
+            "scaling": {},
+            "stats": invokust_stats(80, 10, 10, 8, failures=20)
+        },
+        {
+            "description": "Failure ratio under target, latency met, no scaling",
+            "expected": 4,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 100},
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05}
+            ],
+            "scaling": {},
+            "stats": invokust_stats(99, 10, 10, 8, failures=1)
+        },
+        {
+            "description": "Request rate under target, proportional scale up",
+            "expected": 8,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "rps", "target": 100}
+            ],
+            "scaling": {"mode": "proportional"},
+            "stats": invokust_stats(500, 10, 10, 50)
+        },
+        {
+            "description": "Weighted breach, proportional scale up further",
+            "expected": 12,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "rps", "target": 100, "weight": 2}
+            ],
+            "scaling": {"mode": "proportional"},
+            "stats": invokust_stats(500, 10, 10, 50)
+        },
+        {
+            "description": "Zero weight breach, no scaling",
+            "expected": 4,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 100},
+                {"method": "GET", "endpoint": "/test", "type": "failures", "target": 0, "weight": 0}
+            ],
+            "scaling": {},
+            "stats": invokust_stats(80, 10, 10, 8, failures=20)
+        },
+        {
+            "description": "Latency breached below target, step up",
+            "expected": 5,
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "min", "target": 2, "breach": "below"}
+            ],
+            "scaling": {},
+            "stats": invokust_stats(80, 10, 1, 8)
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            plan = Plan({
+                "targets": test_case["targets"],
+                "decay": {
+                    "replicas": 1,
+                    "unchangedRuns": 3
+                },
+                "scaling": test_case["scaling"]
+            })
+            # gather the payload from locust stats as the metric stage does
+            load_test = LocustLoadTest(FakeInvokustLoadTest(test_case["stats"]))
+            payload = Metric(load_test, index=plan.index).get({"spec": {"replicas": 4}})
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None),
+                                 plan.config, "autoscaler", None, plan.index)
+            assert test_case["expected"] == evaluator.get(payload)
+
+def test_evaluate_zero_weight_target_decay(subtests):
+    test_cases = [
+        {
+            "description": "Headroom decay bisects, zero weight target breached",
+            "expected": 5,
+            "decay": {"mode": "headroom", "unchangedRuns": 3},
+            "stabilization": None
+        },
+        {
+            "description": "Decay under the lower band, zero weight target breached",
+            "expected": 9,
+            "decay": {"replicas": 1, "unchangedRuns": 3},
+            "stabilization": {"lowerBand": 0.8}
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            eval_config = {
+                "targets": [
+                    {"method": "GET", "endpoint": "/test", "type": "mean", "target": 10},
+                    {"method": "GET", "endpoint": "/test", "type": "max", "target": 10, "weight": 0}
+                ],
+                "decay": test_case["decay"]
+            }
+            if test_case["stabilization"] is not None:
+                eval_config["stabilization"] = test_case["stabilization"]
+            evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 3}, lambda decay_info: None),
+                                 eval_config, "autoscaler")
+            assert test_case["expected"] == evaluator.get({
+                "current_replicas": 10,
+                "requests": {
+                    "GET_/test": {"avg_response_time": 5, "max_response_time": 50}
+                }
+            })
+
+def test_evaluate_predictive_throughput_target():
+    # request rate targets aren't forecast, latency targets alongside them still are
+    history = FakeHistory([
+        {"replicas": 2, "latencies": [4, 100]},
+        {"replicas": 2, "latencies": [6, 100]}
+    ])
+    evaluator = Evaluate(FakeDecayHandler(lambda: {"runs_since_change": 0}, lambda decay_info: None), {
+        "targets": [
+            {"method": "GET", "endpoint": "/test", "type": "mean", "target": 7.5},
+            {"method": "GET", "endpoint": "/test", "type": "rps", "target": 50}
+        ],
+        "decay": {
+            "replicas": 1,
+            "unchangedRuns": 4
+        },
+        "predictive": {
+            "method": "linear"
+        }
+    }, "autoscaler", history)
+    assert 3 == evaluator.get({
+        "current_replicas": 2,
+        "requests": {
+            "GET_/test": {
+                "avg_response_time": 7,
+                "total_rps": 100
+            }
+        }
+    })
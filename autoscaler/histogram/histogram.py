@@ -0,0 +1,94 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Histogram handles response time distributions, stored compactly as a list of
+[response_time, count] pairs sorted by response time
+"""
+
+def round_response_time(response_time):
+    """
+    round_response_time rounds a response time in milliseconds the way locust
+    does when recording it, keeping the number of distinct response times
+    recorded bounded
+    """
+    if response_time < 100:
+        return int(round(response_time))
+    if response_time < 1000:
+        return int(round(response_time, -1))
+    if response_time < 10000:
+        return int(round(response_time, -2))
+    return int(round(response_time, -3))
+
+def from_response_times(response_times):
+    """
+    from_response_times converts a locust response times dict, mapping
+    rounded response time to number of requests, into a compact histogram
+    """
+    counts = {}
+    for response_time, requests in response_times.items():
+        # keys are strings once the dict has been through JSON
+        response_time = int(response_time)
+        counts[response_time] = counts.get(response_time, 0) + requests
+    return [[response_time, counts[response_time]] for response_time in sorted(counts)]
+
+def merge(histograms):
+    """
+    merge combines histograms into a single histogram
+    """
+    counts = {}
+    for histogram in histograms:
+        for response_time, bucket_count in histogram:
+            counts[response_time] = counts.get(response_time, 0) + bucket_count
+    return [[response_time, counts[response_time]] for response_time in sorted(counts)]
+
+def count(histogram):
+    """
+    count returns the total number of requests in the histogram
+    """
+    return sum(bucket_count for _, bucket_count in histogram)
+
+def count_at_or_below(histogram, value):
+    """
+    count_at_or_below returns the number of requests with a response time at
+    or below the value provided
+    """
+    return sum(bucket_count for response_time, bucket_count in histogram if response_time <= value)
+
+def variance(histogram):
+    """
+    variance returns the population variance of the response times in the
+    histogram
+    """
+    total = count(histogram)
+    if total == 0:
+        return 0
+    mean = sum(response_time * bucket_count for response_time, bucket_count in histogram) / total
+    return sum(bucket_count * (response_time - mean) ** 2
+               for response_time, bucket_count in histogram) / total
+
+def percentile(histogram, percent):
+    """
+    percentile returns the response time at the percentile provided (0-100),
+    calculated the same way locust calculates its response time percentiles
+    """
+    total = count(histogram)
+    if total == 0:
+        return 0
+    num_of_requests = int(total * percent / 100)
+    processed_count = 0
+    for response_time, bucket_count in reversed(histogram):
+        processed_count += bucket_count
+        if total - processed_count <= num_of_requests:
+            return response_time
+    return histogram[0][0]
@@ -0,0 +1,187 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .histogram import from_response_times, merge, percentile, count_at_or_below, variance, round_response_time
+
+def test_from_response_times(subtests):
+    test_cases = [
+        {
+            "description": "Empty response times",
+            "expected": [],
+            "response_times": {}
+        },
+        {
+            "description": "Unsorted response times, sorted histogram",
+            "expected": [[2, 5], [10, 1], [110, 3]],
+            "response_times": {110: 3, 2: 5, 10: 1}
+        },
+        {
+            "description": "String keys from JSON",
+            "expected": [[2, 5], [10, 1], [110, 3]],
+            "response_times": {"110": 3, "2": 5, "10": 1}
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == from_response_times(test_case["response_times"])
+
+def test_merge(subtests):
+    test_cases = [
+        {
+            "description": "No histograms",
+            "expected": [],
+            "histograms": []
+        },
+        {
+            "description": "Overlapping histograms",
+            "expected": [[1, 3], [2, 5], [10, 1], [50, 2]],
+            "histograms": [[[1, 1], [2, 5]], [[1, 2], [10, 1]], [[50, 2]]]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == merge(test_case["histograms"])
+
+def test_percentile(subtests):
+    histogram = [[1, 50], [2, 40], [10, 9], [100, 1]]
+    test_cases = [
+        {
+            "description": "Empty histogram",
+            "expected": 0,
+            "histogram": [],
+            "percent": 95
+        },
+        {
+            "description": "Median, boundary rounds up to next bucket as locust does",
+            "expected": 2,
+            "histogram": histogram,
+            "percent": 50
+        },
+        {
+            "description": "p90",
+            "expected": 10,
+            "histogram": histogram,
+            "percent": 90
+        },
+        {
+            "description": "p95",
+            "expected": 10,
+            "histogram": histogram,
+            "percent": 95
+        },
+        {
+            "description": "p30",
+            "expected": 1,
+            "histogram": histogram,
+            "percent": 30
+        },
+        {
+            "description": "p99.9",
+            "expected": 100,
+            "histogram": histogram,
+            "percent": 99.9
+        },
+        {
+            "description": "p100 is max",
+            "expected": 100,
+            "histogram": histogram,
+            "percent": 100
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == percentile(test_case["histogram"], test_case["percent"])
+
+def test_count_at_or_below(subtests):
+    histogram = [[1, 50], [2, 40], [10, 9], [100, 1]]
+    test_cases = [
+        {
+            "description": "Below all",
+            "expected": 0,
+            "value": 0
+        },
+        {
+            "description": "At bucket",
+            "expected": 90,
+            "value": 2
+        },
+        {
+            "description": "Between buckets",
+            "expected": 99,
+            "value": 50
+        },
+        {
+            "description": "Above all",
+            "expected": 100,
+            "value": 1000
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == count_at_or_below(histogram, test_case["value"])
+
+def test_variance(subtests):
+    test_cases = [
+        {
+            "description": "Empty histogram",
+            "expected": 0,
+            "histogram": []
+        },
+        {
+            "description": "Single value",
+            "expected": 0,
+            "histogram": [[5, 10]]
+        },
+        {
+            "description": "Spread values",
+            "expected": 4,
+            "histogram": [[2, 1], [4, 3], [5, 2], [7, 1], [9, 1]]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == variance(test_case["histogram"])
+
+def test_round_response_time(subtests):
+    test_cases = [
+        {
+            "description": "Under 100ms, rounded to the millisecond",
+            "expected": 43,
+            "response_time": 42.6
+        },
+        {
+            "description": "Under 1s, rounded to 10ms",
+            "expected": 440,
+            "response_time": 436
+        },
+        {
+            "description": "Under 10s, rounded to 100ms",
+            "expected": 4400,
+            "response_time": 4351
+        },
+        {
+            "description": "10s and over, rounded to the second",
+            "expected": 44000,
+            "response_time": 43600
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == round_response_time(test_case["response_time"])
@@ -0,0 +1,150 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+History handles recording the results of recent load tests in a fixed size,
+memory mapped ring buffer file, so any entry can be read without parsing the
+rest of the history and the file never grows
+"""
+import os
+import mmap
+import zlib
+import struct
+from state.state import replace_file
+
+DEFAULT_HISTORY_SIZE = 100
+
+MAGIC = b"LPAH"
+VERSION = 1
+
+# magic, version, capacity, target count, next sequence number
+HEADER = struct.Struct("<4sIIIQ")
+# sequence number, timestamp, replicas, target replicas, rps, failure rate,
+# followed by a latency per target and a checksum
+ENTRY_PREFIX = "<Qdiidd"
+
+class History: # pylint: disable=too-many-instance-attributes
+    """
+    History abstracts a ring buffer of load test results, holding the most
+    recent entries up to its capacity. Each entry is checksummed, so an entry
+    torn by a crash mid-write is skipped rather than read back as garbage
+    """
+    def __init__(self, path, capacity, target_count):
+        self.path = path
+        self.capacity = int(capacity)
+        self.target_count = int(target_count)
+        if self.capacity < 1:
+            raise Exception(f"Invalid history size: {capacity}")
+        self.entry = struct.Struct(f"{ENTRY_PREFIX}{self.target_count}d")
+        self.entry_size = self.entry.size + 4
+        self.size = HEADER.size + self.capacity * self.entry_size
+
+        if not self.__compatible():
+            self.__create()
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def close(self):
+        """
+        close unmaps and closes the history file
+        """
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return min(self.__next_sequence(), self.capacity)
+
+    def append(self, entry):
+        """
+        append adds an entry to the history, overwriting the oldest entry if
+        the history is full
+        """
+        latencies = [float(latency) for latency in entry["latencies"]]
+        if len(latencies) != self.target_count:
+            raise Exception(f"History entry has {len(latencies)} latencies, "
+                            f"expected {self.target_count}")
+        sequence = self.__next_sequence()
+        data = self.entry.pack(sequence, entry["timestamp"], entry["replicas"],
+                               entry["target_replicas"], entry["rps"], entry["failure_rate"],
+                               *latencies)
+        offset = self.__offset(sequence)
+        self.map[offset:offset + self.entry_size] = data + struct.pack("<I", zlib.crc32(data))
+        self.map.flush()
+        # only count the entry once it has been written in full
+        self.map[HEADER.size - 8:HEADER.size] = struct.pack("<Q", sequence + 1)
+        self.map.flush()
+
+    def get(self, index):
+        """
+        get returns the entry at the index provided, 0 being the oldest held
+        entry and negative indexes counting back from the newest, or None if
+        the entry is corrupted
+        """
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("History index out of range")
+        sequence = self.__next_sequence() - length + index
+        offset = self.__offset(sequence)
+        data = self.map[offset:offset + self.entry.size]
+        checksum, = struct.unpack_from("<I", self.map, offset + self.entry.size)
+        if zlib.crc32(data) != checksum:
+            return None
+        values = self.entry.unpack(data)
+        if values[0] != sequence:
+            return None
+        return {
+            "timestamp": values[1],
+            "replicas": values[2],
+            "target_replicas": values[3],
+            "rps": values[4],
+            "failure_rate": values[5],
+            "latencies": list(values[6:])
+        }
+
+    def latest(self, count):
+        """
+        latest returns up to the count provided of the newest entries, oldest
+        first, skipping any corrupted entries
+        """
+        length = len(self)
+        entries = [self.get(index) for index in range(max(0, length - count), length)]
+        return [entry for entry in entries if entry is not None]
+
+    def __offset(self, sequence):
+        return HEADER.size + (sequence % self.capacity) * self.entry_size
+
+    def __next_sequence(self):
+        return HEADER.unpack_from(self.map)[4]
+
+    def __compatible(self):
+        # a history with a different layout is started afresh
+        try:
+            with open(self.path, "rb") as history_file:
+                header = history_file.read(HEADER.size)
+                history_file.seek(0, os.SEEK_END)
+                size = history_file.tell()
+        except FileNotFoundError:
+            return False
+        if len(header) != HEADER.size or size != self.size:
+            return False
+        magic, version, capacity, target_count, _ = HEADER.unpack(header)
+        return ((magic, version, capacity, target_count)
+                == (MAGIC, VERSION, self.capacity, self.target_count))
+
+    def __create(self):
+        def write(history_file):
+            history_file.write(HEADER.pack(MAGIC, VERSION, self.capacity, self.target_count, 0))
+            history_file.truncate(self.size)
+        replace_file(self.path, write, "wb", ".history-")
@@ -0,0 +1,111 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+from .history import History
+
+def entry(i, target_count=2):
+    return {
+        "timestamp": 1000.0 + i,
+        "replicas": i,
+        "target_replicas": i + 1,
+        "rps": 10.5,
+        "failure_rate": 0.25,
+        "latencies": [float(i)] * target_count
+    }
+
+def test_history_invalid(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Invalid size",
+            "expected_exception": Exception("Invalid history size: 0"),
+            "capacity": 0,
+            "entry": None
+        },
+        {
+            "description": "Wrong number of latencies",
+            "expected_exception": Exception("History entry has 1 latencies, expected 2"),
+            "capacity": 3,
+            "entry": entry(1, target_count=1)
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            with pytest.raises(type(test_case["expected_exception"])) as ex:
+                history = History(str(tmp_path / f"history_{i}.bin"), test_case["capacity"], 2)
+                history.append(test_case["entry"])
+            assert str(ex.value) == str(test_case["expected_exception"])
+
+def test_history_ring_buffer(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path, 3, 2)
+    assert len(history) == 0
+    assert history.latest(5) == []
+    with pytest.raises(IndexError):
+        history.get(0)
+
+    history.append(entry(1))
+    history.append(entry(2))
+    assert len(history) == 2
+    assert history.get(0) == entry(1)
+    assert history.get(-1) == entry(2)
+
+    # wrap around, oldest entries overwritten
+    history.append(entry(3))
+    history.append(entry(4))
+    history.append(entry(5))
+    assert len(history) == 3
+    assert history.latest(5) == [entry(3), entry(4), entry(5)]
+    assert history.latest(2) == [entry(4), entry(5)]
+    history.close()
+
+    # fixed size, never grows
+    size = os.path.getsize(path)
+    history = History(path, 3, 2)
+    assert history.latest(3) == [entry(3), entry(4), entry(5)]
+    history.append(entry(6))
+    history.close()
+    assert os.path.getsize(path) == size
+
+def test_history_corrupted_entry_skipped(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path, 3, 2)
+    history.append(entry(1))
+    history.append(entry(2))
+    history.close()
+
+    # tear the first entry
+    with open(path, "r+b") as history_file:
+        history_file.seek(30)
+        history_file.write(b"\xff\xff\xff\xff")
+
+    history = History(path, 3, 2)
+    assert history.get(0) is None
+    assert history.latest(3) == [entry(2)]
+    history.close()
+
+def test_history_layout_change_resets(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path, 3, 2)
+    history.append(entry(1))
+    history.close()
+
+    # number of targets changed, old entries can't be read with the new layout
+    history = History(path, 3, 1)
+    assert len(history) == 0
+    history.append(entry(1, target_count=1))
+    assert history.latest(3) == [entry(1, target_count=1)]
+    history.close()
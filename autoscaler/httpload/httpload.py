@@ -0,0 +1,379 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+HTTP load handles generating load straight from the targets of the
+evaluation config with asyncio, as a lighter alternative to running a
+locustfile, reporting stats in the same shape as locust
+"""
+import ssl
+import time
+import asyncio
+import threading
+import urllib.parse
+from histogram.histogram import from_response_times, percentile, round_response_time
+from loadtest.loadtest import SampledLoadTest, DEFAULT_TIMEOUT
+
+# percentiles reported for each request, as locust reports them
+PERCENTILES = [50, 66, 75, 80, 90, 95, 98, 99, 99.9, 99.99, 100]
+USER_AGENT = "locust-pod-autoscaler"
+# methods whose requests are sent with an empty body
+BODY_METHODS = ("POST", "PUT", "PATCH")
+
+def parse_host(host):
+    """
+    parse_host splits a host URL into its scheme, host name, port and base
+    path
+    """
+    if host is None:
+        raise ValueError("Native load engine requires a host")
+    url = urllib.parse.urlsplit(host)
+    if url.scheme not in ("http", "https") or not url.hostname:
+        raise ValueError(f"Invalid host: {host}")
+    port = url.port
+    if port is None:
+        port = 443 if url.scheme == "https" else 80
+    return url.scheme, url.hostname, port, url.path.rstrip("/")
+
+def load_requests(targets):
+    """
+    load_requests returns the distinct (method, endpoint) pairs of the
+    compiled targets provided to request, which must be exact endpoints
+    """
+    requests = []
+    for target in targets:
+        if target.pattern is not None:
+            raise Exception(f"Native load engine can't request pattern target: {target.name}")
+        if (target.method, target.endpoint) not in requests:
+            requests.append((target.method, target.endpoint))
+    if not requests:
+        raise Exception("Native load engine requires targets to request")
+    return requests
+
+async def read_response(reader, method):
+    """
+    read_response reads a response, discarding its body, returning its
+    status code and whether the connection can be reused
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    status = int(status)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    connection = headers.get("connection", "")
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        return status, keep_alive
+    if "chunked" in headers.get("transfer-encoding", ""):
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                # skip any trailers
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return status, keep_alive
+            await reader.readexactly(size + 2)
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+        return status, keep_alive
+    # body runs until the connection closes
+    await reader.read()
+    return status, False
+
+class RequestStats:
+    """
+    RequestStats abstracts the stats of a single request name, with response
+    times rounded as locust rounds them, so memory stays bounded however
+    many requests are made
+    """
+    def __init__(self, method):
+        self.method = method
+        self.num_requests = 0
+        self.num_failures = 0
+        self.total_response_time = 0
+        self.min_response_time = None
+        self.max_response_time = 0
+        self.response_times = {}
+
+    def record(self, response_time, failed):
+        """
+        record records a request that took the response time provided, in
+        milliseconds. As locust does, failed requests are only counted as
+        failures, not as requests or in the response times
+        """
+        if failed:
+            self.num_failures += 1
+            return
+        self.num_requests += 1
+        self.total_response_time += response_time
+        rounded = round_response_time(response_time)
+        self.response_times[rounded] = self.response_times.get(rounded, 0) + 1
+        if self.min_response_time is None or response_time < self.min_response_time:
+            self.min_response_time = response_time
+        self.max_response_time = max(self.max_response_time, response_time)
+
+    def to_dict(self, elapsed):
+        """
+        to_dict returns the stats in the shape locust reports them
+        """
+        histogram = from_response_times(self.response_times)
+        return {
+            "request_type": self.method,
+            "num_requests": self.num_requests,
+            "num_failures": self.num_failures,
+            "min_response_time": self.min_response_time,
+            "max_response_time": self.max_response_time,
+            "avg_response_time": (self.total_response_time / self.num_requests
+                                  if self.num_requests else 0),
+            "median_response_time": percentile(histogram, 50),
+            "response_times": dict(self.response_times),
+            "response_time_percentiles": {
+                percent: percentile(histogram, percent) for percent in PERCENTILES
+            },
+            "total_rps": self.num_requests / elapsed if elapsed > 0 else 0
+        }
+
+class ConnectionPool:
+    """
+    ConnectionPool abstracts keeping connections to a host open between
+    requests, reusing the most recently used idle connection first
+    """
+    def __init__(self, scheme, host, port, open_connection=asyncio.open_connection):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if scheme == "https" else None
+        self.open_connection = open_connection
+        self.idle = []
+
+    async def acquire(self):
+        """
+        acquire returns an idle connection, or opens a new one if there are
+        none
+        """
+        if self.idle:
+            return self.idle.pop()
+        return await self.open_connection(self.host, self.port, ssl=self.ssl)
+
+    def release(self, connection, reusable):
+        """
+        release returns a connection to the pool, closing it instead if it
+        can't be reused
+        """
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection[1].close()
+
+    def close(self):
+        """
+        close closes every idle connection
+        """
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+class NativeLoadTest: # pylint: disable=too-many-instance-attributes
+    """
+    NativeLoadTest abstracts generating load with asyncio, each user
+    requesting the requests provided in turn over a pooled keep-alive
+    connection, waiting the wait time between requests. Users are started
+    at the hatch rate, and the load test runs until the run time has passed
+    or it is stopped. Stats can be taken and the load test stopped from
+    another thread while it runs
+    """
+    def __init__(self, requests, host, users, # pylint: disable=too-many-arguments
+                 hatch_rate, run_time=None, wait_time=0, timeout=DEFAULT_TIMEOUT, clock=time.time,
+                 open_connection=asyncio.open_connection):
+        self.requests = requests
+        self.scheme, self.host, self.port, self.base_path = parse_host(host)
+        self.users = users
+        self.hatch_rate = hatch_rate
+        self.run_time = run_time
+        self.wait_time = wait_time
+        self.timeout = timeout
+        self.clock = clock
+        self.open_connection = open_connection
+        self.lock = threading.Lock()
+        self.loop = None
+        self.stopping = None
+        self.stopped = False
+        self.request_stats = {}
+        self.failures = {}
+        self.start_time = None
+        self.end_time = None
+
+    def run(self):
+        """
+        run runs the load test until it finishes or is stopped
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.__run(loop))
+        finally:
+            loop.close()
+
+    def stop(self):
+        """
+        stop stops the load test, safe to call from any thread
+        """
+        with self.lock:
+            self.stopped = True
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def stats(self):
+        """
+        stats returns the stats gathered so far, in the shape locust reports
+        them
+        """
+        with self.lock:
+            end_time = self.clock() if self.end_time is None else self.end_time
+            elapsed = end_time - self.start_time if self.start_time is not None else 0
+            request_stats = self.request_stats.values()
+            return {
+                "requests": {
+                    name: stats.to_dict(elapsed) for name, stats in self.request_stats.items()
+                },
+                "failures": {key: dict(failure) for key, failure in self.failures.items()},
+                "num_requests": sum(stats.num_requests for stats in request_stats),
+                "num_requests_fail": sum(stats.num_failures for stats in request_stats),
+                "start_time": self.start_time,
+                "end_time": self.end_time
+            }
+
+    async def __run(self, loop):
+        pool = ConnectionPool(self.scheme, self.host, self.port, self.open_connection)
+        with self.lock:
+            self.loop = loop
+            self.stopping = asyncio.Event()
+            if self.stopped:
+                self.stopping.set()
+            self.request_stats = {
+                f"{method}_{endpoint}": RequestStats(method) for method, endpoint in self.requests
+            }
+            self.failures = {}
+            self.start_time = self.clock()
+            self.end_time = None
+        # requests are the same every time, only build them once
+        payloads = [self.__payload(method, endpoint) for method, endpoint in self.requests]
+        users = []
+        try:
+            # start users at the hatch rate, the run time includes hatching as with locust
+            for i in range(self.users):
+                if self.stopping.is_set():
+                    break
+                users.append(loop.create_task(self.__user(pool, payloads, i)))
+                if self.hatch_rate > 0 and i < self.users - 1:
+                    await self.__wait(1 / self.hatch_rate)
+            if self.run_time is None:
+                await self.__wait(None)
+            else:
+                await self.__wait(max(0, self.run_time - (self.clock() - self.start_time)))
+            self.stopping.set()
+        finally:
+            for user in users:
+                user.cancel()
+            await asyncio.gather(*users, return_exceptions=True)
+            pool.close()
+            with self.lock:
+                self.end_time = self.clock()
+                self.loop = None
+
+    def __payload(self, method, endpoint):
+        lines = [
+            f"{method} {self.base_path}{endpoint} HTTP/1.1",
+            f"Host: {self.host}",
+            f"User-Agent: {USER_AGENT}"
+        ]
+        if method in BODY_METHODS:
+            lines.append("Content-Length: 0")
+        return "".join(line + "\r\n" for line in lines + [""]).encode("latin-1")
+
+    async def __wait(self, timeout):
+        # wait until stopped, or the timeout has passed
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def __user(self, pool, payloads, user):
+        # each user starts at a different request, to spread load evenly
+        i = user
+        while not self.stopping.is_set():
+            method, endpoint = self.requests[i % len(self.requests)]
+            payload = payloads[i % len(self.requests)]
+            i += 1
+            start = time.perf_counter()
+            error = None
+            try:
+                status = await asyncio.wait_for(self.__exchange(pool, method, payload),
+                                                self.timeout)
+                if status >= 400:
+                    error = f"HTTP {status}"
+            except asyncio.CancelledError: # pylint: disable=try-except-raise
+                # cancellation is an Exception before Python 3.8, never record it as an error
+                raise
+            except Exception as err: # pylint: disable=broad-except
+                error = f"{type(err).__name__}: {err}" if str(err) else type(err).__name__
+            self.__record(method, endpoint, (time.perf_counter() - start) * 1000, error)
+            if self.wait_time > 0:
+                await asyncio.sleep(self.wait_time)
+
+    @staticmethod
+    async def __exchange(pool, method, payload):
+        connection = await pool.acquire()
+        try:
+            reader, writer = connection
+            writer.write(payload)
+            status, keep_alive = await read_response(reader, method)
+        except BaseException:
+            # a connection left mid-response can't be reused
+            connection[1].close()
+            raise
+        pool.release(connection, keep_alive)
+        return status
+
+    def __record(self, method, endpoint, response_time, error):
+        name = f"{method}_{endpoint}"
+        with self.lock:
+            self.request_stats[name].record(response_time, error is not None)
+            if error is not None:
+                key = f"{name}_{error}"
+                if key not in self.failures:
+                    self.failures[key] = {
+                        "method": method, "name": endpoint, "error": error, "occurrences": 0
+                    }
+                self.failures[key]["occurrences"] += 1
+
+def create_native_load_test(requests, settings, samplers, interval, run_time, warm_up=0,
+                            telemetry=None):
+    """
+    create_native_load_test creates a native load test of the requests
+    provided with the settings provided, sampled while it runs if there are
+    any samplers, and excluding the stats gathered in the warm up seconds
+    before the run time
+    """
+    if not samplers and not warm_up:
+        return NativeLoadTest(requests, run_time=run_time, **settings)
+    # sampled load tests enforce the run time themselves
+    load_test = NativeLoadTest(requests, run_time=None, **settings)
+    return SampledLoadTest(load_test, samplers, interval, run_time,
+                           spawn=lambda target: threading.Thread(target=target,
+                                                                 daemon=True).start(),
+                           sleep=time.sleep, stop=load_test.stop, warm_up=warm_up,
+                           telemetry=telemetry)
@@ -0,0 +1,263 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import pytest
+from .httpload import NativeLoadTest, RequestStats, parse_host, load_requests, read_response
+from plan.plan import compile_targets
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+ERROR = b"HTTP/1.1 500 Internal Server Error\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nbad\r\n0\r\n\r\n"
+
+class Server:
+    """
+    Server serves keep-alive HTTP/1.1 responses on a local port from a
+    background thread, failing any request path containing /error
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.connections = 0
+        self.requests = []
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.__serve, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __serve(self, started):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self.__handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+        server.close()
+
+    async def __handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line = head.split(b"\r\n")[0].decode("latin-1")
+                self.requests.append(request_line)
+                writer.write(ERROR if "/error" in request_line else OK)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+@pytest.fixture
+def server():
+    server = Server()
+    yield server
+    server.close()
+
+def read(data, method="GET"):
+    loop = asyncio.new_event_loop()
+    try:
+        reader = asyncio.StreamReader(loop=loop)
+        reader.feed_data(data)
+        reader.feed_eof()
+        result = loop.run_until_complete(read_response(reader, method))
+        return result, reader.at_eof()
+    finally:
+        loop.close()
+
+def test_parse_host(subtests):
+    test_cases = [
+        {
+            "description": "No host",
+            "expected_exception": ValueError("Native load engine requires a host"),
+            "host": None
+        },
+        {
+            "description": "Unsupported scheme",
+            "expected_exception": ValueError("Invalid host: ftp://example"),
+            "host": "ftp://example"
+        },
+        {
+            "description": "HTTP default port",
+            "expected": ("http", "fibonacci", 80, ""),
+            "host": "http://fibonacci/"
+        },
+        {
+            "description": "HTTPS default port, base path kept",
+            "expected": ("https", "example.com", 443, "/api"),
+            "host": "https://example.com/api/"
+        },
+        {
+            "description": "Explicit port",
+            "expected": ("http", "fibonacci", 5000, ""),
+            "host": "http://fibonacci:5000"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            if "expected_exception" in test_case:
+                with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                    parse_host(test_case["host"])
+            else:
+                assert test_case["expected"] == parse_host(test_case["host"])
+
+def test_load_requests(subtests):
+    test_cases = [
+        {
+            "description": "Pattern target",
+            "expected_exception": Exception("Native load engine can't request pattern target: GET_/users/\\*"),
+            "targets": [{"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "mean", "target": 5}]
+        },
+        {
+            "description": "Distinct requests, in target order",
+            "expected": [("GET", "/fibonacci?n=10"), ("POST", "/users")],
+            "targets": [
+                {"method": "GET", "endpoint": "/fibonacci?n=10", "type": "mean", "target": 5},
+                {"method": "POST", "endpoint": "/users", "type": "p95", "target": 20},
+                {"method": "GET", "endpoint": "/fibonacci?n=10", "type": "max", "target": 50}
+            ]
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            targets = compile_targets(test_case["targets"])
+            if "expected_exception" in test_case:
+                with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                    load_requests(targets)
+            else:
+                assert test_case["expected"] == load_requests(targets)
+
+def test_read_response(subtests):
+    test_cases = [
+        {
+            "description": "Content length, kept alive",
+            "expected": ((200, True), False),
+            "data": OK + b"HTTP/1.1",
+            "method": "GET"
+        },
+        {
+            "description": "Chunked with trailers",
+            "expected": ((500, True), False),
+            "data": b"HTTP/1.1 500 Error\r\nTransfer-Encoding: chunked\r\n\r\n3;ext\r\nbad\r\n0\r\nX-Trailer: 1\r\n\r\nnext",
+            "method": "GET"
+        },
+        {
+            "description": "Connection close",
+            "expected": ((200, False), False),
+            "data": b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\nokHTTP/1.1",
+            "method": "GET"
+        },
+        {
+            "description": "HTTP/1.0 without keep alive",
+            "expected": ((200, False), False),
+            "data": b"HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\nokHTTP/1.1",
+            "method": "GET"
+        },
+        {
+            "description": "No length, read until closed",
+            "expected": ((200, False), True),
+            "data": b"HTTP/1.1 200 OK\r\n\r\nbody until close",
+            "method": "GET"
+        },
+        {
+            "description": "HEAD has no body",
+            "expected": ((200, True), False),
+            "data": b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nHTTP/1.1",
+            "method": "HEAD"
+        },
+        {
+            "description": "No content",
+            "expected": ((204, True), False),
+            "data": b"HTTP/1.1 204 No Content\r\n\r\nHTTP/1.1",
+            "method": "DELETE"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == read(test_case["data"], test_case["method"])
+
+def test_request_stats():
+    stats = RequestStats("GET")
+    assert stats.to_dict(1)["avg_response_time"] == 0
+    for response_time in [1.2, 2.4, 150.3, 1.4]:
+        stats.record(response_time, False)
+    # failures are counted apart from requests, as locust counts them
+    stats.record(900, True)
+    result = stats.to_dict(2)
+    assert result["request_type"] == "GET"
+    assert result["num_requests"] == 4
+    assert result["num_failures"] == 1
+    assert result["min_response_time"] == 1.2
+    assert result["max_response_time"] == 150.3
+    assert result["avg_response_time"] == pytest.approx(38.825)
+    assert result["median_response_time"] == 2
+    # response times are rounded as locust rounds them
+    assert result["response_times"] == {1: 2, 2: 1, 150: 1}
+    assert result["response_time_percentiles"][95] == 150
+    assert result["total_rps"] == 2
+
+def test_native_load_test_run(server):
+    opened = []
+
+    def open_connection(host, port, ssl):
+        opened.append((host, port, ssl))
+        return asyncio.open_connection(host, port, ssl=ssl)
+
+    load_test = NativeLoadTest([("GET", "/ok"), ("GET", "/error"), ("POST", "/ok")], f"http://127.0.0.1:{server.port}",
+                               users=3, hatch_rate=100, run_time=0.3, open_connection=open_connection)
+    load_test.run()
+    stats = load_test.stats()
+
+    assert set(stats["requests"]) == {"GET_/ok", "GET_/error", "POST_/ok"}
+    assert stats["num_requests"] == sum(request["num_requests"] for request in stats["requests"].values())
+    assert stats["num_requests"] > 3
+    assert stats["requests"]["GET_/ok"]["num_failures"] == 0
+    assert stats["requests"]["GET_/error"]["num_requests"] == 0
+    assert stats["requests"]["GET_/error"]["num_failures"] > 0
+    assert stats["num_requests_fail"] == stats["requests"]["GET_/error"]["num_failures"]
+    assert stats["failures"] == {
+        "GET_/error_HTTP 500": {
+            "method": "GET",
+            "name": "/error",
+            "error": "HTTP 500",
+            "occurrences": stats["num_requests_fail"]
+        }
+    }
+    assert 0.3 <= stats["end_time"] - stats["start_time"] < 1
+    # each user keeps its connection alive between requests
+    assert len(opened) == 3
+    assert server.connections == 3
+    assert "POST /ok HTTP/1.1" in server.requests
+
+def test_native_load_test_stop(server):
+    load_test = NativeLoadTest([("GET", "/ok")], f"http://127.0.0.1:{server.port}", users=2, hatch_rate=0)
+    # stopped from another thread while running without a run time
+    timer = threading.Timer(0.2, load_test.stop)
+    timer.start()
+    load_test.run()
+    timer.join()
+    stats = load_test.stats()
+    assert stats["num_requests"] > 0
+    assert stats["end_time"] is not None
+
+def test_native_load_test_connection_refused():
+    load_test = NativeLoadTest([("GET", "/ok")], "http://127.0.0.1:1", users=1, hatch_rate=0, run_time=0.1)
+    load_test.run()
+    stats = load_test.stats()
+    # connection failures are recorded as failed requests rather than failing the load test
+    assert stats["num_requests"] == 0
+    assert stats["num_requests_fail"] > 0
+    assert all(failure["error"].startswith("ConnectionRefusedError") for failure in stats["failures"].values())
@@ -0,0 +1,264 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Load test handles wrapping a load test so its stats can be sampled while it
+runs, stopping it early if a sampler asks to or once its run time is up, and
+excluding the stats gathered while it warms up
+"""
+import re
+import time
+from histogram.histogram import from_response_times, percentile
+from telemetry.telemetry import Telemetry
+
+# engines load can be generated with, a locustfile run by locust or the
+# targets requested directly by the native engine
+ENGINE_LOCUST = "locust"
+ENGINE_NATIVE = "native"
+# seconds the native engine waits for a response
+DEFAULT_TIMEOUT = 10
+
+RUN_TIME_PATTERN = re.compile(r"^((?P<hours>\d+)h)?((?P<minutes>\d+)m)?((?P<seconds>\d+)s?)?$")
+
+def parse_run_time(run_time):
+    """
+    parse_run_time converts a locust style run time, e.g. 20, 20s, 1m30s or
+    1h, into seconds
+    """
+    match = RUN_TIME_PATTERN.match(str(run_time).strip())
+    if match is None or not any(match.groupdict().values()):
+        raise ValueError(f"Invalid run time: {run_time}")
+    parts = {name: int(value) for name, value in match.groupdict().items() if value}
+    return parts.get("hours", 0) * 3600 + parts.get("minutes", 0) * 60 + parts.get("seconds", 0)
+
+def subtract_stats(stats, baseline):
+    """
+    subtract_stats returns the stats gathered since the baseline stats were
+    taken, recalculating averages and percentiles from the difference in
+    response time distributions
+    """
+    result = dict(stats)
+    for key in ("num_requests", "num_requests_fail"):
+        if key in stats:
+            result[key] = stats[key] - baseline.get(key, 0)
+    result["requests"] = {
+        name: subtract_request(request, baseline.get("requests", {}).get(name))
+        for name, request in stats.get("requests", {}).items()
+    }
+    result["failures"] = {}
+    for name, failure in stats.get("failures", {}).items():
+        baseline_failure = baseline.get("failures", {}).get(name, {})
+        occurrences = failure.get("occurrences", 0) - baseline_failure.get("occurrences", 0)
+        if occurrences > 0:
+            result["failures"][name] = dict(failure, occurrences=occurrences)
+    return result
+
+def subtract_request(request, baseline):
+    """
+    subtract_request returns the stats for a single request name gathered
+    since the baseline stats for it were taken
+    """
+    if baseline is None:
+        return request
+    result = dict(request)
+    num_requests = request.get("num_requests", 0) - baseline.get("num_requests", 0)
+    result["num_requests"] = num_requests
+    if "num_failures" in request:
+        result["num_failures"] = request["num_failures"] - baseline.get("num_failures", 0)
+    # averages are exact, calculated from the totals they were averaged from
+    if num_requests > 0:
+        total = request.get("avg_response_time", 0) * request.get("num_requests", 0)
+        baseline_total = baseline.get("avg_response_time", 0) * baseline.get("num_requests", 0)
+        result["avg_response_time"] = (total - baseline_total) / num_requests
+    else:
+        result["avg_response_time"] = 0
+
+    if "response_times" in request:
+        baseline_times = baseline.get("response_times", {})
+        response_times = {response_time: bucket_count - baseline_times.get(response_time, 0)
+                          for response_time, bucket_count in request["response_times"].items()
+                          if bucket_count > baseline_times.get(response_time, 0)}
+        histogram = from_response_times(response_times)
+        result["response_times"] = response_times
+        result["min_response_time"] = histogram[0][0] if histogram else None
+        result["max_response_time"] = histogram[-1][0] if histogram else 0
+        result["median_response_time"] = percentile(histogram, 50) if histogram else 0
+        if "response_time_percentiles" in request:
+            result["response_time_percentiles"] = {
+                percent: percentile(histogram, float(percent)) if histogram else 0
+                for percent in request["response_time_percentiles"]
+            }
+    return result
+
+def add_request_failures(stats):
+    """
+    add_request_failures adds the failures of each request to its stats as
+    num_failures, invokust only reports failures by error, under the method
+    and name of the request that failed
+    """
+    failures = {}
+    for failure in stats.get("failures", {}).values():
+        name = f"{failure.get('method')}_{failure.get('name')}"
+        failures[name] = failures.get(name, 0) + failure.get("occurrences", 0)
+    for name, request in stats.get("requests", {}).items():
+        request["num_failures"] = failures.get(name, 0)
+    return stats
+
+def create_locust_load_test(settings, samplers, interval, run_time, warm_up=0, telemetry=None):
+    """
+    create_locust_load_test creates a locust load test from the invokust
+    settings provided, sampled while it runs if there are any samplers, and
+    excluding the stats gathered in the warm up seconds before the run time
+    """
+    # invokust pulls in locust and gevent, only import it when running load tests
+    # so the evaluate path stays light
+    import invokust # pylint: disable=import-outside-toplevel
+
+    if not samplers and not warm_up:
+        return LocustLoadTest(invokust.LocustLoadTest(
+            invokust.create_settings(run_time=str(run_time), **settings)))
+
+    import gevent # pylint: disable=import-outside-toplevel
+    from locust import runners # pylint: disable=import-outside-toplevel
+    # sampled load tests enforce the run time themselves, so that an early
+    # stop doesn't leave a pending locust time limit behind
+    load_test = LocustLoadTest(invokust.LocustLoadTest(
+        invokust.create_settings(run_time=None, **settings)))
+    def stop():
+        # the runner is only created once the load test starts
+        runners.locust_runner.quit()
+    return SampledLoadTest(load_test, samplers, interval, run_time,
+                           spawn=gevent.spawn, sleep=gevent.sleep, stop=stop, warm_up=warm_up,
+                           telemetry=telemetry)
+
+class LocustLoadTest:
+    """
+    LocustLoadTest abstracts an invokust load test, reporting the failures of
+    each request in its stats alongside its other stats, as the native engine
+    does
+    """
+    def __init__(self, load_test):
+        self.load_test = load_test
+
+    def run(self):
+        """
+        run runs the load test
+        """
+        self.load_test.run()
+
+    def stats(self):
+        """
+        stats returns the load test stats, with the failures of each request
+        """
+        return add_request_failures(self.load_test.stats())
+
+class SampledLoadTest: # pylint: disable=too-many-instance-attributes
+    """
+    SampledLoadTest abstracts running a load test while periodically passing
+    its stats to samplers, the test is stopped when any sampler returns True
+    or the run time has passed. If there is a warm up, the run time starts
+    once it is over and the stats gathered during it are excluded, unless the
+    load test's own stats already exclude it. The concurrency primitives are
+    provided so that the load test's own (e.g. gevent) can be used
+    """
+    def __init__(self, load_test, samplers, interval, # pylint: disable=too-many-arguments
+                 run_time, spawn, sleep, stop, clock=time.monotonic, warm_up=0,
+                 warm_up_excluded=False, telemetry=None):
+        self.load_test = load_test
+        self.samplers = samplers
+        self.interval = interval
+        self.run_time = run_time
+        self.spawn = spawn
+        self.sleep = sleep
+        self.stop = stop
+        self.clock = clock
+        self.warm_up = warm_up
+        self.warm_up_excluded = warm_up_excluded
+        self.telemetry = Telemetry() if telemetry is None else telemetry
+        self.running = False
+        self.stopped_early = False
+        self.start = None
+        self.steady = None
+        self.baseline = None
+        self.end = None
+
+    def run(self):
+        """
+        run runs the load test, sampling it until it has finished
+        """
+        self.running = True
+        self.stopped_early = False
+        self.start = self.clock()
+        self.steady = self.start if self.warm_up <= 0 else None
+        self.baseline = None
+        self.end = None
+        self.spawn(self.__watch)
+        try:
+            self.load_test.run()
+        finally:
+            self.running = False
+            self.end = self.clock()
+
+    def stats(self):
+        """
+        stats returns the load test stats, excluding any warm up, along with
+        how long the load test actually ran after warming up and whether it
+        was stopped early
+        """
+        results = self.load_test.stats()
+        steady = self.start if self.steady is None else self.steady
+        if self.baseline is not None:
+            results = subtract_stats(results, self.baseline)
+            run_time = self.end - steady
+            for request in results["requests"].values():
+                if "total_rps" in request:
+                    request["total_rps"] = (request.get("num_requests", 0) / run_time
+                                            if run_time > 0 else 0)
+        results["run_time"] = self.end - steady
+        results["stopped_early"] = self.stopped_early
+        return results
+
+    def __watch(self):
+        while True:
+            if self.steady is None:
+                # sleep until the warm up is over
+                wait = self.warm_up - (self.clock() - self.start)
+            else:
+                wait = min(self.interval, self.run_time - (self.clock() - self.steady))
+            self.sleep(max(0, wait))
+            if not self.running:
+                return
+            if self.steady is None:
+                if self.clock() - self.start >= self.warm_up:
+                    self.__end_warm_up()
+                continue
+            elapsed = self.clock() - self.steady
+            if elapsed >= self.run_time:
+                self.stop()
+                return
+            stats = self.load_test.stats()
+            if self.baseline is not None:
+                stats = subtract_stats(stats, self.baseline)
+            # every sampler sees every sample, even once one has asked to stop
+            stop = [sampler.sample(stats, elapsed) for sampler in self.samplers]
+            if any(stop):
+                self.stopped_early = True
+                self.stop()
+                return
+
+    def __end_warm_up(self):
+        if not self.warm_up_excluded:
+            self.baseline = self.load_test.stats()
+        self.steady = self.clock()
+        # users hatch during the warm up, time it separately from the run
+        self.telemetry.observe("load_test_warm_up", self.steady - self.start)
@@ -0,0 +1,312 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import pytest
+from .loadtest import SampledLoadTest, LocustLoadTest, parse_run_time, subtract_stats, add_request_failures
+
+class FakeLoadTest:
+    def __init__(self, run_reactor=None):
+        self.stopped = threading.Event()
+        self.run_reactor = run_reactor
+
+    def run(self):
+        if self.run_reactor is not None:
+            return self.run_reactor()
+        # block until stopped, as a locust run without a time limit does
+        self.stopped.wait(5)
+        return None
+
+    def stats(self):
+        return {"requests": {}}
+
+class FakeSampler:
+    def __init__(self, stop_after):
+        self.stop_after = stop_after
+        self.samples = []
+
+    def sample(self, stats, elapsed):
+        self.samples.append(elapsed)
+        return self.stop_after is not None and len(self.samples) >= self.stop_after
+
+def spawn(target):
+    threading.Thread(target=target, daemon=True).start()
+
+def test_parse_run_time(subtests):
+    test_cases = [
+        {
+            "description": "Invalid run time",
+            "expected_exception": ValueError("Invalid run time: 20x"),
+            "run_time": "20x"
+        },
+        {
+            "description": "Empty run time",
+            "expected_exception": ValueError("Invalid run time: "),
+            "run_time": ""
+        },
+        {
+            "description": "Seconds without unit",
+            "expected": 20,
+            "run_time": "20"
+        },
+        {
+            "description": "Seconds",
+            "expected": 20,
+            "run_time": "20s"
+        },
+        {
+            "description": "Hours, minutes and seconds",
+            "expected": 3690,
+            "run_time": "1h1m30s"
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    parse_run_time(test_case["run_time"])
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == parse_run_time(test_case["run_time"])
+
+def test_sampled_load_test_run(subtests):
+    test_cases = [
+        {
+            "description": "Fail to run load test",
+            "expected_exception": Exception("fail to run tests"),
+            "load_test": FakeLoadTest(lambda: (_ for _ in ()).throw(Exception("fail to run tests"))),
+            "samplers": [],
+            "run_time": 5
+        },
+        {
+            "description": "Sampler stops test early",
+            "expected_stopped_early": True,
+            "expected_max_run_time": 4,
+            "load_test": FakeLoadTest(),
+            "samplers": [FakeSampler(None), FakeSampler(3)],
+            "run_time": 5
+        },
+        {
+            "description": "Run time reached without sampler stopping",
+            "expected_stopped_early": False,
+            "expected_max_run_time": 4,
+            "load_test": FakeLoadTest(),
+            "samplers": [FakeSampler(None)],
+            "run_time": 0.1
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            load_test = test_case["load_test"]
+            sampled = SampledLoadTest(load_test, test_case["samplers"], 0.01, test_case["run_time"],
+                                      spawn=spawn, sleep=time.sleep, stop=load_test.stopped.set)
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    sampled.run()
+                assert str(ex.value) == str(test_case["expected_exception"])
+                assert not sampled.running
+            else:
+                sampled.run()
+                stats = sampled.stats()
+                assert stats["stopped_early"] == test_case["expected_stopped_early"]
+                assert stats["run_time"] < test_case["expected_max_run_time"]
+                assert load_test.stopped.is_set()
+                # every sampler sees every sample
+                assert len({len(sampler.samples) for sampler in test_case["samplers"]}) == 1
+
+def test_subtract_stats(subtests):
+    test_cases = [
+        {
+            "description": "No baseline, unchanged",
+            "expected": {
+                "num_requests": 4,
+                "requests": {"GET_/test": {"num_requests": 4, "avg_response_time": 3}},
+                "failures": {}
+            },
+            "stats": {
+                "num_requests": 4,
+                "requests": {"GET_/test": {"num_requests": 4, "avg_response_time": 3}}
+            },
+            "baseline": {}
+        },
+        {
+            "description": "Warm up excluded, stats recalculated from the difference",
+            "expected": {
+                "num_requests": 3,
+                "num_requests_fail": 1,
+                "requests": {
+                    "GET_/test": {
+                        "num_requests": 3,
+                        "num_failures": 1,
+                        "avg_response_time": 3,
+                        "min_response_time": 2,
+                        "max_response_time": 5,
+                        "median_response_time": 2,
+                        "response_times": {2: 2, 5: 1},
+                        "response_time_percentiles": {95: 5}
+                    },
+                    "GET_/new": {"num_requests": 1, "avg_response_time": 1}
+                },
+                "failures": {"GET_/test_error": {"occurrences": 1}}
+            },
+            "stats": {
+                "num_requests": 5,
+                "num_requests_fail": 2,
+                "requests": {
+                    "GET_/test": {
+                        "num_requests": 4,
+                        "num_failures": 2,
+                        "avg_response_time": 27,
+                        "min_response_time": 2,
+                        "max_response_time": 99,
+                        "median_response_time": 5,
+                        "response_times": {2: 2, 5: 1, 99: 1},
+                        "response_time_percentiles": {95: 99}
+                    },
+                    "GET_/new": {"num_requests": 1, "avg_response_time": 1}
+                },
+                "failures": {
+                    "GET_/test_error": {"occurrences": 2},
+                    "GET_/test_timeout": {"occurrences": 1}
+                }
+            },
+            "baseline": {
+                "num_requests": 2,
+                "num_requests_fail": 1,
+                "requests": {
+                    "GET_/test": {
+                        "num_requests": 1,
+                        "num_failures": 1,
+                        "avg_response_time": 99,
+                        "response_times": {99: 1}
+                    }
+                },
+                "failures": {
+                    "GET_/test_error": {"occurrences": 1},
+                    "GET_/test_timeout": {"occurrences": 1}
+                }
+            }
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == subtract_stats(test_case["stats"], test_case["baseline"])
+
+def test_add_request_failures(subtests):
+    test_cases = [
+        {
+            "description": "No failures",
+            "expected": {"GET_/a": 0},
+            "failures": {}
+        },
+        {
+            "description": "Failures matched on method and name",
+            "expected": {"GET_/a": 3, "POST_/a": 0},
+            "failures": {
+                "GET_/a": {"method": "GET", "name": "/a", "error": "ConnectionError()", "occurrences": 3},
+                "DELETE_/a": {"method": "DELETE", "name": "/a", "error": "ConnectionError()", "occurrences": 1}
+            }
+        },
+        {
+            "description": "Failures of the same request with different errors summed",
+            "expected": {"GET_/a": 5},
+            "failures": {
+                "1": {"method": "GET", "name": "/a", "error": "ConnectionError()", "occurrences": 3},
+                "2": {"method": "GET", "name": "/a", "error": "HTTPError('500')", "occurrences": 2}
+            }
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            requests = {name: {"num_requests": 10} for name in test_case["expected"]}
+            stats = add_request_failures({"requests": requests, "failures": test_case["failures"]})
+            assert test_case["expected"] == {name: request["num_failures"]
+                                             for name, request in stats["requests"].items()}
+
+class FailingLoadTest(FakeLoadTest):
+    """
+    FailingLoadTest reports stats as invokust does, failing a request on each
+    stats call
+    """
+    def __init__(self):
+        super().__init__()
+        self.occurrences = 0
+
+    def stats(self):
+        self.occurrences += 1
+        return {
+            "requests": {"GET_/test": {"request_type": "GET", "num_requests": 10, "avg_response_time": 1}},
+            "failures": {"GET_/test": {"method": "GET", "name": "/test", "error": "ConnectionError()",
+                                       "occurrences": self.occurrences}}
+        }
+
+def test_sampled_locust_load_test_failures():
+    load_test = FailingLoadTest()
+    sampler = StatsSampler()
+    sampled = SampledLoadTest(LocustLoadTest(load_test), [sampler], 0.01, 0.05, spawn=spawn, sleep=time.sleep,
+                              stop=load_test.stopped.set, warm_up=0.05)
+    sampled.run()
+    stats = sampled.stats()
+    # samplers and the final stats see the failures of each request, excluding the warm up
+    assert sampler.stats and all(sample["requests"]["GET_/test"]["num_failures"] > 0 for sample in sampler.stats)
+    assert stats["requests"]["GET_/test"]["num_failures"] == \
+        stats["failures"]["GET_/test"]["occurrences"]
+
+class CountingLoadTest(FakeLoadTest):
+    """
+    CountingLoadTest starts with slow requests made during warm up, adding a
+    fast request on each stats call
+    """
+    def __init__(self):
+        super().__init__()
+        self.response_times = {100: 5}
+
+    def stats(self):
+        self.response_times[1] = self.response_times.get(1, 0) + 1
+        num_requests = sum(self.response_times.values())
+        avg = sum(time * count for time, count in self.response_times.items()) / num_requests
+        return {"requests": {"GET_/test": {"num_requests": num_requests, "avg_response_time": avg,
+                                           "response_times": dict(self.response_times)}}}
+
+class StatsSampler(FakeSampler):
+    def __init__(self):
+        super().__init__(None)
+        self.stats = []
+
+    def sample(self, stats, elapsed):
+        self.stats.append(stats)
+        return super().sample(stats, elapsed)
+
+def test_sampled_load_test_warm_up():
+    load_test = CountingLoadTest()
+    sampler = StatsSampler()
+    sampled = SampledLoadTest(load_test, [sampler], 0.01, 0.1, spawn=spawn, sleep=time.sleep,
+                              stop=load_test.stopped.set, warm_up=0.1)
+    start = time.monotonic()
+    sampled.run()
+    stats = sampled.stats()
+    # ran for the warm up and then the run time
+    assert time.monotonic() - start >= 0.2
+    assert stats["run_time"] < 0.2
+    # samplers only see stats from after the warm up
+    assert sampler.samples and all(elapsed < 0.1 for elapsed in sampler.samples)
+    assert all(100 not in sample["requests"]["GET_/test"]["response_times"] for sample in sampler.stats)
+    request = stats["requests"]["GET_/test"]
+    assert request["response_times"] == {1: request["num_requests"]}
+    assert request["avg_response_time"] == pytest.approx(1)
@@ -16,14 +16,27 @@ Metric handles starting the locust load tester, retrieving results from it,
 and parsing current replica count from the k8s resource before returning
 it
 """
+from histogram.histogram import from_response_times
+from timeseries.timeseries import COLUMNS, select_intervals, to_columns
+from evaluate.evaluate import PAYLOAD_VERSION
+from telemetry.telemetry import (Telemetry, LOAD_TEST_REQUESTS, LOAD_TEST_FAILURES,
+                                 LOAD_TEST_REQUESTS_PER_SECOND, LOAD_TEST_REQUESTS_TOTAL,
+                                 LOAD_TEST_FAILURES_TOTAL)
+
+# run details reported alongside the requests in the projected payload
+RUN_FIELDS = ["run_time", "stopped_early", "start_time", "end_time", "num_requests",
+              "num_requests_fail"]
 
 class Metric:
     """
     Metric abstracts retrieving metrics by running the locust load testing
     and returning the results, alongside the current replica count
     """
-    def __init__(self, load_test):
+    def __init__(self, load_test, index=None, time_series=None, telemetry=None):
         self.load_test = load_test
+        self.index = index
+        self.time_series = time_series
+        self.telemetry = Telemetry() if telemetry is None else telemetry
 
     def get(self, resource):
         """
@@ -31,10 +44,85 @@ class Metric:
         results
         """
         # run tests
-        self.load_test.run()
+        with self.telemetry.span("load_test_run"):
+            self.load_test.run()
         # get results
-        results = self.load_test.stats()
-        # add current replica count from resource definition
-        current_replicas = int(resource.get("spec").get("replicas"))
-        results["current_replicas"] = current_replicas
-        return results
+        with self.telemetry.span("load_test_stats"):
+            results = self.load_test.stats()
+            if self.time_series is not None:
+                # record the end of the load test, after the last sample
+                if results.get("run_time") is not None:
+                    self.time_series.sample(results, results["run_time"])
+                results["time_series"] = self.time_series.get()
+        self.__record(results)
+        with self.telemetry.span("metric_serialize"):
+            # replace raw response times with a compact histogram, carrying the
+            # response time distribution through to evaluation
+            for request in results.get("requests", {}).values():
+                response_times = request.pop("response_times", None)
+                if response_times is not None:
+                    request["response_time_histogram"] = from_response_times(response_times)
+            # add current replica count from resource definition
+            current_replicas = int(resource.get("spec").get("replicas"))
+            results["current_replicas"] = current_replicas
+            if self.index is None:
+                return results
+            return self.__project(results)
+
+    def __record(self, results):
+        # report how much load the load test generated
+        num_requests = results.get("num_requests", 0)
+        num_failures = results.get("num_requests_fail", 0)
+        run_time = results.get("run_time")
+        start_time = results.get("start_time")
+        end_time = results.get("end_time")
+        if run_time is None and start_time is not None and end_time is not None:
+            run_time = end_time - start_time
+        self.telemetry.set(LOAD_TEST_REQUESTS, num_requests)
+        self.telemetry.set(LOAD_TEST_FAILURES, num_failures)
+        self.telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND,
+                           num_requests / run_time if run_time else 0)
+        self.telemetry.inc(LOAD_TEST_REQUESTS_TOTAL, num_requests)
+        self.telemetry.inc(LOAD_TEST_FAILURES_TOTAL, num_failures)
+
+    def __project(self, results):
+        index = self.index
+        # only keep the requests and fields the targets read, in a versioned payload
+        requests = results.get("requests", {})
+        projected = {
+            "version": PAYLOAD_VERSION,
+            "current_replicas": results["current_replicas"],
+            "requests": {}
+        }
+        for field in RUN_FIELDS:
+            if field in results:
+                projected[field] = results[field]
+        if "time_series" in results:
+            projected["time_series"] = self.__project_time_series(index, results["time_series"])
+        # requests matched by a pattern target are aggregated under the target's name
+        for target, selected in zip(index.targets, index.select(requests)):
+            if selected is None:
+                continue
+            request = projected["requests"].setdefault(target.name, {})
+            for field in target.fields:
+                if field in selected:
+                    request[field] = selected[field]
+        return projected
+
+    @staticmethod
+    def __project_time_series(index, time_series):
+        # only keep the requests targets read, with their distributions only
+        # if a target reads them over a window
+        columns = {}
+        for target in index.targets:
+            target_columns = columns.setdefault(target.name, list(COLUMNS))
+            if target.window is not None and target.window_field() not in target_columns:
+                target_columns.append(target.window_field())
+        interval_requests = [
+            {
+                target.name: request
+                for target, request in zip(index.targets, interval) if request is not None
+            }
+            for interval in select_intervals(index, time_series)
+        ]
+        return to_columns(time_series["elapsed"], interval_requests, columns)
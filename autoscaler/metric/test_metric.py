@@ -14,6 +14,11 @@
 
 import pytest
 from .metric import Metric
+from plan.plan import TargetIndex, compile_targets
+from loadtest.loadtest import LocustLoadTest
+from timeseries.timeseries import TimeSeries
+from telemetry.telemetry import (Telemetry, LOAD_TEST_REQUESTS, LOAD_TEST_FAILURES, LOAD_TEST_REQUESTS_PER_SECOND,
+                                 LOAD_TEST_REQUESTS_TOTAL, PHASE_SECONDS)
 
 class FakeLoadTest:
     def __init__(self, run_reactor, stats_reactor):
@@ -64,14 +69,250 @@ def test_metric_get(subtests):
                 "success": True
             })
         },
+        {
+            "description": "Success get results, response times replaced with histogram",
+            "expected": {
+                "current_replicas": 3,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4,
+                        "response_time_histogram": [[2, 1], [5, 2]]
+                    },
+                    "GET_/test2": {
+                        "avg_response_time": 4
+                    }
+                }
+            },
+            "resource": {
+                "spec": {
+                    "replicas": 3
+                }
+            },
+            "load_test": FakeLoadTest(lambda: None, lambda: {
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4,
+                        "response_times": {5: 2, 2: 1}
+                    },
+                    "GET_/test2": {
+                        "avg_response_time": 4
+                    }
+                }
+            })
+        },
+        {
+            "description": "Success, results projected to target fields",
+            "expected": {
+                "version": 1,
+                "current_replicas": 3,
+                "num_requests": 10,
+                "run_time": 12.5,
+                "stopped_early": True,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4,
+                        "response_time_histogram": [[2, 1], [5, 2]]
+                    },
+                    "POST_/test2": {
+                        "max_response_time": 9
+                    }
+                }
+            },
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "mean", "target": 5},
+                {"method": "GET", "endpoint": "/test", "type": "p99", "target": 5},
+                {"method": "POST", "endpoint": "/test2", "type": "max", "target": 5},
+                {"method": "DELETE", "endpoint": "/missing", "type": "max", "target": 5}
+            ],
+            "resource": {
+                "spec": {
+                    "replicas": 3
+                }
+            },
+            "load_test": FakeLoadTest(lambda: None, lambda: {
+                "num_requests": 10,
+                "run_time": 12.5,
+                "stopped_early": True,
+                "requests": {
+                    "GET_/test": {
+                        "num_requests": 3,
+                        "avg_response_time": 4,
+                        "median_response_time": 5,
+                        "max_response_time": 5,
+                        "response_times": {5: 2, 2: 1}
+                    },
+                    "POST_/test2": {
+                        "num_requests": 7,
+                        "avg_response_time": 4,
+                        "max_response_time": 9
+                    },
+                    "GET_/untargeted": {
+                        "num_requests": 7,
+                        "avg_response_time": 4
+                    }
+                }
+            })
+        },
+        {
+            "description": "Success, pattern target aggregates matching requests",
+            "expected": {
+                "version": 1,
+                "current_replicas": 3,
+                "requests": {
+                    "GET_/users/*": {
+                        "avg_response_time": 7,
+                        "response_time_histogram": [[4, 1], [8, 3]]
+                    }
+                }
+            },
+            "targets": [
+                {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "mean", "target": 5},
+                {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "p90", "target": 5}
+            ],
+            "resource": {
+                "spec": {
+                    "replicas": 3
+                }
+            },
+            "load_test": FakeLoadTest(lambda: None, lambda: {
+                "requests": {
+                    "GET_/users/1": {
+                        "num_requests": 1,
+                        "avg_response_time": 4,
+                        "response_times": {4: 1}
+                    },
+                    "GET_/users/2": {
+                        "num_requests": 3,
+                        "avg_response_time": 8,
+                        "response_times": {8: 3}
+                    },
+                    "POST_/users/3": {
+                        "num_requests": 7,
+                        "avg_response_time": 40,
+                        "response_times": {40: 7}
+                    }
+                }
+            })
+        },
+        {
+            "description": "Success, throughput targets projected to every field they read",
+            "expected": {
+                "version": 1,
+                "current_replicas": 3,
+                "num_requests": 8,
+                "num_requests_fail": 2,
+                "requests": {
+                    "GET_/test": {
+                        "num_requests": 8,
+                        "num_failures": 2,
+                        "total_rps": 4
+                    }
+                }
+            },
+            "targets": [
+                {"method": "GET", "endpoint": "/test", "type": "failure_ratio", "target": 0.05},
+                {"method": "GET", "endpoint": "/test", "type": "rps", "target": 5}
+            ],
+            "resource": {
+                "spec": {
+                    "replicas": 3
+                }
+            },
+            # invokust only reports failures by error, not per request
+            "load_test": LocustLoadTest(FakeLoadTest(lambda: None, lambda: {
+                "requests": {
+                    "GET_/test": {
+                        "request_type": "GET",
+                        "num_requests": 8,
+                        "avg_response_time": 4,
+                        "total_rps": 4,
+                        "total_rpm": 240
+                    }
+                },
+                "failures": {
+                    "GET_/test": {"method": "GET", "name": "/test", "error": "ConnectionError()", "occurrences": 2}
+                },
+                "num_requests": 8,
+                "num_requests_fail": 2
+            }))
+        },
     ]
 
     for i, test_case in enumerate(test_cases):
         with subtests.test(msg=test_case["description"], i=i):
-            metric_gatherer = Metric(test_case["load_test"])
+            targets = test_case.get("targets")
+            index = None if targets is None else TargetIndex(compile_targets(targets))
+            metric_gatherer = Metric(test_case["load_test"], index)
             if "expected_exception" in test_case.keys():
                 with pytest.raises(type(test_case["expected_exception"])) as ex:
                     metric_gatherer.get(test_case["resource"])
                 assert str(ex.value) == str(test_case["expected_exception"])
             else:
                 assert test_case["expected"] == metric_gatherer.get(test_case["resource"])
+
+class FakeTimeSeries(TimeSeries):
+    def __init__(self, samples):
+        super().__init__()
+        for stats, elapsed in samples:
+            self.sample(stats, elapsed)
+
+def test_metric_get_time_series():
+    time_series = FakeTimeSeries([
+        ({"requests": {"GET_/users/1": {"num_requests": 1, "avg_response_time": 4, "response_times": {4: 1}}}}, 1)
+    ])
+    load_test = FakeLoadTest(lambda: None, lambda: {
+        "run_time": 2,
+        "requests": {
+            "GET_/users/1": {"num_requests": 2, "avg_response_time": 5, "response_times": {4: 1, 6: 1}},
+            "GET_/users/2": {"num_requests": 1, "avg_response_time": 8, "response_times": {8: 1}},
+            "GET_/health": {"num_requests": 5, "avg_response_time": 1, "response_times": {1: 5}}
+        }
+    })
+    targets = [
+        {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "p95", "target": 5,
+         "window": {"seconds": 1}},
+        {"method": "GET", "endpoint": "/health", "type": "max", "target": 5}
+    ]
+    result = Metric(load_test, TargetIndex(compile_targets(targets)), time_series=time_series).get({"spec": {"replicas": 3}})
+    # the final stats are recorded as the last interval, pattern targets are aggregated, and only
+    # targets read over a window keep their distributions
+    assert result["time_series"] == {
+        "elapsed": [1, 2],
+        "requests": {
+            "GET_/users/*": {
+                "num_requests": [1, 2],
+                "num_failures": [0, 0],
+                "rps": [1, 2],
+                "avg_response_time": [4, 7],
+                "max_response_time": [4, 8],
+                "response_time_histogram": [[[4, 1]], [[6, 1], [8, 1]]]
+            },
+            "GET_/health": {
+                "num_requests": [0, 5],
+                "num_failures": [0, 0],
+                "rps": [0, 5],
+                "avg_response_time": [0, 1],
+                "max_response_time": [0, 1]
+            }
+        }
+    }
+
+def test_metric_get_telemetry():
+    telemetry = Telemetry()
+    load_test = FakeLoadTest(lambda: None, lambda: {
+        "start_time": 100,
+        "end_time": 104,
+        "num_requests": 20,
+        "num_requests_fail": 2,
+        "requests": {}
+    })
+    metric = Metric(load_test, telemetry=telemetry)
+    metric.get({"spec": {"replicas": 1}})
+    metric.get({"spec": {"replicas": 1}})
+    # the last load test is reported as gauges, and totalled across runs
+    assert telemetry.get(LOAD_TEST_REQUESTS) == 20
+    assert telemetry.get(LOAD_TEST_FAILURES) == 2
+    assert telemetry.get(LOAD_TEST_REQUESTS_PER_SECOND) == 5
+    assert telemetry.get(LOAD_TEST_REQUESTS_TOTAL) == 40
+    for phase in ("load_test_run", "load_test_stats", "metric_serialize"):
+        assert telemetry.get(PHASE_SECONDS + "_count", phase=phase) == 2
@@ -0,0 +1,248 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Multiprocess handles spreading load generation across multiple worker
+processes, so load capacity is not limited to a single core, and merging
+their stats back into a single result
+"""
+import os
+import time
+from histogram.histogram import from_response_times, merge, percentile
+from loadtest.loadtest import create_locust_load_test
+
+SAMPLE = "sample"
+FINAL = "final"
+ERROR = "error"
+STOP = "stop"
+
+def available_cores():
+    """
+    available_cores returns the number of cores this process can run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def split_load(user_count, hatch_rate, processes):
+    """
+    split_load splits the users and hatch rate between processes, returning a
+    (users, hatch rate) pair per process. Never uses more processes than users
+    """
+    processes = max(1, min(processes, user_count))
+    shares = []
+    for i in range(processes):
+        users = user_count // processes + (1 if i < user_count % processes else 0)
+        shares.append((users, hatch_rate * users / user_count))
+    return shares
+
+def merge_stats(stats_list):
+    """
+    merge_stats merges the stats from multiple load tests into a single set of
+    stats in the same shape, recalculating averages and percentiles from the
+    combined response time distributions
+    """
+    merged = {
+        "requests": {},
+        "failures": {},
+        "num_requests": 0,
+        "num_requests_fail": 0
+    }
+    for stats in stats_list:
+        merged["num_requests"] += stats.get("num_requests", 0)
+        merged["num_requests_fail"] += stats.get("num_requests_fail", 0)
+        for key, combine in (("start_time", min), ("end_time", max), ("run_time", max),
+                             ("stopped_early", max)):
+            if stats.get(key) is None:
+                continue
+            if merged.get(key) is None:
+                merged[key] = stats[key]
+            else:
+                merged[key] = combine(merged[key], stats[key])
+        for name, request in stats.get("requests", {}).items():
+            merged["requests"].setdefault(name, []).append(request)
+        for name, failure in stats.get("failures", {}).items():
+            if name in merged["failures"]:
+                merged["failures"][name]["occurrences"] += failure.get("occurrences", 0)
+            else:
+                merged["failures"][name] = dict(failure)
+
+    merged["requests"] = {
+        name: merge_requests(requests) for name, requests in merged["requests"].items()
+    }
+    return merged
+
+def merge_requests(requests):
+    """
+    merge_requests merges the stats for a single request name from multiple
+    load tests
+    """
+    num_requests = sum(request.get("num_requests", 0) for request in requests)
+    merged = dict(requests[0])
+    merged["num_requests"] = num_requests
+    for key in ("num_failures", "total_rps"):
+        if key in merged:
+            merged[key] = sum(request.get(key, 0) for request in requests)
+
+    min_response_times = [request["min_response_time"] for request in requests
+                          if request.get("min_response_time") is not None]
+    merged["min_response_time"] = min(min_response_times) if min_response_times else None
+    merged["max_response_time"] = max(request.get("max_response_time", 0) for request in requests)
+    if num_requests > 0:
+        merged["avg_response_time"] = sum(
+            request.get("avg_response_time", 0) * request.get("num_requests", 0)
+            for request in requests
+        ) / num_requests
+
+    if all("response_times" in request for request in requests):
+        histogram = merge([from_response_times(request["response_times"]) for request in requests])
+        merged["response_times"] = dict(histogram)
+        merged["median_response_time"] = percentile(histogram, 50)
+        if "response_time_percentiles" in merged:
+            merged["response_time_percentiles"] = {
+                percent: percentile(histogram, float(percent))
+                for percent in merged["response_time_percentiles"]
+            }
+    return merged
+
+def locust_worker(conn, args):
+    """
+    locust_worker runs a locust load test inside a worker process, sending
+    stats back to the parent as it runs, and stopping if told to
+    """
+    run_worker(conn, lambda samplers: create_locust_load_test(
+        args["settings"], samplers, args["interval"], args["run_time"], args.get("warm_up", 0)))
+
+def native_worker(conn, args):
+    """
+    native_worker runs a native load test inside a worker process, sending
+    stats back to the parent as it runs, and stopping if told to
+    """
+    # only imported by native workers, the locust path doesn't need asyncio
+    from httpload.httpload import create_native_load_test # pylint: disable=import-outside-toplevel
+    requests = [tuple(request) for request in args["requests"]]
+    run_worker(conn, lambda samplers: create_native_load_test(
+        requests, args["settings"], samplers, args["interval"], args["run_time"],
+        args.get("warm_up", 0)))
+
+def run_worker(conn, create_load_test):
+    """
+    run_worker runs the load test created by the function provided, passing
+    it a sampler that sends stats back to the parent
+    """
+    try:
+        load_test = create_load_test([PipeSampler(conn)])
+        load_test.run()
+        conn.send((FINAL, load_test.stats()))
+    except Exception as err: # pylint: disable=broad-except
+        conn.send((ERROR, str(err)))
+    finally:
+        conn.close()
+
+class PipeSampler:
+    """
+    PipeSampler abstracts sending sampled stats from a worker process to its
+    parent, asking for the load test to stop if the parent says to
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def sample(self, stats, elapsed): # pylint: disable=unused-argument
+        """
+        sample sends the stats to the parent, returning True if the parent
+        has asked the load test to stop
+        """
+        self.conn.send((SAMPLE, stats))
+        return self.conn.poll() and self.conn.recv() == STOP
+
+class MultiProcessLoadTest:
+    """
+    MultiProcessLoadTest abstracts running a load test across worker processes,
+    each running the target provided with its own args, and merging their
+    stats. Stats can be taken while the load test runs, from the most recent
+    sample of each worker
+    """
+    def __init__(self, target, worker_args, sleep=time.sleep, poll_interval=0.1):
+        self.target = target
+        self.worker_args = worker_args
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+        self.connections = []
+        self.latest = []
+
+    def run(self):
+        """
+        run starts the worker processes and waits for them all to finish
+        """
+        # only multi-process load tests use it, keep it out of evaluate's startup
+        import multiprocessing # pylint: disable=import-outside-toplevel
+        # spawn rather than fork, forking a process with a running gevent hub
+        # isn't safe
+        context = multiprocessing.get_context("spawn")
+        processes = []
+        self.connections = []
+        self.latest = [None] * len(self.worker_args)
+        finished = [False] * len(self.worker_args)
+        try:
+            for args in self.worker_args:
+                parent_conn, child_conn = context.Pipe()
+                process = context.Process(target=self.target, args=(child_conn, args), daemon=True)
+                process.start()
+                child_conn.close()
+                processes.append(process)
+                self.connections.append(parent_conn)
+
+            while not all(finished):
+                for i, conn in enumerate(self.connections):
+                    if not finished[i]:
+                        finished[i] = self.__receive(i, conn)
+                if not all(finished):
+                    self.sleep(self.poll_interval)
+        finally:
+            self.stop()
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for conn in self.connections:
+                conn.close()
+
+    def stats(self):
+        """
+        stats returns the merged stats of the workers
+        """
+        return merge_stats([stats for stats in self.latest if stats is not None])
+
+    def stop(self):
+        """
+        stop tells every worker to stop its load test
+        """
+        for conn in self.connections:
+            try:
+                conn.send(STOP)
+            except OSError:
+                # worker already finished
+                pass
+
+    def __receive(self, i, conn):
+        while conn.poll():
+            try:
+                kind, value = conn.recv()
+            except EOFError:
+                raise Exception(f"Load test worker {i} exited without results")
+            if kind == ERROR:
+                raise Exception(f"Load test worker {i} failed: {value}")
+            self.latest[i] = value
+            if kind == FINAL:
+                return True
+        return False
@@ -0,0 +1,249 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import pytest
+from .multiprocess import MultiProcessLoadTest, merge_stats, split_load, SAMPLE, FINAL, ERROR, STOP
+
+def fake_worker(conn, args):
+    if args.get("fail"):
+        conn.send((ERROR, "fail to run tests"))
+        return
+    if args.get("crash"):
+        return
+    conn.send((SAMPLE, {"num_requests": 1}))
+    if args.get("wait_for_stop"):
+        # block until told to stop, as a load test stopped early would
+        while not conn.poll(0.01):
+            pass
+        assert conn.recv() == STOP
+    conn.send((FINAL, {
+        "num_requests": args["num_requests"],
+        "requests": {
+            "GET_/test": {
+                "num_requests": args["num_requests"],
+                "avg_response_time": args["avg_response_time"],
+                "response_times": {args["avg_response_time"]: args["num_requests"]}
+            }
+        }
+    }))
+
+def test_split_load(subtests):
+    test_cases = [
+        {
+            "description": "Single process",
+            "expected": [(10, 5)],
+            "user_count": 10,
+            "hatch_rate": 5,
+            "processes": 1
+        },
+        {
+            "description": "Uneven split",
+            "expected": [(4, 2), (3, 1.5), (3, 1.5)],
+            "user_count": 10,
+            "hatch_rate": 5,
+            "processes": 3
+        },
+        {
+            "description": "More processes than users",
+            "expected": [(1, 1), (1, 1)],
+            "user_count": 2,
+            "hatch_rate": 2,
+            "processes": 8
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == split_load(test_case["user_count"], test_case["hatch_rate"],
+                                                       test_case["processes"])
+
+def test_merge_stats(subtests):
+    test_cases = [
+        {
+            "description": "No stats",
+            "expected": {
+                "requests": {},
+                "failures": {},
+                "num_requests": 0,
+                "num_requests_fail": 0
+            },
+            "stats_list": []
+        },
+        {
+            "description": "Merge two load tests",
+            "expected": {
+                "requests": {
+                    "GET_/test": {
+                        "request_type": "GET",
+                        "num_requests": 4,
+                        "min_response_time": 1,
+                        "max_response_time": 10,
+                        "avg_response_time": 4,
+                        "median_response_time": 2,
+                        "response_times": {1: 1, 2: 2, 10: 1},
+                        "response_time_percentiles": {55: 2, 95: 10},
+                        "total_rps": 3
+                    },
+                    "GET_/other": {
+                        "request_type": "GET",
+                        "num_requests": 0,
+                        "min_response_time": None,
+                        "max_response_time": 0
+                    }
+                },
+                "failures": {
+                    "GET_/test": {
+                        "method": "GET",
+                        "name": "/test",
+                        "error": "500",
+                        "occurrences": 3
+                    }
+                },
+                "num_requests": 4,
+                "num_requests_fail": 3,
+                "start_time": 100,
+                "end_time": 125,
+                "run_time": 21,
+                "stopped_early": True
+            },
+            "stats_list": [
+                {
+                    "requests": {
+                        "GET_/test": {
+                            "request_type": "GET",
+                            "num_requests": 2,
+                            "min_response_time": 1,
+                            "max_response_time": 2,
+                            "avg_response_time": 1.5,
+                            "median_response_time": 1,
+                            "response_times": {1: 1, 2: 1},
+                            "response_time_percentiles": {55: 2, 95: 2},
+                            "total_rps": 1
+                        }
+                    },
+                    "failures": {
+                        "GET_/test": {
+                            "method": "GET",
+                            "name": "/test",
+                            "error": "500",
+                            "occurrences": 1
+                        }
+                    },
+                    "num_requests": 2,
+                    "num_requests_fail": 1,
+                    "start_time": 100,
+                    "end_time": 120,
+                    "run_time": 20,
+                    "stopped_early": False
+                },
+                {
+                    "requests": {
+                        "GET_/test": {
+                            "request_type": "GET",
+                            "num_requests": 2,
+                            "min_response_time": 2,
+                            "max_response_time": 10,
+                            "avg_response_time": 6.5,
+                            "median_response_time": 2,
+                            "response_times": {"2": 1, "10": 1},
+                            "response_time_percentiles": {55: 10, 95: 10},
+                            "total_rps": 2
+                        },
+                        "GET_/other": {
+                            "request_type": "GET",
+                            "num_requests": 0,
+                            "min_response_time": None,
+                            "max_response_time": 0
+                        }
+                    },
+                    "failures": {
+                        "GET_/test": {
+                            "method": "GET",
+                            "name": "/test",
+                            "error": "500",
+                            "occurrences": 2
+                        }
+                    },
+                    "num_requests": 2,
+                    "num_requests_fail": 2,
+                    "start_time": 101,
+                    "end_time": 125,
+                    "run_time": 21,
+                    "stopped_early": True
+                }
+            ]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == merge_stats(test_case["stats_list"])
+
+def test_multi_process_load_test_run(subtests):
+    test_cases = [
+        {
+            "description": "Worker fails",
+            "expected_exception": Exception("Load test worker 1 failed: fail to run tests"),
+            "worker_args": [
+                {"num_requests": 1, "avg_response_time": 1},
+                {"fail": True}
+            ]
+        },
+        {
+            "description": "Worker exits without results",
+            "expected_exception": Exception("Load test worker 0 exited without results"),
+            "worker_args": [
+                {"crash": True}
+            ]
+        },
+        {
+            "description": "Success, stats merged",
+            "expected_num_requests": 4,
+            "expected_avg_response_time": 2.5,
+            "worker_args": [
+                {"num_requests": 2, "avg_response_time": 1},
+                {"num_requests": 2, "avg_response_time": 4}
+            ]
+        },
+        {
+            "description": "Success, stopped by parent",
+            "stop": True,
+            "expected_num_requests": 3,
+            "expected_avg_response_time": 3,
+            "worker_args": [
+                {"num_requests": 3, "avg_response_time": 3, "wait_for_stop": True}
+            ]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            load_test = MultiProcessLoadTest(fake_worker, test_case["worker_args"], poll_interval=0.01)
+            if test_case.get("stop"):
+                # stop once the first sample has arrived, as a sampler would
+                def sleep(seconds):
+                    if load_test.latest[0] is not None:
+                        load_test.stop()
+                    time.sleep(seconds)
+                load_test.sleep = sleep
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    load_test.run()
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                load_test.run()
+                stats = load_test.stats()
+                assert stats["num_requests"] == test_case["expected_num_requests"]
+                assert stats["requests"]["GET_/test"]["avg_response_time"] == test_case["expected_avg_response_time"]
@@ -0,0 +1,559 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Plan handles compiling the evaluation config into a validated plan, resolving
+each target to the request it reads and how to extract its value once, rather
+than on every evaluation
+"""
+import os
+import re
+import math
+import bisect
+import fnmatch
+import hashlib
+import operator
+import itertools
+from histogram.histogram import from_response_times, merge, percentile
+from predict.predict import METHOD_HOLT, METHOD_LINEAR
+
+TARGET_MEAN = "mean"
+TARGET_MEDIAN = "median"
+TARGET_MAX = "max"
+TARGET_MIN = "min"
+TARGET_REQUESTS = "requests"
+TARGET_FAILURES = "failures"
+TARGET_FAILURE_RATIO = "failure_ratio"
+TARGET_RPS = "rps"
+# percentile targets, e.g. p95 or p99.9
+TARGET_PERCENTILE = re.compile(r"^p(\d+(?:\.\d+)?)$")
+
+# the request field each target type reads
+TARGET_FIELDS = {
+    TARGET_MEAN: "avg_response_time",
+    TARGET_MEDIAN: "median_response_time",
+    TARGET_MAX: "max_response_time",
+    TARGET_MIN: "min_response_time",
+    TARGET_REQUESTS: "num_requests",
+    TARGET_FAILURES: "num_failures",
+    TARGET_FAILURE_RATIO: "num_failures",
+    TARGET_RPS: "total_rps"
+}
+HISTOGRAM_FIELD = "response_time_histogram"
+# target types that don't read latency, and any other fields they read
+THROUGHPUT_TYPES = {
+    TARGET_REQUESTS: [],
+    TARGET_FAILURES: [],
+    TARGET_FAILURE_RATIO: ["num_requests"],
+    TARGET_RPS: []
+}
+
+BREACH_ABOVE = "above"
+BREACH_BELOW = "below"
+# target types breached by falling below their target rather than rising above it
+BREACH_BELOW_TYPES = (TARGET_REQUESTS, TARGET_RPS)
+
+MATCH_EXACT = "exact"
+MATCH_GLOB = "glob"
+MATCH_REGEX = "regex"
+
+WINDOW_WORST = "worst"
+WINDOW_LAST = "last"
+
+SCALING_STEP = "step"
+SCALING_PROPORTIONAL = "proportional"
+
+DECAY_FIXED = "fixed"
+DECAY_HEADROOM = "headroom"
+# fraction of its target the worst result must be under before headroom decay scales down
+DEFAULT_DECAY_HEADROOM = 0.8
+# runs a breach at a replica count is remembered for by headroom decay
+DEFAULT_DECAY_BREACH_MEMORY = 40
+
+# ratios of result to target the worst target must go over to scale up, and be at or under to
+# scale down, the defaults scale up on any breach and down with every target met
+DEFAULT_UPPER_BAND = 1
+DEFAULT_LOWER_BAND = 1
+
+def target_field(target_type):
+    """
+    target_field returns the request field the target type provided reads
+    """
+    if target_type in TARGET_FIELDS:
+        return TARGET_FIELDS[target_type]
+    match = TARGET_PERCENTILE.match(str(target_type))
+    if match is None or not 0 < float(match.group(1)) <= 100:
+        raise Exception(f"Unknown target type: {target_type}")
+    return HISTOGRAM_FIELD
+
+def failure_ratio(num_requests, num_failures):
+    """
+    failure_ratio returns the fraction of requests that failed, counting
+    failures separately from successful requests as locust does
+    """
+    total = num_requests + num_failures
+    return num_failures / total if total > 0 else 0
+
+def regex_prefix(pattern):
+    """
+    regex_prefix returns the literal text every match of the regex provided
+    starts with, empty if that can't be determined simply
+    """
+    if "|" in pattern:
+        return ""
+    prefix = re.split(r"[.^$*+?{}\[\]\\()]", pattern, maxsplit=1)[0]
+    # a quantifier straight after the literal makes its last character optional
+    if prefix and len(prefix) < len(pattern) and pattern[len(prefix)] in "*?{":
+        prefix = prefix[:-1]
+    return prefix
+
+def compile_targets(targets):
+    """
+    compile_targets compiles the targets provided, raising on the first
+    target that cannot be compiled
+    """
+    return [Target(target) for target in targets]
+
+def aggregate(requests):
+    """
+    aggregate combines the stats of multiple requests into the stats of a
+    single request, weighting averages by request count and merging response
+    time distributions
+    """
+    if len(requests) == 1:
+        return requests[0]
+    num_requests = sum(request.get("num_requests", 0) for request in requests)
+    aggregated = {
+        "num_requests": num_requests,
+        "num_failures": sum(request.get("num_failures", 0) for request in requests),
+        "max_response_time": max(request.get("max_response_time", 0) for request in requests)
+    }
+    min_response_times = [request["min_response_time"] for request in requests
+                          if request.get("min_response_time") is not None]
+    if min_response_times:
+        aggregated["min_response_time"] = min(min_response_times)
+    for field in ("total_rps", "rps"):
+        if all(field in request for request in requests):
+            aggregated[field] = sum(request[field] for request in requests)
+    if num_requests > 0:
+        for field in ("avg_response_time", "median_response_time"):
+            if all(field in request for request in requests):
+                # a weighted median is only an estimate, replaced below if there are distributions
+                aggregated[field] = sum(request[field] * request.get("num_requests", 0)
+                                        for request in requests) / num_requests
+
+    # carry the distribution through in the same form it was provided
+    histogram = None
+    if all(HISTOGRAM_FIELD in request for request in requests):
+        histogram = merge([request[HISTOGRAM_FIELD] for request in requests])
+        aggregated[HISTOGRAM_FIELD] = histogram
+    elif all("response_times" in request for request in requests):
+        histogram = merge([from_response_times(request["response_times"]) for request in requests])
+        aggregated["response_times"] = dict(histogram)
+    if histogram:
+        aggregated["median_response_time"] = percentile(histogram, 50)
+    return aggregated
+
+def is_integer(value):
+    """
+    is_integer returns if the config value provided is an integer, YAML
+    booleans are ints to Python but not to anyone writing a config
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def is_number(value):
+    """
+    is_number returns if the config value provided is an integer or float
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def config_section(eval_config, name, errors):
+    """
+    config_section returns the optional section of the evaluation config
+    provided, None if it is not set, recording an error if it is set to
+    anything other than a mapping
+    """
+    section = eval_config.get(name)
+    if section is not None and not isinstance(section, dict):
+        errors.append(f"{name} must be a mapping")
+        return None
+    return section
+
+def validate(eval_config): # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    """
+    validate returns every problem found with the evaluation config provided,
+    empty if it is valid
+    """
+    if not isinstance(eval_config, dict):
+        return ["config must be a mapping"]
+
+    errors = []
+    targets = eval_config.get("targets")
+    if not isinstance(targets, list) or not targets:
+        errors.append("targets must be a non-empty list")
+        targets = []
+    for i, target in enumerate(targets):
+        if not isinstance(target, dict):
+            errors.append(f"targets[{i}] must be a mapping")
+            continue
+        try:
+            Target(target)
+        except Exception as err: # pylint: disable=broad-except
+            errors.append(f"targets[{i}]: {str(err)}")
+
+    decay_config = eval_config.get("decay")
+    if not isinstance(decay_config, dict):
+        errors.append("decay must be provided")
+    else:
+        decay_mode = decay_config.get("mode", DECAY_FIXED)
+        if decay_mode not in (DECAY_FIXED, DECAY_HEADROOM):
+            errors.append(f"Unknown decay mode: {decay_mode}")
+        # headroom decay works out how far to scale down itself
+        required = ("unchangedRuns",)
+        if decay_mode == DECAY_FIXED:
+            required = ("replicas", "unchangedRuns")
+        for key in required:
+            if not is_integer(decay_config.get(key)):
+                errors.append(f"decay.{key} must be an integer")
+        for key in ("maxStep", "breachMemory"):
+            if key in decay_config and (not is_integer(decay_config[key]) or decay_config[key] < 1):
+                errors.append(f"decay.{key} must be a positive integer")
+        headroom = decay_config.get("headroom", DEFAULT_DECAY_HEADROOM)
+        if not is_number(headroom) or not 0 < headroom <= 1:
+            errors.append(f"Invalid decay headroom: {headroom}")
+
+    scaling_config = config_section(eval_config, "scaling", errors) or {}
+    if scaling_config.get("mode", SCALING_STEP) not in (SCALING_STEP, SCALING_PROPORTIONAL):
+        errors.append(f"Unknown scaling mode: {scaling_config.get('mode')}")
+    # a step under 1 would have proportional scaling scale down when it should scale up
+    max_step = scaling_config.get("maxStep")
+    if "maxStep" in scaling_config and (not is_integer(max_step) or max_step < 1):
+        errors.append("scaling.maxStep must be a positive integer")
+    for key in ("minReplicas", "maxReplicas"):
+        if key in scaling_config and not is_integer(scaling_config[key]):
+            errors.append(f"scaling.{key} must be an integer")
+    min_replicas = scaling_config.get("minReplicas")
+    max_replicas = scaling_config.get("maxReplicas")
+    if is_integer(min_replicas) and is_integer(max_replicas) and min_replicas > max_replicas:
+        errors.append(f"scaling.minReplicas {min_replicas} is over "
+                      f"scaling.maxReplicas {max_replicas}")
+
+    stabilization_config = config_section(eval_config, "stabilization", errors) or {}
+    upper_band = stabilization_config.get("upperBand", DEFAULT_UPPER_BAND)
+    if not is_number(upper_band) or upper_band < 1:
+        errors.append(f"Invalid stabilization upper band: {upper_band}")
+    lower_band = stabilization_config.get("lowerBand", DEFAULT_LOWER_BAND)
+    if not is_number(lower_band) or not 0 < lower_band <= 1:
+        errors.append(f"Invalid stabilization lower band: {lower_band}")
+    if "consecutiveBreaches" in stabilization_config and (
+            not is_integer(stabilization_config["consecutiveBreaches"])
+            or stabilization_config["consecutiveBreaches"] < 1):
+        errors.append("stabilization.consecutiveBreaches must be a positive integer")
+    for key in ("scaleUpCooldownRuns", "scaleDownCooldownRuns"):
+        if key in stabilization_config and (not is_integer(stabilization_config[key])
+                                            or stabilization_config[key] < 0):
+            errors.append(f"stabilization.{key} must be a non-negative integer")
+
+    adaptive_config = config_section(eval_config, "adaptive", errors)
+    if adaptive_config is not None:
+        confidence = adaptive_config.get("confidence")
+        if "confidence" in adaptive_config and (not is_number(confidence)
+                                                or not 0 < confidence < 1):
+            errors.append(f"Invalid adaptive confidence: {confidence}")
+        min_samples = adaptive_config.get("minSamples")
+        if "minSamples" in adaptive_config and (not is_integer(min_samples) or min_samples < 1):
+            errors.append("adaptive.minSamples must be a positive integer")
+
+    history_config = config_section(eval_config, "history", errors)
+    if history_config is not None:
+        size = history_config.get("size")
+        if "size" in history_config and (not is_integer(size) or size < 1):
+            errors.append(f"Invalid history size: {size}")
+
+    predictive_config = config_section(eval_config, "predictive", errors)
+    if predictive_config is not None:
+        if predictive_config.get("method", METHOD_HOLT) not in (METHOD_HOLT, METHOD_LINEAR):
+            errors.append(f"Unknown predictive method: {predictive_config.get('method')}")
+        # a forecast needs at least one recorded result besides the current one
+        window = predictive_config.get("window")
+        if "window" in predictive_config and (not is_integer(window) or window < 2):
+            errors.append("predictive.window must be an integer of at least 2")
+        for key in ("alpha", "beta"):
+            if key in predictive_config and (not is_number(predictive_config[key])
+                                             or not 0 < predictive_config[key] <= 1):
+                errors.append(f"Invalid predictive {key}: {predictive_config[key]}")
+        if eval_config.get("history") is None:
+            errors.append("Predictive scaling requires history to be enabled")
+    return errors
+
+class Target: # pylint: disable=too-many-instance-attributes
+    """
+    Target abstracts a compiled target, holding the name of the request it
+    reads and an extractor for its value from that request
+    """
+    def __init__(self, target): # pylint: disable=too-many-branches
+        self.method = target.get("method")
+        self.endpoint = target.get("endpoint")
+        self.type = target.get("type")
+        self.value = target.get("target")
+        self.match = target.get("match", MATCH_EXACT)
+        self.name = f"{self.method}_{self.endpoint}"
+        self.field = target_field(self.type)
+        # every field the target reads, throughput targets can read more than one
+        self.fields = [self.field] + THROUGHPUT_TYPES.get(self.type, [])
+        self.latency = self.type not in THROUGHPUT_TYPES
+        default_breach = BREACH_BELOW if self.type in BREACH_BELOW_TYPES else BREACH_ABOVE
+        self.breach = target.get("breach", default_breach)
+        if self.breach not in (BREACH_ABOVE, BREACH_BELOW):
+            raise Exception(f"Unknown breach direction: {self.breach}")
+        self.weight = target.get("weight", 1)
+        if not is_number(self.weight) or self.weight < 0:
+            raise Exception(f"Invalid target weight: {self.weight}")
+        self.pattern = None
+        self.prefix = ""
+        if self.match == MATCH_GLOB:
+            self.pattern = re.compile(fnmatch.translate(str(self.endpoint)))
+            # the literal part before any wildcard rules out most names without running the pattern
+            self.prefix = re.split(r"[*?\[]", str(self.endpoint), maxsplit=1)[0]
+        elif self.match == MATCH_REGEX:
+            try:
+                self.pattern = re.compile(str(self.endpoint))
+            except re.error as err:
+                raise Exception(f"Invalid endpoint pattern: {self.endpoint}: {str(err)}")
+            self.prefix = regex_prefix(str(self.endpoint))
+        elif self.match != MATCH_EXACT:
+            raise Exception(f"Unknown match type: {self.match}")
+
+        self.window = target.get("window")
+        if self.window is not None:
+            self.window_seconds = self.window.get("seconds")
+            self.window_select = self.window.get("select", WINDOW_WORST)
+            if not isinstance(self.window_seconds, (int, float)) or self.window_seconds <= 0:
+                raise Exception(f"Invalid window seconds: {self.window_seconds}")
+            if self.window_select not in (WINDOW_WORST, WINDOW_LAST):
+                raise Exception(f"Unknown window selection: {self.window_select}")
+            # request rates of intervals can't be combined into the rate over a window
+            if self.type == TARGET_RPS:
+                raise Exception(f"Window not supported for target type: {self.type}")
+        if not isinstance(self.value, (int, float)) or isinstance(self.value, bool):
+            raise Exception(f"Invalid target value: {self.value}")
+        # the percentile the target reads, the median being the 50th
+        self.percent = 50.0 if self.type == TARGET_MEDIAN else None
+        if self.field == HISTOGRAM_FIELD:
+            self.percent = float(TARGET_PERCENTILE.match(str(self.type)).group(1))
+            self.extract = self.__percentile
+        elif self.type == TARGET_FAILURE_RATIO:
+            self.extract = lambda request: failure_ratio(request.get("num_requests", 0),
+                                                         request.get("num_failures", 0))
+        else:
+            self.extract = lambda request: request.get(self.field)
+
+    def ratio(self, result):
+        """
+        ratio returns how the result compares to the target, over 1 if the
+        target is breached, with how far over 1 scaled by the target's weight,
+        or 0 whatever the result if the target is weighted 0
+        """
+        if self.weight == 0:
+            # a target weighted 0 is only reported on, it never holds back a scale down either
+            return 0
+        value = self.value
+        if self.breach == BREACH_BELOW:
+            # a result below the target is a breach, so compare the other way round
+            value, result = result, value
+        if value > 0:
+            ratio = result / value
+        else:
+            ratio = math.inf if result > value else 0
+        if ratio <= 1 or self.weight == 1:
+            return ratio
+        return 1 + self.weight * (ratio - 1)
+
+    def window_field(self):
+        """
+        window_field returns the field of each interval of a time series the
+        target reads to calculate its value over a window
+        """
+        return HISTOGRAM_FIELD if self.percent is not None else self.field
+
+    def window_value(self, elapsed, interval_requests):
+        """
+        window_value returns the target's value over the window of the time
+        series provided, either the worst full window or the last window, or
+        None if there were no requests in the window
+        """
+        if not elapsed:
+            return None
+        # an interval is in a window if its midpoint is, so jitter in when
+        # samples were taken doesn't move intervals in and out
+        midpoints = [(end + (elapsed[i - 1] if i > 0 else 0)) / 2 for i, end in enumerate(elapsed)]
+        half_interval = elapsed[-1] / len(elapsed) / 2
+        ends = [len(elapsed) - 1]
+        if self.window_select == WINDOW_WORST:
+            # only full windows, unless the time series is shorter than one
+            full = self.window_seconds - half_interval
+            ends = [i for i, end in enumerate(elapsed) if end >= full] or ends
+
+        values = []
+        for end in ends:
+            start = elapsed[end] - self.window_seconds
+            window = [request
+                      for midpoint, request in zip(midpoints[:end + 1], interval_requests[:end + 1])
+                      if request is not None and midpoint > start]
+            if sum(request.get("num_requests", 0) for request in window) > 0:
+                values.append(self.__window_value(window))
+        if not values:
+            return None
+        # the worst window of a target breached below its value is the lowest
+        return min(values) if self.breach == BREACH_BELOW else max(values)
+
+    def __window_value(self, window):
+        if self.percent is not None:
+            histogram = merge([request.get(HISTOGRAM_FIELD, []) for request in window])
+            return percentile(histogram, self.percent)
+        return self.extract(aggregate(window))
+
+    def __percentile(self, request):
+        histogram = request.get(HISTOGRAM_FIELD)
+        if histogram is None:
+            raise Exception(f"No response time distribution for target: {self.name}")
+        return percentile(histogram, self.percent)
+
+class TargetIndex:
+    """
+    TargetIndex abstracts finding the requests each target reads. Exact targets
+    are looked up by name. The request names are sorted, so the names starting
+    with the method and literal prefix of a pattern target are a single range
+    found by bisection, and only that range is run against the pattern. The
+    grouping for the last set of request names is kept, so names added as a
+    load test runs are the only ones matched
+    """
+    def __init__(self, targets):
+        self.targets = targets
+        self.exact = {}
+        # the start and end of the range of names each pattern target could
+        # match, a function cutting the endpoint out of a name, and the pattern,
+        # None if every name in the range matches
+        self.patterns = []
+        for i, target in enumerate(targets):
+            if target.pattern is None:
+                self.exact.setdefault(target.name, []).append(i)
+                continue
+            start = f"{target.method}_{target.prefix}"
+            # every name starting with the prefix sorts before the prefix with its last character
+            # incremented
+            end = start[:-1] + chr(ord(start[-1]) + 1)
+            endpoint = operator.itemgetter(slice(len(str(target.method)) + 1, None))
+            pattern = target.pattern
+            if target.match == MATCH_GLOB and str(target.endpoint)[len(target.prefix):] == "*":
+                # a glob of a literal prefix then a single wildcard matches the whole range
+                pattern = None
+            self.patterns.append((i, start, end, endpoint, pattern))
+        self.last_names = frozenset()
+        self.last_groups = [[] for _ in targets]
+
+    def match(self, names):
+        """
+        match returns the request names each target reads, in target order
+        """
+        if not self.patterns:
+            return [[target.name] if target.name in names else [] for target in self.targets]
+        key = frozenset(names)
+        if key == self.last_names:
+            return self.last_groups
+        if self.last_names <= key:
+            # names are only added while a load test runs, only match the new ones
+            groups = [list(group) for group in self.last_groups]
+            added = key - self.last_names
+        else:
+            groups = [[] for _ in self.targets]
+            added = key
+        for name in self.exact.keys() & added:
+            for i in self.exact[name]:
+                groups[i].append(name)
+        added = sorted(added)
+        for i, start, end, endpoint, pattern in self.patterns:
+            low = bisect.bisect_left(added, start)
+            high = bisect.bisect_left(added, end, low)
+            if low == high:
+                continue
+            candidates = added[low:high]
+            if pattern is None:
+                groups[i].extend(candidates)
+            else:
+                groups[i].extend(itertools.compress(
+                    candidates, map(pattern.fullmatch, map(endpoint, candidates))))
+        self.last_names = key
+        self.last_groups = groups
+        return groups
+
+    def select(self, requests):
+        """
+        select returns the request each target reads, in target order,
+        aggregating every request matched by a pattern target, or None if a
+        target matches no requests
+        """
+        return [aggregate([requests[name] for name in names]) if names else None
+                for names in self.match(requests)]
+
+    def lookup(self, requests):
+        """
+        lookup returns the request each target reads, in target order, from
+        requests already aggregated under each target's name, or None if
+        there is no result for a target
+        """
+        return [requests.get(target.name) for target in self.targets]
+
+class Plan: # pylint: disable=too-few-public-methods
+    """
+    Plan abstracts a validated evaluation config, its compiled targets and
+    their index, reporting every problem with the config when it is compiled
+    """
+    def __init__(self, eval_config):
+        errors = validate(eval_config)
+        if errors:
+            raise Exception(f"Invalid evaluation config: {'; '.join(errors)}")
+        self.config = eval_config
+        self.targets = compile_targets(eval_config.get("targets"))
+        self.index = TargetIndex(self.targets)
+
+class PlanCache:
+    """
+    PlanCache abstracts compiling the evaluation config file at the path
+    provided, keeping the compiled plan until the file changes. A file that is
+    rewritten with the same content keeps its plan
+    """
+    def __init__(self, path, parse):
+        self.path = path
+        self.parse = parse
+        self.cache_key = None
+        self.content_hash = None
+        self.plan = None
+
+    def get(self):
+        """
+        get returns the compiled plan for the current contents of the
+        evaluation config file
+        """
+        stat = os.stat(self.path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self.cache_key:
+            return self.plan
+        with open(self.path, "rb") as config_file:
+            data = config_file.read()
+        content_hash = hashlib.sha256(data).digest()
+        if content_hash != self.content_hash:
+            self.plan = Plan(self.parse(data))
+            self.content_hash = content_hash
+        self.cache_key = key
+        return self.plan
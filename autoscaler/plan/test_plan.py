@@ -0,0 +1,545 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import math
+import pytest
+from .plan import Plan, PlanCache, Target, TargetIndex, aggregate, compile_targets, regex_prefix
+
+VALID_CONFIG = {
+    "targets": [
+        {"method": "GET", "endpoint": "/a", "type": "mean", "target": 5},
+        {"method": "POST", "endpoint": "/b", "type": "p95", "target": 10}
+    ],
+    "decay": {"replicas": 1, "unchangedRuns": 3}
+}
+
+def test_target_extract(subtests):
+    test_cases = [
+        {
+            "description": "Field target reads its field",
+            "expected": 4,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 5},
+            "request": {"avg_response_time": 4, "max_response_time": 9}
+        },
+        {
+            "description": "Percentile target reads the distribution",
+            "expected": 10,
+            "target": {"method": "GET", "endpoint": "/a", "type": "p90", "target": 5},
+            "request": {"response_time_histogram": [[1, 5], [2, 4], [10, 1]]}
+        },
+        {
+            "description": "Percentile target without a distribution",
+            "expected_exception": Exception("No response time distribution for target: GET_/a"),
+            "target": {"method": "GET", "endpoint": "/a", "type": "p90", "target": 5},
+            "request": {"avg_response_time": 4}
+        },
+        {
+            "description": "Failure ratio counts failures apart from requests",
+            "expected": 0.2,
+            "target": {"method": "GET", "endpoint": "/a", "type": "failure_ratio", "target": 0.1},
+            "request": {"num_requests": 8, "num_failures": 2}
+        },
+        {
+            "description": "Failure ratio with no requests",
+            "expected": 0,
+            "target": {"method": "GET", "endpoint": "/a", "type": "failure_ratio", "target": 0.1},
+            "request": {}
+        },
+        {
+            "description": "Request rate target reads the achieved rate",
+            "expected": 40.5,
+            "target": {"method": "GET", "endpoint": "/a", "type": "rps", "target": 50},
+            "request": {"num_requests": 810, "total_rps": 40.5}
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            target = Target(test_case["target"])
+            assert target.name == "GET_/a"
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    target.extract(test_case["request"])
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == target.extract(test_case["request"])
+
+def test_target_ratio(subtests):
+    test_cases = [
+        {
+            "description": "Latency under target",
+            "expected": 0.5,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 10},
+            "result": 5
+        },
+        {
+            "description": "Latency over target",
+            "expected": 2,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 10},
+            "result": 20
+        },
+        {
+            "description": "Zero target, breached by any result",
+            "expected": math.inf,
+            "target": {"method": "GET", "endpoint": "/a", "type": "failures", "target": 0},
+            "result": 1
+        },
+        {
+            "description": "Request rate breached below target by default",
+            "expected": 2,
+            "target": {"method": "GET", "endpoint": "/a", "type": "rps", "target": 100},
+            "result": 50
+        },
+        {
+            "description": "Request rate over target",
+            "expected": 0.5,
+            "target": {"method": "GET", "endpoint": "/a", "type": "rps", "target": 100},
+            "result": 200
+        },
+        {
+            "description": "No requests, request rate breached",
+            "expected": math.inf,
+            "target": {"method": "GET", "endpoint": "/a", "type": "rps", "target": 100},
+            "result": 0
+        },
+        {
+            "description": "Breach direction overridden",
+            "expected": 2,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 10, "breach": "below"},
+            "result": 5
+        },
+        {
+            "description": "Weight scales how far over target",
+            "expected": 3,
+            "target": {"method": "GET", "endpoint": "/a", "type": "failure_ratio", "target": 0.1, "weight": 2},
+            "result": 0.2
+        },
+        {
+            "description": "Weight doesn't scale results under target",
+            "expected": 0.5,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 10, "weight": 2},
+            "result": 5
+        },
+        {
+            "description": "Zero weight, never breached",
+            "expected": 0,
+            "target": {"method": "GET", "endpoint": "/a", "type": "failures", "target": 0, "weight": 0},
+            "result": 5
+        },
+        {
+            "description": "Zero weight, close to target, never holds back a scale down",
+            "expected": 0,
+            "target": {"method": "GET", "endpoint": "/a", "type": "mean", "target": 10, "weight": 0},
+            "result": 9
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == pytest.approx(Target(test_case["target"]).ratio(test_case["result"]))
+
+def test_aggregate(subtests):
+    test_cases = [
+        {
+            "description": "Single request, unchanged",
+            "expected": {"num_requests": 2, "avg_response_time": 3, "name": "/a"},
+            "requests": [{"num_requests": 2, "avg_response_time": 3, "name": "/a"}]
+        },
+        {
+            "description": "Averages weighted by request count, medians estimated",
+            "expected": {
+                "num_requests": 4,
+                "num_failures": 1,
+                "min_response_time": 1,
+                "max_response_time": 12,
+                "avg_response_time": 3.5,
+                "median_response_time": 4.5
+            },
+            "requests": [
+                {"num_requests": 3, "num_failures": 1, "min_response_time": 1, "max_response_time": 5,
+                 "avg_response_time": 2, "median_response_time": 3},
+                {"num_requests": 1, "min_response_time": 8, "max_response_time": 12,
+                 "avg_response_time": 8, "median_response_time": 9}
+            ]
+        },
+        {
+            "description": "Histograms merged, median from the merged distribution",
+            "expected": {
+                "num_requests": 4,
+                "num_failures": 0,
+                "max_response_time": 9,
+                "median_response_time": 2,
+                "response_time_histogram": [[2, 3], [9, 1]]
+            },
+            "requests": [
+                {"num_requests": 3, "max_response_time": 2, "response_time_histogram": [[2, 3]]},
+                {"num_requests": 1, "max_response_time": 9, "response_time_histogram": [[9, 1]]}
+            ]
+        },
+        {
+            "description": "Raw response times merged in the same form",
+            "expected": {
+                "num_requests": 4,
+                "num_failures": 0,
+                "max_response_time": 9,
+                "median_response_time": 2,
+                "response_times": {2: 3, 9: 1}
+            },
+            "requests": [
+                {"num_requests": 3, "max_response_time": 2, "response_times": {2: 3}},
+                {"num_requests": 1, "max_response_time": 9, "response_times": {9: 1}}
+            ]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == aggregate(test_case["requests"])
+
+def test_regex_prefix(subtests):
+    test_cases = [
+        {"description": "Literal up to a class", "expected": "/users/", "pattern": r"/users/\d+"},
+        {"description": "Optional last character dropped", "expected": "/user", "pattern": "/users?/.*"},
+        {"description": "Alternation, no prefix", "expected": "", "pattern": "/users/.*|/people/.*"},
+        {"description": "Entirely literal", "expected": "/health", "pattern": "/health"},
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == regex_prefix(test_case["pattern"])
+
+def test_target_window_value(subtests):
+    elapsed = [1.01, 1.99, 3.02, 4, 5.01, 6]
+    interval_requests = [
+        {"num_requests": 1, "avg_response_time": 2, "response_time_histogram": [[2, 1]]},
+        {"num_requests": 1, "avg_response_time": 9, "response_time_histogram": [[9, 1]]},
+        {"num_requests": 3, "avg_response_time": 8, "response_time_histogram": [[8, 3]]},
+        None,
+        {"num_requests": 1, "avg_response_time": 1, "response_time_histogram": [[1, 1]]},
+        {"num_requests": 1, "avg_response_time": 3, "response_time_histogram": [[3, 1]]}
+    ]
+    test_cases = [
+        {
+            "description": "Worst full window, weighted by request count",
+            "expected": 8.25,
+            "target": {"type": "mean", "window": {"seconds": 2}}
+        },
+        {
+            "description": "Worst window, percentile",
+            "expected": 9,
+            "target": {"type": "p95", "window": {"seconds": 3, "select": "worst"}}
+        },
+        {
+            "description": "Last window",
+            "expected": 2,
+            "target": {"type": "mean", "window": {"seconds": 3, "select": "last"}}
+        },
+        {
+            "description": "Window longer than the time series, whole series",
+            "expected": 39 / 7,
+            "target": {"type": "mean", "window": {"seconds": 60}}
+        },
+        {
+            "description": "Worst full window of a target breached below, the fewest requests",
+            "expected": 1,
+            "target": {"type": "requests", "window": {"seconds": 2}}
+        },
+        {
+            "description": "Failure ratio over the worst window",
+            "expected": 0,
+            "target": {"type": "failure_ratio", "window": {"seconds": 2}}
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            target = Target(dict(test_case["target"], method="GET", endpoint="/a", target=5))
+            assert test_case["expected"] == pytest.approx(target.window_value(elapsed, interval_requests))
+    # no requests in any window
+    target = Target({"method": "GET", "endpoint": "/a", "type": "max", "target": 5, "window": {"seconds": 2}})
+    assert target.window_value([1, 2], [None, {"num_requests": 0}]) is None
+
+def test_target_index_select(subtests):
+    requests = {
+        "GET_/users/1": {"num_requests": 1, "max_response_time": 4},
+        "GET_/users/2": {"num_requests": 1, "max_response_time": 6},
+        "GET_/users/2/posts": {"num_requests": 1, "max_response_time": 9},
+        "POST_/users/3": {"num_requests": 1, "max_response_time": 20},
+        "GET_/health": {"num_requests": 1, "max_response_time": 1}
+    }
+    test_cases = [
+        {
+            "description": "Exact target",
+            "expected": [1],
+            "targets": [{"method": "GET", "endpoint": "/health", "type": "max", "target": 5}]
+        },
+        {
+            "description": "Glob matches across path segments within the method",
+            "expected": [9],
+            "targets": [{"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "max", "target": 5}]
+        },
+        {
+            "description": "Regex matches the whole endpoint",
+            "expected": [6],
+            "targets": [{"method": "GET", "endpoint": r"/users/\d+", "match": "regex", "type": "max", "target": 5}]
+        },
+        {
+            "description": "A request can match multiple targets",
+            "expected": [20, 20],
+            "targets": [
+                {"method": "POST", "endpoint": "/users/?", "match": "glob", "type": "max", "target": 5},
+                {"method": "POST", "endpoint": "/users/.*", "match": "regex", "type": "max", "target": 5}
+            ]
+        },
+        {
+            "description": "No matches",
+            "expected": [None, None],
+            "targets": [
+                {"method": "DELETE", "endpoint": "/users/*", "match": "glob", "type": "max", "target": 5},
+                {"method": "GET", "endpoint": "/missing", "type": "max", "target": 5}
+            ]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            index = TargetIndex(compile_targets(test_case["targets"]))
+            # second selection reads matches remembered from the first
+            for _ in range(2):
+                selected = index.select(requests)
+                assert test_case["expected"] == [None if request is None else request["max_response_time"]
+                                                 for request in selected]
+
+def test_target_index_match(subtests):
+    targets = [
+        {"method": "GET", "endpoint": "/users/*", "match": "glob", "type": "max", "target": 5},
+        {"method": "GET", "endpoint": "/users/*/posts", "match": "glob", "type": "max", "target": 5},
+        {"method": "GET", "endpoint": "/users/1", "type": "max", "target": 5}
+    ]
+    # each set of names is matched after the one before, as samples of a load test are
+    test_cases = [
+        {
+            "description": "First names",
+            "expected": [["GET_/users/1"], [], ["GET_/users/1"]],
+            "names": ["GET_/users/1", "GET_/health"]
+        },
+        {
+            "description": "Names added",
+            "expected": [["GET_/users/1", "GET_/users/1/posts", "GET_/users/2"], ["GET_/users/1/posts"],
+                         ["GET_/users/1"]],
+            "names": ["GET_/users/1", "GET_/health", "GET_/users/2", "GET_/users/1/posts", "POST_/users/3"]
+        },
+        {
+            "description": "Names removed",
+            "expected": [["GET_/users/2"], [], []],
+            "names": ["GET_/users/2", "GET_/usersx"]
+        },
+    ]
+
+    index = TargetIndex(compile_targets(targets))
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            names = {name: {} for name in test_case["names"]}
+            assert test_case["expected"] == [sorted(group) for group in index.match(names)]
+
+def test_plan(subtests):
+    test_cases = [
+        {
+            "description": "Not a mapping",
+            "expected_exception": Exception("Invalid evaluation config: config must be a mapping"),
+            "eval_config": None
+        },
+        {
+            "description": "Every problem reported together",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets[0]: Unknown target type: p101; "
+                "targets[1]: Invalid target value: fast; decay.unchangedRuns must be an integer; "
+                "Unknown scaling mode: invalid"),
+            "eval_config": {
+                "targets": [
+                    {"method": "GET", "endpoint": "/a", "type": "p101", "target": 5},
+                    {"method": "GET", "endpoint": "/b", "type": "max", "target": "fast"}
+                ],
+                "decay": {"replicas": 1},
+                "scaling": {"mode": "invalid"}
+            }
+        },
+        {
+            "description": "Invalid match type and pattern",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets[0]: Unknown match type: fuzzy; "
+                "targets[1]: Invalid endpoint pattern: /users/(: missing ), unterminated subpattern at position 7"),
+            "eval_config": dict(VALID_CONFIG, targets=[
+                {"method": "GET", "endpoint": "/a", "match": "fuzzy", "type": "mean", "target": 5},
+                {"method": "GET", "endpoint": "/users/(", "match": "regex", "type": "mean", "target": 5}
+            ])
+        },
+        {
+            "description": "Invalid windows",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets[0]: Invalid window seconds: 0; "
+                "targets[1]: Unknown window selection: best"),
+            "eval_config": dict(VALID_CONFIG, targets=[
+                {"method": "GET", "endpoint": "/a", "type": "mean", "target": 5, "window": {"seconds": 0}},
+                {"method": "GET", "endpoint": "/a", "type": "mean", "target": 5,
+                 "window": {"seconds": 5, "select": "best"}}
+            ])
+        },
+        {
+            "description": "No targets, no decay",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets must be a non-empty list; decay must be provided"),
+            "eval_config": {"targets": []}
+        },
+        {
+            "description": "Predictive without history",
+            "expected_exception": Exception(
+                "Invalid evaluation config: Unknown predictive method: invalid; "
+                "Predictive scaling requires history to be enabled"),
+            "eval_config": dict(VALID_CONFIG, predictive={"method": "invalid"})
+        },
+        {
+            "description": "Invalid adaptive and history sections",
+            "expected_exception": Exception(
+                "Invalid evaluation config: Invalid adaptive confidence: 1.5; Invalid history size: 0"),
+            "eval_config": dict(VALID_CONFIG, adaptive={"confidence": 1.5}, history={"size": 0})
+        },
+        {
+            "description": "Wrongly typed adaptive, history and predictive values",
+            "expected_exception": Exception(
+                "Invalid evaluation config: decay.replicas must be an integer; Invalid adaptive confidence: high; "
+                "adaptive.minSamples must be a positive integer; Invalid history size: big; "
+                "predictive.window must be an integer of at least 2; Invalid predictive alpha: 0"),
+            "eval_config": dict(VALID_CONFIG, decay={"replicas": True, "unchangedRuns": 3},
+                                adaptive={"confidence": "high", "minSamples": "x"}, history={"size": "big"},
+                                predictive={"window": "x", "alpha": 0})
+        },
+        {
+            "description": "Sections that are not mappings",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets[0] must be a mapping; scaling must be a mapping; "
+                "adaptive must be a mapping; history must be a mapping"),
+            "eval_config": dict(VALID_CONFIG, targets=["GET /a"], scaling=["proportional"], adaptive=True,
+                                history=5)
+        },
+        {
+            "description": "Invalid scaling limits",
+            "expected_exception": Exception(
+                "Invalid evaluation config: scaling.maxStep must be a positive integer; "
+                "scaling.minReplicas 5 is over scaling.maxReplicas 2"),
+            "eval_config": dict(VALID_CONFIG, scaling={"mode": "proportional", "maxStep": 0, "minReplicas": 5,
+                                                       "maxReplicas": 2})
+        },
+        {
+            "description": "Negative scaling step",
+            "expected_exception": Exception("Invalid evaluation config: scaling.maxStep must be a positive integer"),
+            "eval_config": dict(VALID_CONFIG, scaling={"mode": "proportional", "maxStep": -2})
+        },
+        {
+            "description": "Invalid headroom decay",
+            "expected_exception": Exception(
+                "Invalid evaluation config: decay.maxStep must be a positive integer; Invalid decay headroom: 1.5"),
+            "eval_config": dict(VALID_CONFIG, decay={"mode": "headroom", "unchangedRuns": 3, "maxStep": 0,
+                                                     "headroom": 1.5})
+        },
+        {
+            "description": "Invalid throughput targets",
+            "expected_exception": Exception(
+                "Invalid evaluation config: targets[0]: Unknown breach direction: sideways; "
+                "targets[1]: Invalid target weight: -1; targets[2]: Window not supported for target type: rps"),
+            "eval_config": dict(VALID_CONFIG, targets=[
+                {"method": "GET", "endpoint": "/a", "type": "failure_ratio", "target": 0.1, "breach": "sideways"},
+                {"method": "GET", "endpoint": "/a", "type": "rps", "target": 5, "weight": -1},
+                {"method": "GET", "endpoint": "/a", "type": "rps", "target": 5, "window": {"seconds": 5}}
+            ])
+        },
+        {
+            "description": "Invalid stabilization",
+            "expected_exception": Exception(
+                "Invalid evaluation config: Invalid stabilization upper band: 0.9; "
+                "Invalid stabilization lower band: 0; stabilization.consecutiveBreaches must be a positive integer; "
+                "stabilization.scaleDownCooldownRuns must be a non-negative integer"),
+            "eval_config": dict(VALID_CONFIG, stabilization={"upperBand": 0.9, "lowerBand": 0, "consecutiveBreaches": 0,
+                                                             "scaleUpCooldownRuns": 0, "scaleDownCooldownRuns": -1})
+        },
+        {
+            "description": "Stabilization, bands around the target",
+            "expected": [("GET_/a", "avg_response_time"), ("POST_/b", "response_time_histogram")],
+            "eval_config": dict(VALID_CONFIG, stabilization={"upperBand": 1.2, "lowerBand": 0.7,
+                                                             "consecutiveBreaches": 2, "scaleUpCooldownRuns": 1,
+                                                             "scaleDownCooldownRuns": 5})
+        },
+        {
+            "description": "Unknown decay mode",
+            "expected_exception": Exception("Invalid evaluation config: Unknown decay mode: random"),
+            "eval_config": dict(VALID_CONFIG, decay={"mode": "random", "replicas": 1, "unchangedRuns": 3})
+        },
+        {
+            "description": "Headroom decay, no decay replicas needed",
+            "expected": [("GET_/a", "avg_response_time"), ("POST_/b", "response_time_histogram")],
+            "eval_config": dict(VALID_CONFIG, decay={"mode": "headroom", "unchangedRuns": 3})
+        },
+        {
+            "description": "Success, targets compiled in order",
+            "expected": [("GET_/a", "avg_response_time"), ("POST_/b", "response_time_histogram")],
+            "eval_config": VALID_CONFIG
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    Plan(test_case["eval_config"])
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                plan = Plan(test_case["eval_config"])
+                assert plan.config == test_case["eval_config"]
+                assert test_case["expected"] == [(target.name, target.field) for target in plan.targets]
+
+def test_plan_cache(tmp_path):
+    path = tmp_path / "evaluation_config.json"
+    path.write_text(json.dumps(VALID_CONFIG))
+    parsed = []
+    def parse(data):
+        parsed.append(data)
+        return json.loads(data.decode())
+    cache = PlanCache(str(path), parse)
+
+    plan = cache.get()
+    assert [target.name for target in plan.targets] == ["GET_/a", "POST_/b"]
+    # unchanged file, not parsed again
+    assert cache.get() is plan
+    assert len(parsed) == 1
+
+    # rewritten with the same content, plan kept
+    path.write_text(json.dumps(VALID_CONFIG))
+    os.utime(str(path), ns=(0, 0))
+    assert cache.get() is plan
+    assert len(parsed) == 1
+
+    # changed content, recompiled
+    path.write_text(json.dumps(dict(VALID_CONFIG, targets=VALID_CONFIG["targets"][:1])))
+    assert [target.name for target in cache.get().targets] == ["GET_/a"]
+    assert len(parsed) == 2
+
+    # invalid content reported, and not cached
+    path.write_text(json.dumps({"targets": []}))
+    for _ in range(2):
+        with pytest.raises(Exception) as ex:
+            cache.get()
+        assert str(ex.value).startswith("Invalid evaluation config:")
+    assert len(parsed) == 4
@@ -0,0 +1,101 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Predict handles forecasting latency at the next interval from the trend of
+recent results, so a resource can be scaled before a target is breached
+"""
+import math
+
+METHOD_HOLT = "holt"
+METHOD_LINEAR = "linear"
+
+DEFAULT_WINDOW = 10
+DEFAULT_ALPHA = 0.5
+DEFAULT_BETA = 0.3
+# fewest points a trend is fitted to
+MIN_POINTS = 3
+
+def forecast_holt(series, alpha, beta):
+    """
+    forecast_holt forecasts the next value of the series using Holt's linear
+    exponential smoothing
+    """
+    level = series[0]
+    trend = series[1] - series[0]
+    for value in series[1:]:
+        previous_level = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+    return level + trend
+
+def forecast_linear(series):
+    """
+    forecast_linear forecasts the next value of the series by extending a
+    least squares linear fit
+    """
+    count = len(series)
+    mean_x = (count - 1) / 2
+    mean_y = sum(series) / count
+    variance_x = sum((x - mean_x) ** 2 for x in range(count))
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(series)) / variance_x
+    return mean_y + slope * (count - mean_x)
+
+class Predict:
+    """
+    Predict abstracts forecasting the replica count needed at the next
+    interval. Latency is treated as inversely proportional to replica count,
+    so each result is normalised to latency multiplied by replicas, a measure
+    of demand that is comparable across replica counts. The demand trend is
+    forecast for each target, and the replicas needed to bring the forecast
+    latency under target calculated. Targets that are None are not forecast
+    """
+    def __init__(self, predictive_config, targets):
+        self.method = predictive_config.get("method", METHOD_HOLT)
+        if self.method not in (METHOD_HOLT, METHOD_LINEAR):
+            raise Exception(f"Unknown predictive method: {self.method}")
+        self.window = int(predictive_config.get("window", DEFAULT_WINDOW))
+        self.alpha = float(predictive_config.get("alpha", DEFAULT_ALPHA))
+        self.beta = float(predictive_config.get("beta", DEFAULT_BETA))
+        self.targets = targets
+
+    def get(self, history_entries, results, current_replicas):
+        """
+        get returns the replica count needed for every target's forecast
+        latency to be under target, or the current replica count if none are
+        forecast to go over or there isn't enough history to forecast from
+        """
+        # the recorded history, followed by the current results as the newest point
+        history_entries = history_entries[max(0, len(history_entries) - (self.window - 1)):]
+        points = [(entry["latencies"], entry["replicas"]) for entry in history_entries]
+        points.append((results, current_replicas))
+        if len(points) < MIN_POINTS:
+            return current_replicas
+
+        target_replica_count = current_replicas
+        for i, target in enumerate(self.targets):
+            if target is None:
+                continue
+            target_value = target.get("target")
+            if target_value <= 0:
+                continue
+            demand = self.__forecast([latencies[i] * replicas for latencies, replicas in points])
+            if current_replicas > 0 and demand / current_replicas <= target_value:
+                continue
+            target_replica_count = max(target_replica_count, math.ceil(demand / target_value))
+        return target_replica_count
+
+    def __forecast(self, series):
+        if self.method == METHOD_LINEAR:
+            return forecast_linear(series)
+        return forecast_holt(series, self.alpha, self.beta)
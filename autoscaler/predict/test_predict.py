@@ -0,0 +1,119 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from .predict import Predict, forecast_holt, forecast_linear
+
+def test_forecast(subtests):
+    test_cases = [
+        {
+            "description": "Linear, flat series",
+            "expected": 5,
+            "forecast": lambda: forecast_linear([5, 5, 5])
+        },
+        {
+            "description": "Linear, rising series",
+            "expected": 8,
+            "forecast": lambda: forecast_linear([2, 4, 6])
+        },
+        {
+            "description": "Holt, flat series",
+            "expected": 5,
+            "forecast": lambda: forecast_holt([5, 5, 5], 0.5, 0.3)
+        },
+        {
+            "description": "Holt, steady trend extended",
+            "expected": 8,
+            "forecast": lambda: forecast_holt([2, 4, 6], 0.5, 0.3)
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == pytest.approx(test_case["forecast"]())
+
+def history_entries(latencies, replicas):
+    return [{"latencies": [latency], "replicas": replica} for latency, replica in zip(latencies, replicas)]
+
+def test_predict_get(subtests):
+    test_cases = [
+        {
+            "description": "Unknown method",
+            "expected_exception": Exception("Unknown predictive method: invalid"),
+            "config": {"method": "invalid"},
+            "history": [],
+            "results": [5],
+            "current_replicas": 2
+        },
+        {
+            "description": "Not enough history, no prediction",
+            "expected": 2,
+            "config": {"method": "linear"},
+            "history": history_entries([2], [2]),
+            "results": [9],
+            "current_replicas": 2
+        },
+        {
+            "description": "Flat under target, no change",
+            "expected": 2,
+            "config": {"method": "linear"},
+            "history": history_entries([5, 5], [2, 2]),
+            "results": [5],
+            "current_replicas": 2
+        },
+        {
+            "description": "Rising, forecast over target, pre-scale",
+            "expected": 3,
+            "config": {"method": "linear"},
+            "history": history_entries([5, 6], [2, 2]),
+            "results": [7],
+            "current_replicas": 2
+        },
+        {
+            "description": "Rising demand across a scale up, forecast over target, pre-scale",
+            "expected": 4,
+            "config": {"method": "linear"},
+            "history": history_entries([6, 7], [2, 2]),
+            "results": [8],
+            "current_replicas": 3
+        },
+        {
+            "description": "Window limits history used",
+            "expected": 2,
+            "config": {"method": "linear", "window": 3},
+            "history": history_entries([1, 2, 5, 5], [2, 2, 2, 2]),
+            "results": [5],
+            "current_replicas": 2
+        },
+        {
+            "description": "Holt, rising, pre-scale",
+            "expected": 3,
+            "config": {},
+            "history": history_entries([5, 6], [2, 2]),
+            "results": [7],
+            "current_replicas": 2
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            targets = [{"method": "GET", "endpoint": "/test", "type": "mean", "target": 7.5}]
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    Predict(test_case["config"], targets)
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                predict = Predict(test_case["config"], targets)
+                assert test_case["expected"] == predict.get(test_case["history"], test_case["results"],
+                                                            test_case["current_replicas"])
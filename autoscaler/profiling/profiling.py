@@ -0,0 +1,204 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Profiling handles running autoscaler modes under a profiler when asked to,
+writing a profile of each run to a directory kept under a size limit
+"""
+import os
+import sys
+import time
+import random
+import signal
+import marshal
+import threading
+from state.state import replace_file
+
+PROFILE_DETERMINISTIC = "deterministic"
+PROFILE_SAMPLING = "sampling"
+
+DEFAULT_PROFILE_DIRECTORY = "/tmp/locust-autoscaler-profiles"
+DEFAULT_PROFILE_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_SAMPLING_INTERVAL = 0.005
+
+PROFILE_PREFIX = "profile-"
+# deterministic profiles can be read with pstats, sampled profiles are collapsed
+# stacks as read by flamegraph.pl and speedscope
+PROFILE_EXTENSIONS = {
+    PROFILE_DETERMINISTIC: ".prof",
+    PROFILE_SAMPLING: ".folded"
+}
+
+def parse_modes(modes):
+    """
+    parse_modes converts a comma separated list of modes into a set
+    """
+    return {mode.strip() for mode in modes.split(",") if mode.strip() != ""}
+
+def rotate(directory, max_bytes):
+    """
+    rotate deletes the oldest profiles in the directory until their total size
+    is within the max bytes provided, always keeping the newest profile
+    """
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.startswith(PROFILE_PREFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        profiles.append((stat.st_mtime_ns, name, stat.st_size))
+    profiles.sort()
+    total = sum(size for _, _, size in profiles)
+    for _, name, size in profiles[:-1]:
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(os.path.join(directory, name))
+        except FileNotFoundError:
+            # already removed by another run
+            pass
+        total -= size
+
+class StackSampler:
+    """
+    StackSampler abstracts a sampling profiler, recording the main thread's
+    stack each time the process has used the interval provided of CPU time.
+    Samples are taken from a SIGPROF handler, so it works whether or not
+    threads have been monkey patched by gevent. Dumped the same way as a
+    cProfile profile
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = {}
+        self.previous_handler = None
+
+    def enable(self):
+        """
+        enable starts sampling, must be called from the main thread
+        """
+        if threading.current_thread() is not threading.main_thread():
+            raise Exception("Sampling profiler must be started from the main thread")
+        self.previous_handler = signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        """
+        disable stops sampling
+        """
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def dump_stats(self, path):
+        """
+        dump_stats writes the sampled stacks to the path provided in the collapsed
+        stack format, root first with a count of samples on each line
+        """
+        with open(path, "w") as profile_file:
+            self.write(profile_file)
+
+    def write(self, profile_file):
+        """
+        write writes the sampled stacks to the file provided, as dump_stats does
+        """
+        for stack, count in sorted(self.stacks.items()):
+            profile_file.write(f"{';'.join(stack)} {count}\n")
+
+    def __sample(self, signum, frame): # pylint: disable=unused-argument
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack = tuple(reversed(stack))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+class Profiler: # pylint: disable=too-many-instance-attributes
+    """
+    Profiler abstracts profiling a sampled fraction of the runs of the modes
+    provided, with either a deterministic (cProfile) or sampling profiler,
+    writing each profile to the directory provided and rotating out the
+    oldest profiles once they take up more than the max bytes
+    """
+    def __init__(self, modes, # pylint: disable=too-many-arguments
+                 directory=DEFAULT_PROFILE_DIRECTORY, profile_type=PROFILE_DETERMINISTIC,
+                 sample_rate=1, max_bytes=DEFAULT_PROFILE_MAX_BYTES,
+                 sampling_interval=DEFAULT_SAMPLING_INTERVAL, rand=random.random, clock=time.time):
+        if profile_type not in PROFILE_EXTENSIONS:
+            raise ValueError(f"Unknown profile type: {profile_type}")
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"Invalid profile sample rate: {sample_rate}")
+        if max_bytes <= 0:
+            raise ValueError(f"Invalid profile max bytes: {max_bytes}")
+        if sampling_interval <= 0:
+            raise ValueError(f"Invalid profile sampling interval: {sampling_interval}")
+        self.modes = modes
+        self.directory = directory
+        self.profile_type = profile_type
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.sampling_interval = sampling_interval
+        self.rand = rand
+        self.clock = clock
+
+    def wrap(self, mode, handler):
+        """
+        wrap returns the handler for the mode provided, profiled if the mode
+        is one being profiled and the run is sampled
+        """
+        if mode not in self.modes:
+            return handler
+        def run():
+            if self.rand() >= self.sample_rate:
+                return handler()
+            try:
+                profiler = self.__create()
+                profiler.enable()
+            except Exception as err: # pylint: disable=broad-except
+                # failing to start profiling must not fail the run
+                sys.stderr.write(f"Failed to start profiler, not profiling: {str(err)}\n")
+                return handler()
+            try:
+                return handler()
+            finally:
+                profiler.disable()
+                try:
+                    self.__write(mode, profiler)
+                except OSError as err:
+                    # failing to write a profile must not fail the run
+                    sys.stderr.write(f"Failed to write profile to {self.directory}: {str(err)}\n")
+        return run
+
+    def __create(self):
+        if self.profile_type == PROFILE_SAMPLING:
+            return StackSampler(self.sampling_interval)
+        # only imported when profiling, to keep it out of normal runs
+        import cProfile # pylint: disable=import-outside-toplevel
+        return cProfile.Profile()
+
+    def __write(self, mode, profiler):
+        os.makedirs(self.directory, exist_ok=True)
+        extension = PROFILE_EXTENSIONS[self.profile_type]
+        name = f"{PROFILE_PREFIX}{mode}-{int(self.clock() * 1000)}-{os.getpid()}{extension}"
+        if self.profile_type == PROFILE_SAMPLING:
+            write, mode = profiler.write, "w"
+        else:
+            def write(profile_file):
+                # as cProfile's dump_stats does, to a file rather than a path
+                profiler.create_stats()
+                marshal.dump(profiler.stats, profile_file)
+            mode = "wb"
+        # written to a temporary file first, so a partial profile is never left behind
+        replace_file(os.path.join(self.directory, name), write, mode, ".profile-", sync=False)
+        rotate(self.directory, self.max_bytes)
@@ -0,0 +1,157 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import pstats
+import threading
+import pytest
+from .profiling import Profiler, parse_modes, rotate, PROFILE_SAMPLING
+
+def busy(seconds):
+    end = time.process_time() + seconds
+    total = 0
+    while time.process_time() < end:
+        total += 1
+    return total
+
+def test_parse_modes(subtests):
+    test_cases = [
+        {
+            "description": "Empty, no modes",
+            "expected": set(),
+            "modes": ""
+        },
+        {
+            "description": "Multiple modes, whitespace ignored",
+            "expected": {"metric", "evaluate"},
+            "modes": "metric, evaluate,"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == parse_modes(test_case["modes"])
+
+def test_profiler_invalid(subtests):
+    test_cases = [
+        {
+            "description": "Unknown profile type",
+            "expected_exception": ValueError("Unknown profile type: invalid"),
+            "kwargs": {"profile_type": "invalid"}
+        },
+        {
+            "description": "Sample rate above 1",
+            "expected_exception": ValueError("Invalid profile sample rate: 2"),
+            "kwargs": {"sample_rate": 2}
+        },
+        {
+            "description": "No max bytes",
+            "expected_exception": ValueError("Invalid profile max bytes: 0"),
+            "kwargs": {"max_bytes": 0}
+        },
+        {
+            "description": "Negative sampling interval",
+            "expected_exception": ValueError("Invalid profile sampling interval: -1"),
+            "kwargs": {"sampling_interval": -1}
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                Profiler({"evaluate"}, **test_case["kwargs"])
+
+def test_profiler_wrap(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Mode not profiled, no profile written",
+            "expected_profiles": 0,
+            "mode": "metric",
+            "rand": 0
+        },
+        {
+            "description": "Run not sampled, no profile written",
+            "expected_profiles": 0,
+            "mode": "evaluate",
+            "rand": 0.5
+        },
+        {
+            "description": "Run sampled, profile written",
+            "expected_profiles": 1,
+            "mode": "evaluate",
+            "rand": 0.1
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            directory = tmp_path / f"profiles_{i}"
+            profiler = Profiler({"evaluate"}, directory=str(directory), sample_rate=0.25,
+                                rand=lambda: test_case["rand"])
+            assert profiler.wrap(test_case["mode"], lambda: "result")() == "result"
+            profiles = os.listdir(str(directory)) if directory.exists() else []
+            assert len(profiles) == test_case["expected_profiles"]
+
+def test_profiler_deterministic(tmp_path):
+    profiler = Profiler({"evaluate"}, directory=str(tmp_path), clock=lambda: 1.5)
+
+    def handler():
+        busy(0.01)
+        raise Exception("fail")
+
+    # failing runs are profiled too
+    with pytest.raises(Exception, match="fail"):
+        profiler.wrap("evaluate", handler)()
+    assert os.listdir(str(tmp_path)) == [f"profile-evaluate-1500-{os.getpid()}.prof"]
+    stats = pstats.Stats(str(tmp_path / f"profile-evaluate-1500-{os.getpid()}.prof"))
+    assert any(function == "busy" for _, _, function in stats.stats)
+
+def test_profiler_sampling(tmp_path):
+    profiler = Profiler({"metric"}, directory=str(tmp_path), profile_type=PROFILE_SAMPLING,
+                        sampling_interval=0.001, clock=lambda: 2)
+    profiler.wrap("metric", lambda: busy(0.2))()
+    path = tmp_path / f"profile-metric-2000-{os.getpid()}.folded"
+    lines = path.read_text().splitlines()
+    assert lines
+    # root first, with the sampled function as the leaf
+    assert any(line.rsplit(" ", 1)[0].split(";")[-1].startswith("busy ") for line in lines)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+def test_profiler_start_failure(tmp_path, capsys):
+    profiler = Profiler({"evaluate"}, directory=str(tmp_path), profile_type=PROFILE_SAMPLING)
+    results = []
+    # the sampling profiler can't be started off the main thread, the run goes ahead unprofiled
+    thread = threading.Thread(target=lambda: results.append(profiler.wrap("evaluate", lambda: "result")()))
+    thread.start()
+    thread.join()
+    assert results == ["result"]
+    assert os.listdir(str(tmp_path)) == []
+    assert capsys.readouterr().err == ("Failed to start profiler, not profiling: "
+                                       "Sampling profiler must be started from the main thread\n")
+
+def test_rotate(tmp_path):
+    for i, size in enumerate([40, 30, 20, 50]):
+        path = tmp_path / f"profile-evaluate-{i}.prof"
+        path.write_bytes(b"x" * size)
+        os.utime(str(path), ns=(i * 10 ** 9, i * 10 ** 9))
+    (tmp_path / "other").write_bytes(b"x" * 1000)
+
+    rotate(str(tmp_path), 90)
+    # oldest removed until within the limit, other files untouched
+    assert sorted(os.listdir(str(tmp_path))) == ["other", "profile-evaluate-2.prof", "profile-evaluate-3.prof"]
+
+    rotate(str(tmp_path), 10)
+    # the newest profile is always kept
+    assert sorted(os.listdir(str(tmp_path))) == ["other", "profile-evaluate-3.prof"]
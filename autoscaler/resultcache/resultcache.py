@@ -0,0 +1,145 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Result cache handles reusing recent metric results, so dry runs and repeated
+or simultaneous metric calls don't each run another load test
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import contextlib
+from state.state import replace_file
+
+DEFAULT_CACHE_DIRECTORY = "/tmp/locust-autoscaler-cache"
+DEFAULT_CACHE_MAX_ENTRIES = 100
+
+ENTRY_SUFFIX = ".json"
+LOCK_SUFFIX = ".lock"
+
+def cache_key(*parts):
+    """
+    cache_key returns a key identifying the JSON serializable parts provided
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def file_hash(path):
+    """
+    file_hash returns a hash of the file's content, or None if it doesn't
+    exist
+    """
+    try:
+        with open(path, "rb") as hashed_file:
+            return hashlib.sha256(hashed_file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+class ResultCache:
+    """
+    ResultCache abstracts a directory of results, each stored in its own file
+    under its key and reused until it is older than the TTL in seconds. Once
+    there are more than the max entries the oldest are evicted. Results are
+    shared between processes, and a process computing a result holds a lock
+    on its key so others wait for it rather than computing it again
+    """
+    def __init__(self, directory, ttl, max_entries=DEFAULT_CACHE_MAX_ENTRIES, clock=time.time):
+        if ttl <= 0:
+            raise ValueError(f"Invalid metric cache TTL: {ttl}")
+        if max_entries < 1:
+            raise ValueError(f"Invalid metric cache max entries: {max_entries}")
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+
+    def fetch(self, key, compute):
+        """
+        fetch returns the fresh cached result for the key provided, or
+        computes, stores and returns it, along with whether it was cached
+        """
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        with self.lock(key):
+            # another process may have stored it while this one waited
+            result = self.get(key)
+            if result is not None:
+                return result, True
+            result = compute()
+            self.put(key, result)
+        return result, False
+
+    def get(self, key):
+        """
+        get returns the cached result for the key provided, or None if there
+        is none or it is older than the TTL
+        """
+        try:
+            with open(self.__path(key, ENTRY_SUFFIX), "r") as entry_file:
+                entry = json.load(entry_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not isinstance(entry, dict) or self.clock() - entry.get("stored", 0) >= self.ttl:
+            return None
+        return entry.get("result")
+
+    def put(self, key, result):
+        """
+        put stores the result for the key provided, evicting the oldest
+        entries if there are more than the max entries
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"stored": self.clock(), "result": result}
+        # a lost entry only costs a load test, not worth syncing
+        replace_file(self.__path(key, ENTRY_SUFFIX),
+                     lambda entry_file: json.dump(entry, entry_file, separators=(",", ":")),
+                     prefix=".cache-", sync=False)
+        self.__evict()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        lock holds an exclusive lock on the key provided, shared between
+        processes
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.__path(key, LOCK_SUFFIX), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def __path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def __evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX) or name.startswith("."):
+                continue
+            try:
+                entries.append((os.stat(os.path.join(self.directory, name)).st_mtime_ns, name))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, name in entries[:max(0, len(entries) - self.max_entries)]:
+            key = name[:-len(ENTRY_SUFFIX)]
+            for suffix in (ENTRY_SUFFIX, LOCK_SUFFIX):
+                try:
+                    os.unlink(self.__path(key, suffix))
+                except FileNotFoundError:
+                    # already evicted by another process
+                    pass
@@ -0,0 +1,151 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import threading
+import pytest
+from .resultcache import ResultCache, cache_key, file_hash
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_cache_key(subtests):
+    test_cases = [
+        {
+            "description": "Same parts, same key",
+            "expected": True,
+            "a": (["default", "app", 3], {"run_time": 20, "host": "http://app"}),
+            "b": (["default", "app", 3], {"host": "http://app", "run_time": 20})
+        },
+        {
+            "description": "Different replicas, different key",
+            "expected": False,
+            "a": (["default", "app", 3], {"run_time": 20}),
+            "b": (["default", "app", 4], {"run_time": 20})
+        },
+        {
+            "description": "Different settings, different key",
+            "expected": False,
+            "a": (["default", "app", 3], {"run_time": 20}),
+            "b": (["default", "app", 3], {"run_time": 30})
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == (cache_key(*test_case["a"]) == cache_key(*test_case["b"]))
+
+def test_file_hash(tmp_path):
+    path = tmp_path / "locustfile.py"
+    assert file_hash(str(path)) is None
+    path.write_text("a")
+    first = file_hash(str(path))
+    path.write_text("b")
+    assert first is not None and first != file_hash(str(path))
+
+def test_result_cache_invalid(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "No TTL",
+            "expected_exception": ValueError("Invalid metric cache TTL: 0"),
+            "ttl": 0,
+            "max_entries": 1
+        },
+        {
+            "description": "No entries",
+            "expected_exception": ValueError("Invalid metric cache max entries: 0"),
+            "ttl": 10,
+            "max_entries": 0
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                ResultCache(str(tmp_path), test_case["ttl"], test_case["max_entries"])
+
+def test_result_cache_fetch(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Nothing cached, computed",
+            "expected": ({"value": 2}, False),
+            "stored": None,
+            "now": 100
+        },
+        {
+            "description": "Fresh result, reused",
+            "expected": ({"value": 1}, True),
+            "stored": 95,
+            "now": 100
+        },
+        {
+            "description": "Result as old as the TTL, computed",
+            "expected": ({"value": 2}, False),
+            "stored": 90,
+            "now": 100
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            clock = FakeClock()
+            cache = ResultCache(str(tmp_path / str(i)), 10, clock=clock)
+            if test_case["stored"] is not None:
+                clock.now = test_case["stored"]
+                cache.put("key", {"value": 1})
+            clock.now = test_case["now"]
+            assert test_case["expected"] == cache.fetch("key", lambda: {"value": 2})
+            assert {"value": test_case["expected"][0]["value"]} == cache.get("key")
+
+def test_result_cache_corrupt(tmp_path):
+    cache = ResultCache(str(tmp_path), 10)
+    (tmp_path / "key.json").write_text("{")
+    assert cache.get("key") is None
+
+def test_result_cache_evict(tmp_path):
+    clock = FakeClock()
+    cache = ResultCache(str(tmp_path), 1000, max_entries=2, clock=clock)
+    for i, key in enumerate(["a", "b", "c"]):
+        clock.now = i
+        cache.put(key, i)
+        # entries are ordered by modification time, keep them apart on coarse filesystems
+        os.utime(str(tmp_path / f"{key}.json"), ns=(i * 10 ** 9, i * 10 ** 9))
+    cache.put("c", 2)
+    assert [None, 1, 2] == [cache.get(key) for key in ["a", "b", "c"]]
+    assert not os.path.exists(str(tmp_path / "a.lock"))
+
+def test_result_cache_simultaneous(tmp_path):
+    cache = ResultCache(str(tmp_path), 10)
+    computed = []
+
+    def compute():
+        computed.append(True)
+        time.sleep(0.2)
+        return len(computed)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(ResultCache(str(tmp_path), 10).fetch("key", compute)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 == len(computed)
+    assert [1, 1, 1] == sorted(result for result, _ in results)
+    assert 1 == cache.get("key")
@@ -0,0 +1,118 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Sizing handles deciding how many users a load test should run, either fixed
+or sized to the resource being scaled, so the load test stresses the resource
+in proportion to what it actually serves
+"""
+import math
+import json
+
+LOAD_FIXED = "fixed"
+LOAD_PER_REPLICA = "perReplica"
+LOAD_REQUEST_RATE = "requestRate"
+
+DEFAULT_MIN_USERS = 1
+DEFAULT_REQUESTS_PER_USER = 1
+REQUEST_RATE_TIMEOUT = 5
+
+def read_request_rate(source, urlopen=None):
+    """
+    read_request_rate reads a request rate, in requests per second, from the
+    local file or HTTP endpoint provided. The rate can be a plain number or a
+    JSON object with an rps field
+    """
+    try:
+        if source.startswith(("http://", "https://")):
+            if urlopen is None:
+                # only the metric hook reads the request rate, keep urllib out of evaluate's startup
+                import urllib.request # pylint: disable=import-outside-toplevel
+                urlopen = urllib.request.urlopen
+            with urlopen(source, timeout=REQUEST_RATE_TIMEOUT) as response:
+                data = response.read().decode("utf-8")
+        else:
+            with open(source, "r") as rate_file:
+                data = rate_file.read()
+        rate = json.loads(data)
+        if isinstance(rate, dict):
+            rate = rate.get("rps")
+        rate = float(rate)
+    except (OSError, ValueError, TypeError) as err:
+        raise ValueError(f"Failed to read request rate from {source}: {str(err)}") from err
+    if rate < 0 or math.isnan(rate) or math.isinf(rate):
+        raise ValueError(f"Invalid request rate from {source}: {rate}")
+    return rate
+
+# settings each load mode requires
+REQUIRED_SETTINGS = {
+    LOAD_FIXED: ["locustUsers", "locustHatchRate"],
+    LOAD_PER_REPLICA: ["locustUsersPerReplica"],
+    LOAD_REQUEST_RATE: ["locustRequestRateSource"]
+}
+
+class LoadSizer:
+    """
+    LoadSizer abstracts sizing a load test, returning the users to run and
+    the rate to hatch them at. Users can be fixed, a number per replica of the
+    resource, or enough to generate a request rate read from a file or
+    endpoint, e.g. the rate the resource is serving in production. Settings
+    are keyed by their environment variable name, unset settings being None
+    """
+    def __init__(self, mode, settings, read_rate=read_request_rate):
+        self.mode = mode
+        self.settings = settings
+        self.read_rate = read_rate
+        if self.mode not in REQUIRED_SETTINGS:
+            raise ValueError(f"Unknown load mode: {self.mode}")
+        for name in REQUIRED_SETTINGS[self.mode]:
+            if self.settings.get(name) is None:
+                raise ValueError(f"{name} is required for {self.mode} load mode")
+        self.min_users = int(self.settings.get("locustMinUsers") or DEFAULT_MIN_USERS)
+        self.max_users = None
+        if self.settings.get("locustMaxUsers") is not None:
+            self.max_users = int(self.settings["locustMaxUsers"])
+            # a load test without users can't be run or split across processes
+            if self.max_users < 1:
+                raise ValueError(f"Invalid max users: {self.max_users}")
+            if self.max_users < self.min_users:
+                raise ValueError(f"locustMaxUsers {self.max_users} is under locustMinUsers "
+                                 f"{self.min_users}")
+
+    def get(self, resource):
+        """
+        get returns the number of users and hatch rate for a load test of the
+        resource provided
+        """
+        if self.mode == LOAD_FIXED:
+            return int(self.settings["locustUsers"]), int(self.settings["locustHatchRate"])
+
+        if self.mode == LOAD_PER_REPLICA:
+            replicas = int(resource.get("spec").get("replicas"))
+            users = math.ceil(float(self.settings["locustUsersPerReplica"]) * replicas)
+        else:
+            rate = self.read_rate(self.settings["locustRequestRateSource"])
+            requests_per_user = float(self.settings.get("locustRequestsPerUser")
+                                      or DEFAULT_REQUESTS_PER_USER)
+            if requests_per_user <= 0:
+                raise ValueError(f"Invalid requests per user: {requests_per_user}")
+            users = math.ceil(rate / requests_per_user)
+
+        # keep within bounds, never running a load test without users
+        users = max(users, self.min_users, 1)
+        if self.max_users is not None:
+            users = min(users, self.max_users)
+        # without a hatch rate, start every user within a second
+        if self.settings.get("locustHatchRate") is None:
+            return users, users
+        return users, int(self.settings["locustHatchRate"])
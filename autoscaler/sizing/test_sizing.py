@@ -0,0 +1,145 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import pytest
+from .sizing import LoadSizer, read_request_rate
+
+class FakeResponse(io.BytesIO):
+    pass
+
+def test_read_request_rate(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Plain number from file",
+            "expected": 12.5,
+            "file": "12.5\n"
+        },
+        {
+            "description": "JSON object from file",
+            "expected": 40,
+            "file": "{\"rps\": 40}"
+        },
+        {
+            "description": "Negative rate",
+            "expected_exception": ValueError("Invalid request rate from {source}: -1.0"),
+            "file": "-1"
+        },
+        {
+            "description": "Not a number",
+            "expected_exception": ValueError(
+                "Failed to read request rate from {source}: could not convert string to float: 'fast'"),
+            "file": "\"fast\""
+        },
+        {
+            "description": "Missing file",
+            "expected_exception": ValueError(
+                "Failed to read request rate from {source}: [Errno 2] No such file or directory: '{source}'"),
+            "file": None
+        },
+        {
+            "description": "From endpoint",
+            "expected": 7,
+            "source": "http://metrics:8080/rps",
+            "urlopen": lambda url, timeout: FakeResponse(b"7")
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            source = test_case.get("source", str(tmp_path / f"rate_{i}"))
+            if test_case.get("file") is not None:
+                (tmp_path / f"rate_{i}").write_text(test_case["file"])
+            urlopen = test_case.get("urlopen", lambda url, timeout: None)
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    read_request_rate(source, urlopen)
+                assert str(ex.value) == str(test_case["expected_exception"]).format(source=source)
+            else:
+                assert test_case["expected"] == read_request_rate(source, urlopen)
+
+def test_load_sizer_get(subtests):
+    test_cases = [
+        {
+            "description": "Unknown mode",
+            "expected_exception": ValueError("Unknown load mode: invalid"),
+            "mode": "invalid",
+            "settings": {}
+        },
+        {
+            "description": "Missing required setting",
+            "expected_exception": ValueError("locustUsersPerReplica is required for perReplica load mode"),
+            "mode": "perReplica",
+            "settings": {"locustUsers": "10"}
+        },
+        {
+            "description": "Max users of zero",
+            "expected_exception": ValueError("Invalid max users: 0"),
+            "mode": "perReplica",
+            "settings": {"locustUsersPerReplica": "2", "locustMaxUsers": "0"}
+        },
+        {
+            "description": "Max users under min users",
+            "expected_exception": ValueError("locustMaxUsers 2 is under locustMinUsers 5"),
+            "mode": "perReplica",
+            "settings": {"locustUsersPerReplica": "2", "locustMinUsers": "5", "locustMaxUsers": "2"}
+        },
+        {
+            "description": "Fixed",
+            "expected": (10, 2),
+            "mode": "fixed",
+            "settings": {"locustUsers": "10", "locustHatchRate": "2"}
+        },
+        {
+            "description": "Per replica, hatched within a second",
+            "expected": (15, 15),
+            "mode": "perReplica",
+            "settings": {"locustUsersPerReplica": "2.5"}
+        },
+        {
+            "description": "Per replica, capped",
+            "expected": (12, 3),
+            "mode": "perReplica",
+            "settings": {"locustUsersPerReplica": "5", "locustMaxUsers": "12", "locustHatchRate": "3"}
+        },
+        {
+            "description": "Request rate",
+            "expected": (34, 34),
+            "mode": "requestRate",
+            "settings": {"locustRequestRateSource": "/rps", "locustRequestsPerUser": "3"}
+        },
+        {
+            "description": "Request rate of zero, minimum users",
+            "expected": (2, 2),
+            "mode": "requestRate",
+            "settings": {"locustRequestRateSource": "/zero", "locustMinUsers": "2"}
+        },
+        {
+            "description": "Invalid requests per user",
+            "expected_exception": ValueError("Invalid requests per user: -1.0"),
+            "mode": "requestRate",
+            "settings": {"locustRequestRateSource": "/rps", "locustRequestsPerUser": "-1"}
+        },
+    ]
+
+    rates = {"/rps": 100, "/zero": 0}
+    resource = {"spec": {"replicas": 6}}
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    LoadSizer(test_case["mode"], test_case["settings"], rates.get).get(resource)
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == LoadSizer(test_case["mode"], test_case["settings"], rates.get).get(resource)
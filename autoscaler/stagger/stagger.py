@@ -0,0 +1,340 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Stagger handles spreading out the load tests of autoscaler instances that
+share downstream dependencies, limiting how many run at once with a semaphore
+of leases held in a shared store, and waiting a random jitter before each
+"""
+import os
+import json
+import math
+import time
+import fcntl
+import random
+import datetime
+import contextlib
+from telemetry.telemetry import Telemetry
+
+STAGGER_NONE = "none"
+STAGGER_FILE = "file"
+STAGGER_KUBERNETES = "kubernetes"
+
+DEFAULT_STAGGER_SLOTS = 1
+# milliseconds the Custom Pod Autoscaler gives the metric hook, as set in config.yaml
+DEFAULT_METRIC_TIMEOUT = 60000
+# seconds of the metric hook's time kept for setting up the load test and gathering its
+# results
+METRIC_OVERHEAD = 5
+DEFAULT_STAGGER_POLL_INTERVAL = 1
+# seconds a lease is held for beyond the load test, in case stopping it or gathering its
+# stats runs long
+DEFAULT_LEASE_GRACE = 60
+DEFAULT_STAGGER_DIRECTORY = "/tmp/locust-autoscaler-stagger"
+DEFAULT_LEASE_NAME = "locust-pod-autoscaler-stagger"
+
+SERVICE_ACCOUNT_DIRECTORY = "/var/run/secrets/kubernetes.io/serviceaccount"
+KUBERNETES_TIMEOUT = 5
+LEASE_API_VERSION = "coordination.k8s.io/v1"
+MICRO_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+def holder_identity():
+    """
+    holder_identity returns an identity unique to this process and call, the
+    host name is the pod name when running in a cluster
+    """
+    # only imported when load tests are staggered, keep it out of evaluate's startup
+    import socket # pylint: disable=import-outside-toplevel
+    return f"{socket.gethostname()}-{os.getpid()}-{random.getrandbits(32):08x}"
+
+def micro_time(timestamp):
+    """
+    micro_time formats a Unix timestamp as a Kubernetes MicroTime
+    """
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime(MICRO_TIME_FORMAT)
+
+def parse_micro_time(value):
+    """
+    parse_micro_time parses a Kubernetes MicroTime or Time to a Unix
+    timestamp, returning None if it is missing or invalid
+    """
+    for time_format in (MICRO_TIME_FORMAT, "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            parsed = datetime.datetime.strptime(value, time_format)
+        except (TypeError, ValueError):
+            continue
+        return parsed.replace(tzinfo=datetime.timezone.utc).timestamp()
+    return None
+
+def stagger_timeout(metric_timeout, load_test_seconds, jitter, timeout=None):
+    """
+    stagger_timeout returns the seconds a load test can wait for a slot
+    within the metric hook's timeout in milliseconds, once the jitter, the
+    load test and setting it up have been allowed for. Raises if the timeout
+    provided doesn't fit, or there is no time left to wait
+    """
+    available = metric_timeout / 1000 - METRIC_OVERHEAD - jitter - load_test_seconds
+    if timeout is None:
+        timeout = available
+    if timeout <= 0 or timeout > available:
+        needed = METRIC_OVERHEAD + jitter + load_test_seconds + max(timeout, 0)
+        raise ValueError(f"Load test stagger needs {needed:g}s for the jitter, the load test "
+                         "and waiting for a slot, over the metric timeout of "
+                         f"{metric_timeout / 1000:g}s, raise metric.timeout and metricTimeout")
+    return timeout
+
+class Stagger: # pylint: disable=too-many-instance-attributes
+    """
+    Stagger abstracts a semaphore of slots shared with other autoscaler
+    instances through the lease store provided. A load test waits a random
+    jitter of up to the seconds provided, then holds a slot while it runs, so
+    no more load tests than slots run at once, waiting up to the timeout in
+    seconds for a slot. A slot is leased for the duration provided, so a slot
+    held by an instance that died is freed once the lease runs out
+    """
+    def __init__(self, store, slots, # pylint: disable=too-many-arguments
+                 lease_duration, timeout, jitter=0, poll_interval=DEFAULT_STAGGER_POLL_INTERVAL,
+                 holder=None, clock=time.time, sleep=time.sleep, rng=None, telemetry=None):
+        if slots < 1:
+            raise ValueError(f"Invalid load test stagger slots: {slots}")
+        if lease_duration <= 0:
+            raise ValueError(f"Invalid load test stagger lease duration: {lease_duration}")
+        if jitter < 0:
+            raise ValueError(f"Invalid load test stagger jitter: {jitter}")
+        if timeout < 0:
+            raise ValueError(f"Invalid load test stagger timeout: {timeout}")
+        self.store = store
+        self.slots = slots
+        self.lease_duration = lease_duration
+        self.jitter = jitter
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.holder = holder_identity() if holder is None else holder
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = random.Random() if rng is None else rng
+        self.telemetry = Telemetry() if telemetry is None else telemetry
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        slot waits out the jitter and holds a slot for as long as the context
+        lasts, yielding the slot held
+        """
+        with self.telemetry.span("stagger_wait"):
+            if self.jitter > 0:
+                self.sleep(self.rng.uniform(0, self.jitter))
+            slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.store.release(slot, self.holder)
+
+    def acquire(self):
+        """
+        acquire leases a free slot, waiting for one to be released if they
+        are all held, and returns it. Raises if none is free within the
+        timeout
+        """
+        start = self.clock()
+        while True:
+            now = self.clock()
+            # start from a random slot so waiting instances don't all contend for the first
+            first = self.rng.randrange(self.slots)
+            for offset in range(self.slots):
+                slot = (first + offset) % self.slots
+                if self.store.try_acquire(slot, self.holder, now, self.lease_duration):
+                    return slot
+            if now - start >= self.timeout:
+                raise Exception(f"Timed out after {self.timeout}s waiting for a load test slot, "
+                                f"all {self.slots} held")
+            # vary the poll so instances waiting on the same slot don't retry in step
+            self.sleep(self.poll_interval * (0.5 + self.rng.random()))
+
+class FileLeaseStore:
+    """
+    FileLeaseStore abstracts leases held in files in a local directory, for
+    instances sharing a host or a volume, and for testing without a cluster.
+    Every change is made holding a lock on the directory, so a lease is only
+    ever granted to one holder
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def try_acquire(self, slot, holder, now, duration):
+        """
+        try_acquire leases the slot provided to the holder provided until
+        the duration has passed, returning False if another holder's lease on
+        it has not yet run out
+        """
+        with self.__locked():
+            lease = self.__read(slot)
+            if (lease is not None and lease.get("holder") != holder
+                    and lease.get("expires", 0) > now):
+                return False
+            with open(self.__path(slot), "w") as lease_file:
+                json.dump({"holder": holder, "expires": now + duration}, lease_file,
+                          separators=(",", ":"))
+            return True
+
+    def release(self, slot, holder):
+        """
+        release frees the slot provided if the holder provided still holds it
+        """
+        with self.__locked():
+            lease = self.__read(slot)
+            if lease is not None and lease.get("holder") == holder:
+                os.unlink(self.__path(slot))
+
+    @contextlib.contextmanager
+    def __locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # closing the lock file releases the lock
+        with open(os.path.join(self.directory, "slots.lock"), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def __read(self, slot):
+        try:
+            with open(self.__path(slot), "r") as lease_file:
+                lease = json.load(lease_file)
+        except (FileNotFoundError, ValueError):
+            # a partially written lease is from a holder that died writing it
+            return None
+        return lease if isinstance(lease, dict) else None
+
+    def __path(self, slot):
+        return os.path.join(self.directory, f"slot-{slot}.json")
+
+class KubernetesLeaseStore:
+    """
+    KubernetesLeaseStore abstracts leases held as Kubernetes Lease objects,
+    one named after each slot, for instances spread across a cluster. Leases
+    are changed with the resource version they were read at, so only one of
+    any holders racing for a free slot is granted it
+    """
+    def __init__(self, name, namespace, api_server, token_path, context=None, urlopen=None):
+        if urlopen is None:
+            # only the Kubernetes backend talks HTTP, keep urllib out of evaluate's startup
+            import urllib.request # pylint: disable=import-outside-toplevel
+            urlopen = urllib.request.urlopen
+        self.name = name
+        self.namespace = namespace
+        self.api_server = api_server
+        self.token_path = token_path
+        self.context = context
+        self.urlopen = urlopen
+
+    @classmethod
+    def in_cluster(cls, name, namespace=None, getenv=os.getenv, directory=SERVICE_ACCOUNT_DIRECTORY,
+                   urlopen=None, create_context=None):
+        """
+        in_cluster returns a lease store using the API server and service
+        account of the pod it runs in, in the pod's namespace unless another
+        is provided
+        """
+        host = getenv("KUBERNETES_SERVICE_HOST", None)
+        port = getenv("KUBERNETES_SERVICE_PORT", None)
+        if host is None or port is None:
+            raise ValueError("Kubernetes load test stagger requires running in a cluster, "
+                             "KUBERNETES_SERVICE_HOST and KUBERNETES_SERVICE_PORT are not set")
+        if namespace is None:
+            with open(os.path.join(directory, "namespace"), "r") as namespace_file:
+                namespace = namespace_file.read().strip()
+        if ":" in host:
+            host = f"[{host}]"
+        if create_context is None:
+            import ssl # pylint: disable=import-outside-toplevel
+            create_context = ssl.create_default_context
+        context = create_context(cafile=os.path.join(directory, "ca.crt"))
+        return cls(name, namespace, f"https://{host}:{port}", os.path.join(directory, "token"),
+                   context, urlopen)
+
+    def try_acquire(self, slot, holder, now, duration):
+        """
+        try_acquire leases the slot provided to the holder provided until
+        the duration has passed, returning False if another holder's lease on
+        it has not yet run out or another holder changed it first
+        """
+        name = self.__lease_name(slot)
+        status, lease = self.__request("GET", name, allowed=(404,))
+        spec = {
+            "holderIdentity": holder,
+            "leaseDurationSeconds": int(math.ceil(duration)),
+            "acquireTime": micro_time(now),
+            "renewTime": micro_time(now)
+        }
+        if status == 404:
+            status, _ = self.__request("POST", None, {
+                "apiVersion": LEASE_API_VERSION,
+                "kind": "Lease",
+                "metadata": {"name": name, "namespace": self.namespace},
+                "spec": spec
+            }, allowed=(409,))
+            return status != 409
+
+        current = lease.get("spec") or {}
+        if current.get("holderIdentity") not in (None, "", holder):
+            renewed = parse_micro_time(current.get("renewTime") or current.get("acquireTime"))
+            if renewed is not None and renewed + current.get("leaseDurationSeconds", 0) > now:
+                return False
+        # replacing with the resource version read fails with a conflict if the lease changed since
+        lease["spec"] = spec
+        status, _ = self.__request("PUT", name, lease, allowed=(404, 409))
+        return status not in (404, 409)
+
+    def release(self, slot, holder):
+        """
+        release frees the slot provided if the holder provided still holds it
+        """
+        name = self.__lease_name(slot)
+        status, lease = self.__request("GET", name, allowed=(404,))
+        if status == 404 or (lease.get("spec") or {}).get("holderIdentity") != holder:
+            return
+        # only delete the lease as it was read, another holder may have taken it after it ran out
+        self.__request("DELETE", name, {
+            "apiVersion": "v1",
+            "kind": "DeleteOptions",
+            "preconditions": {"resourceVersion": lease.get("metadata", {}).get("resourceVersion")}
+        }, allowed=(404, 409))
+
+    def __lease_name(self, slot):
+        return f"{self.name}-{slot}"
+
+    def __request(self, method, name, body=None, allowed=()):
+        import urllib.error # pylint: disable=import-outside-toplevel
+        import urllib.request # pylint: disable=import-outside-toplevel
+        path = f"/apis/{LEASE_API_VERSION}/namespaces/{self.namespace}/leases"
+        if name is not None:
+            path += f"/{name}"
+        # service account tokens are rotated, read the current one for every request
+        with open(self.token_path, "r") as token_file:
+            token = token_file.read().strip()
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(self.api_server + path, method=method, data=data,
+                                         headers={
+                                             "Authorization": f"Bearer {token}",
+                                             "Accept": "application/json",
+                                             "Content-Type": "application/json"
+                                         })
+        try:
+            with self.urlopen(request, timeout=KUBERNETES_TIMEOUT,
+                              context=self.context) as response:
+                return response.getcode(), json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as err:
+            if err.code in allowed:
+                return err.code, None
+            raise Exception(f"Failed to {method} load test stagger lease {path}: "
+                            f"{err.code} {err.reason}")
+        except (OSError, ValueError) as err:
+            raise Exception(f"Failed to {method} load test stagger lease {path}: {str(err)}")
@@ -0,0 +1,466 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import time
+import random
+import threading
+import urllib.error
+import pytest
+from .stagger import (Stagger, FileLeaseStore, KubernetesLeaseStore, micro_time, parse_micro_time,
+                      stagger_timeout)
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, code, body):
+        super().__init__(json.dumps(body).encode("utf-8"))
+        self.code = code
+
+    def getcode(self):
+        return self.code
+
+class FakeLeaseAPI:
+    def __init__(self, leases=None, before_write=None):
+        self.leases = {} if leases is None else leases
+        self.before_write = before_write
+        self.version = 0
+        self.requests = []
+
+    def __call__(self, request, timeout, context):
+        name = request.full_url.split("/leases")[1].lstrip("/")
+        body = None if request.data is None else json.loads(request.data.decode("utf-8"))
+        self.requests.append((request.get_method(), name, request.get_header("Authorization")))
+        if request.get_method() != "GET" and self.before_write is not None:
+            self.before_write(self)
+        if request.get_method() == "POST":
+            name = body["metadata"]["name"]
+            if name in self.leases:
+                raise self.__error(409)
+            return self.__store(name, body, 201)
+        if name not in self.leases:
+            raise self.__error(404)
+        lease = self.leases[name]
+        if request.get_method() == "GET":
+            return FakeResponse(200, lease)
+        expected_version = body["metadata"]["resourceVersion"] if request.get_method() == "PUT" else \
+            body["preconditions"]["resourceVersion"]
+        if expected_version != lease["metadata"]["resourceVersion"]:
+            raise self.__error(409)
+        if request.get_method() == "DELETE":
+            del self.leases[name]
+            return FakeResponse(200, {})
+        return self.__store(name, body, 200)
+
+    def hold(self, name, holder, renewed, duration=60):
+        self.__store(name, {"metadata": {"name": name}, "spec": {
+            "holderIdentity": holder,
+            "leaseDurationSeconds": duration,
+            "renewTime": micro_time(renewed)
+        }}, 201)
+
+    def __store(self, name, lease, code):
+        self.version += 1
+        lease["metadata"]["resourceVersion"] = str(self.version)
+        self.leases[name] = lease
+        return FakeResponse(code, lease)
+
+    @staticmethod
+    def __error(code):
+        return urllib.error.HTTPError("https://kubernetes", code, "Error", {}, None)
+
+def kubernetes_store(api, tmp_path):
+    token_path = tmp_path / "token"
+    token_path.write_text("secret\n")
+    return KubernetesLeaseStore("stagger", "default", "https://kubernetes", str(token_path), urlopen=api)
+
+def test_micro_time(subtests):
+    test_cases = [
+        {
+            "description": "MicroTime round trip",
+            "expected": 1577836800.25,
+            "value": micro_time(1577836800.25)
+        },
+        {
+            "description": "Time without fraction",
+            "expected": 1577836800,
+            "value": "2020-01-01T00:00:00Z"
+        },
+        {
+            "description": "Missing",
+            "expected": None,
+            "value": None
+        },
+        {
+            "description": "Invalid",
+            "expected": None,
+            "value": "yesterday"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == parse_micro_time(test_case["value"])
+
+def test_stagger_timeout_budget(subtests):
+    test_cases = [
+        {
+            "description": "Default, whatever the metric timeout leaves",
+            "expected": 30,
+            "metric_timeout": 60000,
+            "load_test_seconds": 20,
+            "jitter": 5,
+            "timeout": None
+        },
+        {
+            "description": "Timeout within the metric timeout",
+            "expected": 10,
+            "metric_timeout": 60000,
+            "load_test_seconds": 20,
+            "jitter": 5,
+            "timeout": 10
+        },
+        {
+            "description": "Timeout over the metric timeout",
+            "expected_exception": ValueError("Load test stagger needs 110s for the jitter, the load test and "
+                                             "waiting for a slot, over the metric timeout of 60s, "
+                                             "raise metric.timeout and metricTimeout"),
+            "metric_timeout": 60000,
+            "load_test_seconds": 20,
+            "jitter": 5,
+            "timeout": 80
+        },
+        {
+            "description": "No time left to wait",
+            "expected_exception": ValueError("Load test stagger needs 65s for the jitter, the load test and "
+                                             "waiting for a slot, over the metric timeout of 60s, "
+                                             "raise metric.timeout and metricTimeout"),
+            "metric_timeout": 60000,
+            "load_test_seconds": 60,
+            "jitter": 0,
+            "timeout": None
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            args = (test_case["metric_timeout"], test_case["load_test_seconds"], test_case["jitter"],
+                    test_case["timeout"])
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    stagger_timeout(*args)
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                assert test_case["expected"] == stagger_timeout(*args)
+
+def test_stagger_invalid(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "No slots",
+            "expected_exception": ValueError("Invalid load test stagger slots: 0"),
+            "slots": 0,
+            "lease_duration": 60,
+            "jitter": 0
+        },
+        {
+            "description": "No lease duration",
+            "expected_exception": ValueError("Invalid load test stagger lease duration: 0"),
+            "slots": 1,
+            "lease_duration": 0,
+            "jitter": 0
+        },
+        {
+            "description": "Negative jitter",
+            "expected_exception": ValueError("Invalid load test stagger jitter: -1"),
+            "slots": 1,
+            "lease_duration": 60,
+            "jitter": -1
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            with pytest.raises(type(test_case["expected_exception"]), match=str(test_case["expected_exception"])):
+                Stagger(FileLeaseStore(str(tmp_path)), test_case["slots"], test_case["lease_duration"], 30,
+                        jitter=test_case["jitter"])
+
+def test_file_lease_store(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Free slot, acquired",
+            "expected": True,
+            "held": None,
+            "now": 100
+        },
+        {
+            "description": "Held by another, not acquired",
+            "expected": False,
+            "held": ("other", 50),
+            "now": 100
+        },
+        {
+            "description": "Held by another until its lease ran out, acquired",
+            "expected": True,
+            "held": ("other", 30),
+            "now": 100
+        },
+        {
+            "description": "Already held by the same holder, renewed",
+            "expected": True,
+            "held": ("self", 50),
+            "now": 100
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            store = FileLeaseStore(str(tmp_path / str(i)))
+            if test_case["held"] is not None:
+                holder, acquired = test_case["held"]
+                assert store.try_acquire(0, holder, acquired, 60)
+            assert test_case["expected"] == store.try_acquire(0, "self", test_case["now"], 60)
+            # a different slot is always free
+            assert store.try_acquire(1, "self", test_case["now"], 60)
+
+def test_file_lease_store_release(tmp_path):
+    store = FileLeaseStore(str(tmp_path))
+    assert store.try_acquire(0, "a", 0, 60)
+    # only the holder can release its lease
+    store.release(0, "b")
+    assert not store.try_acquire(0, "b", 1, 60)
+    store.release(0, "a")
+    assert store.try_acquire(0, "b", 1, 60)
+
+def test_file_lease_store_corrupt(tmp_path):
+    (tmp_path / "slot-0.json").write_text("{")
+    assert FileLeaseStore(str(tmp_path)).try_acquire(0, "a", 0, 60)
+
+def test_stagger_slot(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "Free slot, held after the jitter",
+            "expected": 0,
+            "expected_waited": 7.5,
+            "held": [],
+            "jitter": 10,
+            "released_at": None
+        },
+        {
+            "description": "Every slot held, wait for a release",
+            "expected": 1,
+            "expected_waited": 12.0,
+            "held": [(0, 0), (1, 0)],
+            "jitter": 0,
+            "released_at": (1, 12)
+        },
+        {
+            "description": "Every slot held, take over once a lease runs out",
+            "expected": 0,
+            "expected_waited": 60.0,
+            "held": [(0, 0), (1, 30)],
+            "jitter": 0,
+            "released_at": None
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            clock = FakeClock()
+            store = FileLeaseStore(str(tmp_path / str(i)))
+            for slot, acquired in test_case["held"]:
+                assert store.try_acquire(slot, f"other-{slot}", acquired, 60)
+            released_at = test_case["released_at"]
+
+            def sleep(seconds):
+                clock.sleep(seconds)
+                if released_at is not None and clock.now >= released_at[1]:
+                    store.release(released_at[0], f"other-{released_at[0]}")
+
+            rng = random.Random(0)
+            rng.uniform = lambda low, high: 0.75 * high
+            rng.random = lambda: 0.5
+            rng.randrange = lambda stop: 0
+            stagger = Stagger(store, 2, 60, 300, jitter=test_case["jitter"], poll_interval=1, holder="self",
+                              clock=clock, sleep=sleep, rng=rng)
+            with stagger.slot() as slot:
+                assert test_case["expected"] == slot
+                assert test_case["expected_waited"] == clock.now
+                assert not store.try_acquire(slot, "another", clock.now, 60)
+            # released once the load test is done
+            assert store.try_acquire(slot, "another", clock.now, 60)
+
+def test_stagger_timeout(tmp_path):
+    clock = FakeClock()
+    store = FileLeaseStore(str(tmp_path))
+    assert store.try_acquire(0, "other", 0, 600)
+    stagger = Stagger(store, 1, 60, timeout=30, clock=clock, sleep=clock.sleep)
+    with pytest.raises(Exception, match="Timed out after 30s waiting for a load test slot, all 1 held"):
+        with stagger.slot():
+            pass
+
+def test_stagger_simultaneous(tmp_path):
+    running = []
+    most_running = []
+    lock = threading.Lock()
+
+    def load_test():
+        with Stagger(FileLeaseStore(str(tmp_path)), 2, 60, 30, jitter=0.05, poll_interval=0.02).slot():
+            with lock:
+                running.append(True)
+                most_running.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=load_test) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 6 == len(most_running)
+    assert 2 == max(most_running)
+
+def test_kubernetes_lease_store(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "No lease, created",
+            "expected": True,
+            "expected_requests": ["GET", "POST"],
+            "held": None,
+            "before_write": None
+        },
+        {
+            "description": "No lease, another holder created it first",
+            "expected": False,
+            "expected_requests": ["GET", "POST"],
+            "held": None,
+            "before_write": lambda api: api.hold("stagger-0", "other", 100)
+        },
+        {
+            "description": "Held by another, not acquired",
+            "expected": False,
+            "expected_requests": ["GET"],
+            "held": ("other", 50),
+            "before_write": None
+        },
+        {
+            "description": "Held by another until its lease ran out, taken over",
+            "expected": True,
+            "expected_requests": ["GET", "PUT"],
+            "held": ("other", 30),
+            "before_write": None
+        },
+        {
+            "description": "Released lease, taken over",
+            "expected": True,
+            "expected_requests": ["GET", "PUT"],
+            "held": ("", 90),
+            "before_write": None
+        },
+        {
+            "description": "Lease ran out, another holder took it over first",
+            "expected": False,
+            "expected_requests": ["GET", "PUT"],
+            "held": ("other", 30),
+            "before_write": lambda api: api.hold("stagger-0", "another", 100)
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            api = FakeLeaseAPI()
+            if test_case["held"] is not None:
+                api.hold("stagger-0", test_case["held"][0], test_case["held"][1])
+            api.before_write = test_case["before_write"]
+            store = kubernetes_store(api, tmp_path)
+            assert test_case["expected"] == store.try_acquire(0, "self", 100, 20.5)
+            assert test_case["expected_requests"] == [method for method, _, _ in api.requests]
+            assert all(authorization == "Bearer secret" for _, _, authorization in api.requests)
+            if test_case["expected"]:
+                assert {
+                    "holderIdentity": "self",
+                    "leaseDurationSeconds": 21,
+                    "acquireTime": micro_time(100),
+                    "renewTime": micro_time(100)
+                } == api.leases["stagger-0"]["spec"]
+
+def test_kubernetes_lease_store_release(tmp_path):
+    api = FakeLeaseAPI()
+    store = kubernetes_store(api, tmp_path)
+    assert store.try_acquire(1, "a", 0, 60)
+    # only the holder can release its lease
+    store.release(1, "b")
+    assert "stagger-1" in api.leases
+    store.release(1, "a")
+    assert "stagger-1" not in api.leases
+    # releasing a lease already gone is fine
+    store.release(1, "a")
+
+def test_kubernetes_lease_store_error(tmp_path):
+    def urlopen(request, timeout, context):
+        raise urllib.error.HTTPError(request.full_url, 403, "Forbidden", {}, None)
+
+    with pytest.raises(Exception, match="Failed to GET load test stagger lease "
+                                        "/apis/coordination.k8s.io/v1/namespaces/default/leases/stagger-0: "
+                                        "403 Forbidden"):
+        kubernetes_store(urlopen, tmp_path).try_acquire(0, "self", 0, 60)
+
+def test_kubernetes_lease_store_in_cluster(subtests, tmp_path):
+    (tmp_path / "namespace").write_text("apps\n")
+    test_cases = [
+        {
+            "description": "Not in a cluster",
+            "expected_exception": ValueError("Kubernetes load test stagger requires running in a cluster, "
+                                             "KUBERNETES_SERVICE_HOST and KUBERNETES_SERVICE_PORT are not set"),
+            "env": {},
+            "namespace": None
+        },
+        {
+            "description": "Pod's namespace",
+            "expected": ("https://10.0.0.1:443", "apps"),
+            "env": {"KUBERNETES_SERVICE_HOST": "10.0.0.1", "KUBERNETES_SERVICE_PORT": "443"},
+            "namespace": None
+        },
+        {
+            "description": "Other namespace, IPv6 API server",
+            "expected": ("https://[fd00::1]:443", "shared"),
+            "env": {"KUBERNETES_SERVICE_HOST": "fd00::1", "KUBERNETES_SERVICE_PORT": "443"},
+            "namespace": "shared"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            def getenv(name, default=None):
+                return test_case["env"].get(name, default)
+
+            if "expected_exception" in test_case.keys():
+                with pytest.raises(type(test_case["expected_exception"])) as ex:
+                    KubernetesLeaseStore.in_cluster("stagger", test_case["namespace"], getenv, str(tmp_path))
+                assert str(ex.value) == str(test_case["expected_exception"])
+            else:
+                store = KubernetesLeaseStore.in_cluster("stagger", test_case["namespace"], getenv, str(tmp_path),
+                                                        create_context=lambda cafile: cafile)
+                assert test_case["expected"] == (store.api_server, store.namespace)
+                assert str(tmp_path / "ca.crt") == store.context
+                assert str(tmp_path / "token") == store.token_path
@@ -0,0 +1,115 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+State handles persisting autoscaler state, such as decay information, to a
+JSON file that is replaced atomically so a crash mid-write can never leave it
+corrupted
+"""
+import os
+import sys
+import json
+import copy
+import tempfile
+
+def replace_file(path, write, mode="w", prefix=".state-", sync=True):
+    """
+    replace_file atomically replaces the file at the path provided, calling
+    write with a temporary file in the same directory that is then renamed
+    over it, synced first unless sync is False
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        # temporary files are created private, match a normally created file
+        os.fchmod(temp_descriptor, 0o644)
+        with os.fdopen(temp_descriptor, mode) as temp_file:
+            write(temp_file)
+            if sync:
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class StateStore:
+    """
+    StateStore abstracts reading and atomically replacing a JSON state file,
+    caching the parsed state until the file changes on disk
+    """
+    def __init__(self, path):
+        self.path = path
+        self.cache_key = None
+        self.cache = None
+
+    def get(self):
+        """
+        get returns the stored state as a dict, empty if nothing has been
+        stored yet or the stored state cannot be recovered
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self.cache_key:
+            with open(self.path, "r") as state_file:
+                self.cache = self.__parse(state_file.read())
+            self.cache_key = key
+        return copy.deepcopy(self.cache)
+
+    def update(self, state):
+        """
+        update replaces the stored state, writing to a temporary file that is
+        synced and then renamed over the state file
+        """
+        data = json.dumps(state)
+        replace_file(self.path, lambda state_file: state_file.write(data))
+        self.__sync_directory(os.path.dirname(os.path.abspath(self.path)))
+        stat = os.stat(self.path)
+        self.cache_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.cache = copy.deepcopy(state)
+
+    def __parse(self, data):
+        if data.strip() == "":
+            return {}
+        try:
+            return json.loads(data)
+        except ValueError:
+            pass
+        # files written in place by earlier versions could be left with
+        # trailing bytes from a longer previous write, keep the first document
+        try:
+            state, _ = json.JSONDecoder().raw_decode(data.lstrip())
+            if isinstance(state, dict):
+                return state
+        except ValueError:
+            pass
+        sys.stderr.write(f"State file {self.path} is corrupted, starting from empty state\n")
+        return {}
+
+    @staticmethod
+    def __sync_directory(directory):
+        # make the rename itself durable
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            # not supported on every platform/filesystem
+            pass
+        finally:
+            os.close(dir_fd)
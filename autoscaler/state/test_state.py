@@ -0,0 +1,74 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from .state import StateStore
+
+def test_state_store_get(subtests, tmp_path):
+    test_cases = [
+        {
+            "description": "No file, empty state",
+            "expected": {},
+            "data": None
+        },
+        {
+            "description": "Empty file, empty state",
+            "expected": {},
+            "data": ""
+        },
+        {
+            "description": "Trailing bytes from an in place rewrite, recover first document",
+            "expected": {"runs_since_change": 3},
+            "data": "{\"runs_since_change\": 3}e\": 12}"
+        },
+        {
+            "description": "Corrupted file, empty state",
+            "expected": {},
+            "data": "{\"runs_since"
+        },
+        {
+            "description": "Success",
+            "expected": {"runs_since_change": 3, "other": [1, 2]},
+            "data": "{\"runs_since_change\": 3, \"other\": [1, 2]}"
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            path = tmp_path / f"state_{i}.json"
+            if test_case["data"] is not None:
+                path.write_text(test_case["data"])
+            assert test_case["expected"] == StateStore(str(path)).get()
+
+def test_state_store_update(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{\"runs_since_change\": 10000, \"padding\": \"long previous write\"}")
+    store = StateStore(str(path))
+    assert store.get()["runs_since_change"] == 10000
+
+    store.update({"runs_since_change": 1})
+    # replaced entirely, no trailing bytes from the longer previous state
+    assert path.read_text() == "{\"runs_since_change\": 1}"
+    assert store.get() == {"runs_since_change": 1}
+    # no temporary files left behind
+    assert os.listdir(str(tmp_path)) == ["state.json"]
+
+    # returned state can be modified without changing the cached state
+    state = store.get()
+    state["runs_since_change"] = 5
+    assert store.get() == {"runs_since_change": 1}
+
+    # changes made by another process are picked up
+    StateStore(str(path)).update({"runs_since_change": 2, "other": True})
+    assert store.get() == {"runs_since_change": 2, "other": True}
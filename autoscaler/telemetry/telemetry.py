@@ -0,0 +1,210 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Telemetry handles timing each phase of the autoscaler and recording load test
+results, exposing them in the Prometheus text format as a file or over a
+local HTTP endpoint
+"""
+import time
+import threading
+import contextlib
+from state.state import replace_file
+
+PREFIX = "locust_pod_autoscaler_"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+
+PHASE_SECONDS = "phase_seconds"
+PHASE_LAST_SECONDS = "phase_last_seconds"
+LOAD_TEST_REQUESTS = "load_test_requests"
+LOAD_TEST_FAILURES = "load_test_failures"
+LOAD_TEST_REQUESTS_PER_SECOND = "load_test_requests_per_second"
+LOAD_TEST_REQUESTS_TOTAL = "load_test_requests_total"
+LOAD_TEST_FAILURES_TOTAL = "load_test_failures_total"
+RUNS_TOTAL = "runs_total"
+RUN_FAILURES_TOTAL = "run_failures_total"
+METRIC_CACHE_HITS_TOTAL = "metric_cache_hits_total"
+METRIC_CACHE_MISSES_TOTAL = "metric_cache_misses_total"
+
+# type and help text of each metric, phase_seconds is a summary of its _sum and _count
+METRICS = {
+    PHASE_SECONDS: ("summary", "Time spent in each phase, in seconds"),
+    PHASE_LAST_SECONDS: (GAUGE, "Time spent in each phase the last time it ran, in seconds"),
+    LOAD_TEST_REQUESTS: (GAUGE, "Requests made by the last load test"),
+    LOAD_TEST_FAILURES: (GAUGE, "Failed requests made by the last load test"),
+    LOAD_TEST_REQUESTS_PER_SECOND: (GAUGE, "Requests per second generated by the last load test"),
+    LOAD_TEST_REQUESTS_TOTAL: (COUNTER, "Requests made by load tests"),
+    LOAD_TEST_FAILURES_TOTAL: (COUNTER, "Failed requests made by load tests"),
+    RUNS_TOTAL: (COUNTER, "Runs of each mode"),
+    RUN_FAILURES_TOTAL: (COUNTER, "Runs of each mode that failed"),
+    METRIC_CACHE_HITS_TOTAL: (COUNTER, "Metric runs that reused a cached load test result"),
+    METRIC_CACHE_MISSES_TOTAL: (COUNTER, "Metric runs that ran a load test with caching enabled")
+}
+
+def escape(value):
+    """
+    escape escapes a label value for the Prometheus text format
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+def format_labels(labels):
+    """
+    format_labels formats a sorted tuple of label name and value pairs
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f"{name}=\"{escape(value)}\"" for name, value in labels) + "}"
+
+class Telemetry:
+    """
+    Telemetry abstracts recording phase timings, counters and gauges in
+    memory, and rendering them in the Prometheus text format. Counters are
+    totals since the process started, so only accumulate across runs in
+    worker mode
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.values = {}
+
+    @contextlib.contextmanager
+    def span(self, phase):
+        """
+        span times the phase provided, recording it even if the phase fails
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(phase, self.clock() - start)
+
+    def observe(self, phase, seconds):
+        """
+        observe records the phase provided taking the seconds provided
+        """
+        labels = (("phase", phase),)
+        sum_key = (PHASE_SECONDS + "_sum", labels)
+        count_key = (PHASE_SECONDS + "_count", labels)
+        with self.lock:
+            self.values[sum_key] = self.values.get(sum_key, 0) + seconds
+            self.values[count_key] = self.values.get(count_key, 0) + 1
+            self.values[(PHASE_LAST_SECONDS, labels)] = seconds
+
+    def set(self, name, value, **labels):
+        """
+        set sets the gauge provided to the value provided
+        """
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name, amount=1, **labels):
+        """
+        inc increases the counter provided by the amount provided
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, name, **labels):
+        """
+        get returns the current value of the metric provided, or None if it
+        has not been recorded
+        """
+        with self.lock:
+            return self.values.get((name, tuple(sorted(labels.items()))))
+
+    def snapshot(self):
+        """
+        snapshot returns every recorded metric as a JSON serializable list of
+        name, labels and value, to be merged into another process's telemetry
+        """
+        with self.lock:
+            return [[name, [list(label) for label in labels], value]
+                    for (name, labels), value in self.values.items()]
+
+    def merge(self, snapshot):
+        """
+        merge adds the snapshot provided to the recorded metrics, adding up
+        counters and summaries and replacing gauges
+        """
+        with self.lock:
+            for name, labels, value in snapshot:
+                key = (name, tuple(tuple(label) for label in labels))
+                if METRICS.get(name, (None, None))[0] == GAUGE:
+                    self.values[key] = value
+                else:
+                    self.values[key] = self.values.get(key, 0) + value
+
+    def render(self):
+        """
+        render returns every recorded metric in the Prometheus text format
+        """
+        with self.lock:
+            values = sorted(self.values.items())
+        lines = []
+        described = set()
+        for (name, labels), value in values:
+            family = name
+            for suffix in ("_sum", "_count"):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                    family = name[:-len(suffix)]
+            if family not in described:
+                metric_type, help_text = METRICS.get(family, ("untyped", ""))
+                lines.append(f"# HELP {PREFIX}{family} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{family} {metric_type}")
+                described.add(family)
+            lines.append(f"{PREFIX}{name}{format_labels(labels)} {float(value)!r}")
+        return "".join(line + "\n" for line in lines)
+
+    def write(self, path):
+        """
+        write writes the metrics to the file path provided, replacing it
+        atomically so a collector reading it never sees a partial write
+        """
+        data = self.render()
+        # only read while it is current, not worth syncing
+        replace_file(path, lambda telemetry_file: telemetry_file.write(data),
+                     prefix=".telemetry-", sync=False)
+
+    def listen(self, address):
+        """
+        listen binds an HTTP server to the (host, port) address provided,
+        serving the metrics on any path
+        """
+        # only the worker serves metrics, keep the HTTP server out of other modes' startup
+        import http.server # pylint: disable=import-outside-toplevel
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            """
+            RequestHandler responds to every GET with the rendered metrics
+            """
+            def do_GET(self): # pylint: disable=invalid-name
+                """
+                do_GET writes the rendered metrics as the response
+                """
+                body = self.server.telemetry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                # scrapes must not fill the worker's output
+                pass
+
+        server = http.server.HTTPServer(address, RequestHandler)
+        server.telemetry = self
+        return server
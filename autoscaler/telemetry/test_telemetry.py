@@ -0,0 +1,132 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import threading
+import urllib.request
+import pytest
+from .telemetry import (Telemetry, escape, PHASE_SECONDS, PHASE_LAST_SECONDS, LOAD_TEST_REQUESTS_PER_SECOND,
+                        RUNS_TOTAL)
+
+class FakeClock:
+    def __init__(self, times):
+        self.times = list(times)
+
+    def __call__(self):
+        return self.times.pop(0)
+
+def test_telemetry_span():
+    telemetry = Telemetry(clock=FakeClock([1, 1.5, 2, 4]))
+    with telemetry.span("load_test_run"):
+        pass
+    # phases are recorded even when they fail
+    with pytest.raises(Exception, match="fail"):
+        with telemetry.span("load_test_run"):
+            raise Exception("fail")
+    assert telemetry.get(PHASE_SECONDS + "_sum", phase="load_test_run") == 2.5
+    assert telemetry.get(PHASE_SECONDS + "_count", phase="load_test_run") == 2
+    assert telemetry.get(PHASE_LAST_SECONDS, phase="load_test_run") == 2
+
+def test_telemetry_merge():
+    telemetry = Telemetry(clock=FakeClock([1, 2]))
+    with telemetry.span("metric"):
+        pass
+    telemetry.inc(RUNS_TOTAL, mode="metric")
+    telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND, 10)
+
+    child = Telemetry(clock=FakeClock([1, 4]))
+    with child.span("metric"):
+        pass
+    child.inc(RUNS_TOTAL, mode="metric")
+    child.set(LOAD_TEST_REQUESTS_PER_SECOND, 20)
+    # snapshots are passed between processes as JSON
+    telemetry.merge(json.loads(json.dumps(child.snapshot())))
+
+    # counters and summaries add up, gauges take the child's value
+    assert telemetry.get(PHASE_SECONDS + "_sum", phase="metric") == 4
+    assert telemetry.get(PHASE_SECONDS + "_count", phase="metric") == 2
+    assert telemetry.get(PHASE_LAST_SECONDS, phase="metric") == 3
+    assert telemetry.get(RUNS_TOTAL, mode="metric") == 2
+    assert telemetry.get(LOAD_TEST_REQUESTS_PER_SECOND) == 20
+
+def test_telemetry_escape(subtests):
+    test_cases = [
+        {
+            "description": "Plain value unchanged",
+            "expected": "metric",
+            "value": "metric"
+        },
+        {
+            "description": "Quotes, backslashes and newlines escaped",
+            "expected": "a\\\\b\\\"c\\nd",
+            "value": "a\\b\"c\nd"
+        }
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            assert test_case["expected"] == escape(test_case["value"])
+
+def test_telemetry_render():
+    telemetry = Telemetry()
+    assert telemetry.render() == ""
+
+    telemetry.observe("evaluate", 0.25)
+    telemetry.inc(RUNS_TOTAL, mode="metric")
+    telemetry.inc(RUNS_TOTAL, mode="evaluate")
+    telemetry.inc(RUNS_TOTAL, mode="evaluate")
+    telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND, 12.5)
+    telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND, 10)
+    assert telemetry.render() == (
+        "# HELP locust_pod_autoscaler_load_test_requests_per_second "
+        "Requests per second generated by the last load test\n"
+        "# TYPE locust_pod_autoscaler_load_test_requests_per_second gauge\n"
+        "locust_pod_autoscaler_load_test_requests_per_second 10.0\n"
+        "# HELP locust_pod_autoscaler_phase_last_seconds Time spent in each phase the last time it ran, in seconds\n"
+        "# TYPE locust_pod_autoscaler_phase_last_seconds gauge\n"
+        "locust_pod_autoscaler_phase_last_seconds{phase=\"evaluate\"} 0.25\n"
+        "# HELP locust_pod_autoscaler_phase_seconds Time spent in each phase, in seconds\n"
+        "# TYPE locust_pod_autoscaler_phase_seconds summary\n"
+        "locust_pod_autoscaler_phase_seconds_count{phase=\"evaluate\"} 1.0\n"
+        "locust_pod_autoscaler_phase_seconds_sum{phase=\"evaluate\"} 0.25\n"
+        "# HELP locust_pod_autoscaler_runs_total Runs of each mode\n"
+        "# TYPE locust_pod_autoscaler_runs_total counter\n"
+        "locust_pod_autoscaler_runs_total{mode=\"evaluate\"} 2.0\n"
+        "locust_pod_autoscaler_runs_total{mode=\"metric\"} 1.0\n"
+    )
+
+def test_telemetry_write(tmp_path):
+    path = tmp_path / "autoscaler.prom"
+    path.write_text("stale")
+    telemetry = Telemetry()
+    telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND, 10)
+    telemetry.write(str(path))
+    assert path.read_text() == telemetry.render()
+    # no temporary files left behind
+    assert os.listdir(str(tmp_path)) == ["autoscaler.prom"]
+
+def test_telemetry_listen():
+    telemetry = Telemetry()
+    telemetry.set(LOAD_TEST_REQUESTS_PER_SECOND, 10)
+    server = telemetry.listen(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode("utf-8") == telemetry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,82 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .timeseries import TimeSeries, intervals, to_columns
+
+def cumulative(num_requests, response_times):
+    return {"num_requests": num_requests, "num_failures": 0,
+            "avg_response_time": sum(time * count for time, count in response_times.items()) / num_requests,
+            "max_response_time": max(response_times), "response_times": response_times}
+
+def test_time_series_sample(subtests):
+    test_cases = [
+        {
+            "description": "No samples, empty",
+            "expected": {"elapsed": [], "requests": {}},
+            "samples": []
+        },
+        {
+            "description": "Cumulative stats recorded per interval, requests seen later padded",
+            "expected": {
+                "elapsed": [1, 2, 2.5],
+                "requests": {
+                    "GET_/a": {
+                        "num_requests": [2, 2, 0],
+                        "num_failures": [0, 0, 0],
+                        "rps": [2, 2, 0],
+                        "avg_response_time": [1, 10, 0],
+                        "max_response_time": [1, 10, 0],
+                        "response_time_histogram": [[[1, 2]], [[10, 2]], []]
+                    },
+                    "GET_/b": {
+                        "num_requests": [0, 1, 1],
+                        "num_failures": [0, 0, 0],
+                        "rps": [0, 1, 2],
+                        "avg_response_time": [0, 5, 7],
+                        "max_response_time": [0, 5, 7],
+                        "response_time_histogram": [[], [[5, 1]], [[7, 1]]]
+                    }
+                }
+            },
+            "samples": [
+                ({"requests": {"GET_/a": cumulative(2, {1: 2})}}, 1),
+                ({"requests": {"GET_/a": cumulative(4, {1: 2, 10: 2}), "GET_/b": cumulative(1, {5: 1})}}, 2),
+                # no time passed, not recorded
+                ({"requests": {"GET_/a": cumulative(4, {1: 2, 10: 2}), "GET_/b": cumulative(1, {5: 1})}}, 2),
+                ({"requests": {"GET_/a": cumulative(4, {1: 2, 10: 2}), "GET_/b": cumulative(2, {5: 1, 7: 1})}}, 2.5)
+            ]
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            time_series = TimeSeries()
+            for stats, elapsed in test_case["samples"]:
+                assert not time_series.sample(stats, elapsed)
+            assert test_case["expected"] == time_series.get()
+
+def test_intervals_to_columns():
+    time_series = {
+        "elapsed": [1, 2],
+        "requests": {
+            "GET_/a": {"num_requests": [1, 3], "avg_response_time": [4, 5]}
+        }
+    }
+    interval_requests = intervals(time_series)
+    assert interval_requests == [
+        {"GET_/a": {"num_requests": 1, "avg_response_time": 4}},
+        {"GET_/a": {"num_requests": 3, "avg_response_time": 5}}
+    ]
+    assert to_columns(time_series["elapsed"], interval_requests,
+                      {"GET_/a": ["num_requests", "avg_response_time"]}) == time_series
@@ -0,0 +1,126 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Time series handles recording per request statistics for each interval
+between samples of a running load test, stored as columns, so that latency
+drift within a load test can be seen and windows of it evaluated
+"""
+from histogram.histogram import from_response_times
+from loadtest.loadtest import subtract_request
+from plan.plan import HISTOGRAM_FIELD
+
+# columns recorded for every request, the response time distribution of each
+# interval is recorded too, but only passed on for targets that need it
+COLUMNS = ["num_requests", "num_failures", "rps", "avg_response_time", "max_response_time"]
+
+EMPTY_INTERVAL = {
+    "num_requests": 0,
+    "num_failures": 0,
+    "rps": 0,
+    "avg_response_time": 0,
+    "max_response_time": 0,
+    HISTOGRAM_FIELD: []
+}
+
+def intervals(time_series):
+    """
+    intervals converts a columnar time series into the requests of each
+    interval, in the same shape as the requests of load test stats
+    """
+    requests = time_series.get("requests", {})
+    return [
+        {
+            name: {column: values[i] for column, values in columns.items()}
+            for name, columns in requests.items()
+        }
+        for i in range(len(time_series.get("elapsed", [])))
+    ]
+
+def to_columns(elapsed, interval_requests, columns):
+    """
+    to_columns converts the requests of each interval into a columnar time
+    series, keeping only the columns provided for each request name
+    """
+    requests = {}
+    for i, interval in enumerate(interval_requests):
+        for name, request in interval.items():
+            if name not in requests:
+                requests[name] = {column: [EMPTY_INTERVAL[column]] * i for column in columns[name]}
+            for column in columns[name]:
+                requests[name][column].append(request.get(column, EMPTY_INTERVAL[column]))
+        for name, request_columns in requests.items():
+            if name not in interval:
+                for column, values in request_columns.items():
+                    values.append(EMPTY_INTERVAL[column])
+    return {"elapsed": list(elapsed), "requests": requests}
+
+def select_intervals(index, time_series):
+    """
+    select_intervals returns the request each target reads in each interval
+    of the time series, aggregating requests matched by pattern targets
+    """
+    return [index.select(interval) for interval in intervals(time_series)]
+
+def lookup_intervals(index, time_series):
+    """
+    lookup_intervals returns the request each target reads in each interval
+    of a time series already aggregated under each target's name
+    """
+    return [index.lookup(interval) for interval in intervals(time_series)]
+
+class TimeSeries:
+    """
+    TimeSeries abstracts recording the statistics of each interval between
+    samples of a running load test, for each request
+    """
+    def __init__(self):
+        self.elapsed = []
+        self.interval_requests = []
+        self.previous = {}
+
+    def sample(self, stats, elapsed):
+        """
+        sample records the statistics gathered since the last sample, never
+        asking for the load test to stop
+        """
+        previous_elapsed = self.elapsed[-1] if self.elapsed else 0
+        duration = elapsed - previous_elapsed
+        if duration <= 0:
+            return False
+        interval = {}
+        for name, request in stats.get("requests", {}).items():
+            # stats are cumulative, take the difference from the last sample
+            delta = subtract_request(request, self.previous.get(name))
+            histogram = from_response_times(delta.get("response_times", {}))
+            interval[name] = {
+                "num_requests": delta.get("num_requests", 0),
+                "num_failures": delta.get("num_failures", 0),
+                "rps": delta.get("num_requests", 0) / duration,
+                "avg_response_time": delta.get("avg_response_time", 0),
+                "max_response_time": (histogram[-1][0] if histogram
+                                      else delta.get("max_response_time", 0)),
+                HISTOGRAM_FIELD: histogram
+            }
+            self.previous[name] = request
+        self.elapsed.append(elapsed)
+        self.interval_requests.append(interval)
+        return False
+
+    def get(self):
+        """
+        get returns the recorded time series in columns
+        """
+        names = {name for interval in self.interval_requests for name in interval}
+        return to_columns(self.elapsed, self.interval_requests,
+                          {name: COLUMNS + [HISTOGRAM_FIELD] for name in names})
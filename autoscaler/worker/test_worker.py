@@ -0,0 +1,293 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import socket
+import threading
+import pytest
+from profiling.profiling import Profiler, PROFILE_SAMPLING
+from .worker import Worker, WarmProcess, send_request, start_process, run_process, hung_up
+
+def echo_handler():
+    sys.stdout.write(sys.stdin.read())
+
+def test_worker_handle(subtests):
+    test_cases = [
+        {
+            "description": "Unknown mode",
+            "expected": {
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": "Unknown mode: invalid"
+            },
+            "handlers": {},
+            "request": {
+                "mode": "invalid",
+                "stdin": ""
+            }
+        },
+        {
+            "description": "Handler raises exception",
+            "expected_exit_code": 1,
+            "expected_stderr_contains": "fail to handle",
+            "handlers": {
+                "metric": lambda: (_ for _ in ()).throw(Exception("fail to handle"))
+            },
+            "request": {
+                "mode": "metric",
+                "stdin": ""
+            }
+        },
+        {
+            "description": "Handler exits with code",
+            "expected": {
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": "Error parsing locust settings"
+            },
+            "handlers": {
+                "metric": lambda: (sys.stderr.write("Error parsing locust settings"), sys.exit(1))
+            },
+            "request": {
+                "mode": "metric",
+                "stdin": ""
+            }
+        },
+        {
+            "description": "Handler exits with message",
+            "expected": {
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": "exit message"
+            },
+            "handlers": {
+                "metric": lambda: sys.exit("exit message")
+            },
+            "request": {
+                "mode": "metric",
+                "stdin": ""
+            }
+        },
+        {
+            "description": "Isolated mode, stdin passed and response returned",
+            "expected": {
+                "exit_code": 0,
+                "stdout": "test",
+                "stderr": ""
+            },
+            "handlers": {},
+            "isolated": {
+                "metric": lambda stdin, cancelled: {"exit_code": 0, "stdout": stdin, "stderr": ""}
+            },
+            "request": {
+                "mode": "metric",
+                "stdin": "test"
+            }
+        },
+        {
+            "description": "Success, stdin passed and stdout returned",
+            "expected": {
+                "exit_code": 0,
+                "stdout": "{\"target_replicas\": 3}",
+                "stderr": ""
+            },
+            "handlers": {
+                "evaluate": echo_handler
+            },
+            "request": {
+                "mode": "evaluate",
+                "stdin": "{\"target_replicas\": 3}"
+            }
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            worker = Worker(test_case["handlers"], test_case.get("isolated"))
+            original_stdin = sys.stdin
+            result = worker.handle(test_case["request"])
+            assert sys.stdin is original_stdin
+            if "expected" in test_case.keys():
+                assert test_case["expected"] == result
+            else:
+                assert test_case["expected_exit_code"] == result["exit_code"]
+                assert test_case["expected_stderr_contains"] in result["stderr"]
+
+def test_worker_serve(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    # leave a stale socket file behind, as if a previous worker crashed
+    open(socket_path, "w").close()
+
+    worker = Worker({"evaluate": echo_handler})
+    server = worker.listen(socket_path)
+    thread = threading.Thread(target=worker.serve, args=(server,))
+    thread.start()
+    try:
+        assert send_request(socket_path, "evaluate", "test") == {
+            "exit_code": 0,
+            "stdout": "test",
+            "stderr": ""
+        }
+        with pytest.raises(Exception) as ex:
+            Worker({}).listen(socket_path)
+        assert str(ex.value) == f"Worker already listening on socket: {socket_path}"
+    finally:
+        worker.stop()
+        thread.join()
+        server.server_close()
+    os.unlink(socket_path)
+
+    with pytest.raises(OSError):
+        send_request(socket_path, "evaluate", "test")
+
+def test_worker_serve_concurrently(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    release = threading.Event()
+
+    def blocking(stdin, cancelled):
+        release.wait(5)
+        return {"exit_code": 0, "stdout": stdin, "stderr": ""}
+
+    worker = Worker({"evaluate": echo_handler}, {"metric": blocking})
+    server = worker.listen(socket_path)
+    thread = threading.Thread(target=worker.serve, args=(server,))
+    thread.start()
+    responses = []
+    metric = threading.Thread(target=lambda: responses.append(send_request(socket_path, "metric", "metric")))
+    metric.start()
+    try:
+        # a long metric run doesn't hold up evaluate
+        assert send_request(socket_path, "evaluate", "evaluate", timeout=2)["stdout"] == "evaluate"
+        assert not responses
+    finally:
+        release.set()
+        metric.join()
+        worker.stop()
+        thread.join()
+        server.server_close()
+    assert responses[0]["stdout"] == "metric"
+
+def test_worker_serve_profiled(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    profile_directory = tmp_path / "profiles"
+
+    def busy_handler():
+        end = time.process_time() + 0.2
+        while time.process_time() < end:
+            pass
+        echo_handler()
+
+    profiler = Profiler({"evaluate"}, directory=str(profile_directory),
+                        profile_type=PROFILE_SAMPLING, sampling_interval=0.001)
+    worker = Worker({"evaluate": profiler.wrap("evaluate", busy_handler)})
+    server = worker.listen(socket_path)
+    responses = []
+
+    def client():
+        try:
+            responses.append(send_request(socket_path, "evaluate", "test", timeout=10))
+        finally:
+            worker.stop()
+
+    thread = threading.Thread(target=client)
+    thread.start()
+    # the sampling profiler can only sample the main thread, so the worker serves on it
+    try:
+        worker.serve(server)
+    finally:
+        thread.join()
+        server.server_close()
+    assert responses == [{"exit_code": 0, "stdout": "test", "stderr": ""}]
+    profiles = list(profile_directory.iterdir())
+    assert len(profiles) == 1
+    assert "busy_handler" in profiles[0].read_text()
+
+def test_send_request_timeout(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        # accepted by the kernel but never responded to
+        listener.bind(socket_path)
+        listener.listen(1)
+        with pytest.raises(socket.timeout):
+            send_request(socket_path, "evaluate", "test", timeout=0.1)
+
+def test_hung_up():
+    server, client = socket.socketpair(socket.AF_UNIX)
+    with server:
+        # the client only closes its writing end once the request is sent
+        client.shutdown(socket.SHUT_WR)
+        assert not hung_up(server)
+        client.close()
+        assert hung_up(server)
+
+def test_warm_process():
+    started = []
+
+    def start(args, env):
+        started.append(start_process(args, env))
+        return started[-1]
+
+    # writes its pid once started, before waiting on stdin
+    script = ("import os, sys; sys.stderr.write(str(os.getpid())); sys.stderr.flush(); "
+              "sys.stdout.write(sys.stdin.read())")
+    warm = WarmProcess([sys.executable, "-c", script], start=start)
+    warm.warm()
+    warm.warm()
+    assert len(started) == 1
+    try:
+        for i in range(2):
+            result = warm.run(f"run {i}", lambda: False, poll_interval=0.05)
+            # served by the process started ahead of the request, the next one already started
+            assert result == {"exit_code": 0, "stdout": f"run {i}", "stderr": str(started[i].pid)}
+            assert len(started) == i + 2
+            assert started[i + 1].poll() is None
+    finally:
+        warm.close()
+    assert started[-1].returncode is not None
+
+def test_run_process(subtests):
+    test_cases = [
+        {
+            "description": "Output and exit code returned",
+            "expected": {
+                "exit_code": 3,
+                "stdout": "test",
+                "stderr": "error"
+            },
+            "script": "import sys; sys.stdout.write(sys.stdin.read()); sys.stderr.write('error'); sys.exit(3)",
+            "cancel_after": None
+        },
+        {
+            "description": "Cancelled, process killed",
+            "expected": {
+                "exit_code": -9,
+                "stdout": "",
+                "stderr": ""
+            },
+            "script": "import time; time.sleep(30)",
+            "cancel_after": 0.2
+        },
+    ]
+
+    for i, test_case in enumerate(test_cases):
+        with subtests.test(msg=test_case["description"], i=i):
+            start = time.monotonic()
+            cancel_after = test_case["cancel_after"]
+            result = run_process([sys.executable, "-c", test_case["script"]], "test",
+                                 lambda: cancel_after is not None and time.monotonic() - start > cancel_after,
+                                 poll_interval=0.05)
+            assert test_case["expected"] == result
+            assert time.monotonic() - start < 10
@@ -0,0 +1,297 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Worker handles running autoscaler modes inside a long-lived process, taking
+requests over a local Unix socket so that each hook call is served by an
+already warm interpreter, or by a child process the worker can stop if the
+hook calling it is killed
+"""
+import io
+import os
+import sys
+import json
+import queue
+import select
+import signal
+import socket
+import threading
+import socketserver
+import traceback
+import contextlib
+
+DEFAULT_SOCKET_PATH = "/tmp/locust-autoscaler.sock"
+# seconds between checks that the client is still waiting on a child process
+DEFAULT_POLL_INTERVAL = 0.1
+
+def send_request(socket_path, mode, stdin, timeout=None):
+    """
+    send_request sends a mode and its stdin to the worker listening on the
+    socket path provided, returning the worker's response, raising
+    socket.timeout if the worker doesn't respond within the timeout in seconds
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall(json.dumps({
+            "mode": mode,
+            "stdin": stdin
+        }).encode("utf-8"))
+        # signal end of request
+        conn.shutdown(socket.SHUT_WR)
+        data = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    if data == b"":
+        raise Exception("Worker closed connection without responding")
+    return json.loads(data.decode("utf-8"))
+
+def hung_up(conn):
+    """
+    hung_up returns if the client has closed its end of the connection
+    provided, as it does when killed by a hook timing out
+    """
+    poller = select.poll()
+    poller.register(conn, select.POLLHUP)
+    return any(event & (select.POLLHUP | select.POLLERR) for _, event in poller.poll(0))
+
+def start_process(args, env=None):
+    """
+    start_process starts the command provided in a new process group, with
+    pipes for its stdin, stdout and stderr
+    """
+    # only modes run in a child process need it, keep it out of evaluate's startup
+    import subprocess # pylint: disable=import-outside-toplevel
+    return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, env=env, universal_newlines=True,
+                            start_new_session=True)
+
+def run_process(args, stdin, cancelled, env=None, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    run_process runs the command provided in a new process group, returning
+    its output in the same form as a worker response, killing the group if
+    cancelled returns True before it exits
+    """
+    return wait_process(start_process(args, env), stdin, cancelled, poll_interval)
+
+def wait_process(process, stdin, cancelled, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    wait_process sends the stdin provided to a process started by
+    start_process and waits for it to exit, returning its output in the same
+    form as a worker response, killing its group if cancelled returns True
+    before it exits
+    """
+    import subprocess # pylint: disable=import-outside-toplevel
+    while True:
+        try:
+            # the input is only sent by the first call, later calls carry on reading output
+            stdout, stderr = process.communicate(stdin, timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            stdin = None
+            if cancelled():
+                # the group includes any load test worker processes it spawned
+                os.killpg(process.pid, signal.SIGKILL)
+                stdout, stderr = process.communicate()
+                break
+    return {
+        "exit_code": process.returncode,
+        "stdout": stdout,
+        "stderr": stderr
+    }
+
+class WarmProcess:
+    """
+    WarmProcess abstracts keeping a process started ahead of the request it
+    serves, so it has finished starting up and is waiting on stdin by the
+    time a request arrives. Each process serves a single request, the next
+    is started as soon as one is taken
+    """
+    def __init__(self, args, env=None, start=start_process):
+        self.args = args
+        self.env = env
+        self.start = start
+        self.lock = threading.Lock()
+        self.process = None
+
+    def warm(self):
+        """
+        warm starts a process ready for the next request, if there isn't one
+        """
+        with self.lock:
+            if self.process is None:
+                self.process = self.start(self.args, self.env)
+
+    def run(self, stdin, cancelled, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        run sends the stdin provided to the warm process, returning its output
+        in the same form as a worker response, killing it if cancelled returns
+        True before it exits
+        """
+        with self.lock:
+            process = self.process
+            if process is None or process.poll() is not None:
+                # not warmed yet, or died while waiting
+                process = self.start(self.args, self.env)
+            self.process = self.start(self.args, self.env)
+        return wait_process(process, stdin, cancelled, poll_interval)
+
+    def close(self):
+        """
+        close stops the process waiting for a request, if any
+        """
+        with self.lock:
+            process, self.process = self.process, None
+        if process is not None:
+            process.kill()
+            process.communicate()
+
+class Worker:
+    """
+    Worker abstracts serving mode requests, running the handler for the mode
+    with stdin, stdout and stderr redirected to the request and response.
+    Requests are served concurrently, so a quick mode isn't held up behind a
+    long one, though handlers run one at a time on the thread serving the
+    worker, as the redirects are process wide. Isolated modes run in a child
+    process instead, each a function of the request's stdin and a check for
+    the client having hung up, returning the response
+    """
+    def __init__(self, handlers, isolated=None):
+        self.handlers = handlers
+        self.isolated = isolated or {}
+        self.pending = queue.Queue()
+
+    def handle(self, request, cancelled=lambda: False):
+        """
+        handle runs the handler for the mode in the request provided,
+        capturing its output and exit code
+        """
+        mode = request.get("mode")
+        if mode in self.isolated:
+            return self.isolated[mode](request.get("stdin", ""), cancelled)
+        if mode not in self.handlers:
+            return {
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": f"Unknown mode: {mode}"
+            }
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = 0
+        original_stdin = sys.stdin
+        sys.stdin = io.StringIO(request.get("stdin", ""))
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    self.handlers[mode]()
+                except SystemExit as err:
+                    exit_code = self.__exit_code(err)
+                except Exception: # pylint: disable=broad-except
+                    # a failing run must not take down the worker
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            sys.stdin = original_stdin
+
+        return {
+            "exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue()
+        }
+
+    def listen(self, socket_path):
+        """
+        listen binds a server to the socket path provided, ready to serve
+        requests, removing any stale socket left by a previous worker
+        """
+        if os.path.exists(socket_path):
+            try:
+                send_request(socket_path, None, "")
+            except OSError:
+                # nothing is listening, socket is stale
+                os.unlink(socket_path)
+            else:
+                raise Exception(f"Worker already listening on socket: {socket_path}")
+
+        worker = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            """
+            RequestHandler reads a single JSON request and writes back the
+            JSON response
+            """
+            def handle(self):
+                request = json.loads(self.rfile.read().decode("utf-8"))
+                response = worker.dispatch(request, lambda: hung_up(self.connection))
+                try:
+                    self.wfile.write(json.dumps(response).encode("utf-8"))
+                except BrokenPipeError:
+                    # the client was killed before the response was ready
+                    pass
+
+        server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+        # a request still running when the worker stops is abandoned, as its client would be
+        server.daemon_threads = True
+        return server
+
+    def dispatch(self, request, cancelled=lambda: False):
+        """
+        dispatch handles the request provided for a thread serving it,
+        running isolated modes straight away and passing the rest to the
+        thread serving the worker, waiting for their response
+        """
+        if request.get("mode") in self.isolated:
+            return self.handle(request, cancelled)
+        response = queue.Queue(maxsize=1)
+        self.pending.put((request, response))
+        return response.get()
+
+    def serve(self, server):
+        """
+        serve runs the server provided until stop is called, handling
+        requests that aren't isolated one at a time on the calling thread.
+        Called from the main thread, handlers can use signals, as the sampling
+        profiler does
+        """
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while True:
+                pending = self.pending.get()
+                if pending is None:
+                    break
+                request, response = pending
+                response.put(self.handle(request))
+        finally:
+            server.shutdown()
+            thread.join()
+
+    def stop(self):
+        """
+        stop stops serving once the request being handled, if any, is done
+        """
+        self.pending.put(None)
+
+    @staticmethod
+    def __exit_code(err):
+        if err.code is None:
+            return 0
+        if isinstance(err.code, int):
+            return err.code
+        # sys.exit with a message prints it and exits with 1
+        sys.stderr.write(str(err.code))
+        return 1
@@ -0,0 +1,85 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Convergence benchmarks, simulating each scaling policy against changing load
+on a model of the example fibonacci service and reporting how quickly and
+cheaply it converges, failing if a simulation goes over budget
+"""
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from simulator import QueueingModel, Simulator, step_load, ramp_load, wave_load
+# pylint: enable=wrong-import-position
+
+INTERVALS = int(os.getenv("BENCH_CONVERGENCE_INTERVALS", default="2000"))
+STARTUP_INTERVALS = int(os.getenv("BENCH_CONVERGENCE_STARTUP_INTERVALS", default="2"))
+SIMULATION_BUDGET_S = float(os.getenv("BENCH_CONVERGENCE_BUDGET_S", default="5"))
+
+TARGETS = [{"method": "GET", "endpoint": "/fibonacci?n=10", "type": "p95", "target": 20}]
+DECAY = {"replicas": 1, "unchangedRuns": 3}
+
+POLICIES = {
+    "step": {
+        "targets": TARGETS,
+        "decay": DECAY
+    },
+    "proportional": {
+        "targets": TARGETS,
+        "decay": DECAY,
+        "scaling": {"mode": "proportional", "maxStep": 5}
+    },
+    "predictive": {
+        "targets": TARGETS,
+        "decay": DECAY,
+        "scaling": {"mode": "proportional", "maxStep": 5},
+        "history": {"size": 100},
+        "predictive": {"method": "holt", "window": 10}
+    },
+    "headroom": {
+        "targets": TARGETS,
+        "decay": {"mode": "headroom", "unchangedRuns": 3},
+        "scaling": {"mode": "proportional", "maxStep": 5}
+    }
+}
+
+# request rates, in requests per second, the fibonacci model needs ~20 replicas to serve the peak of
+LOADS = {
+    "step": step_load(100, 2000, 600),
+    "ramp": ramp_load(100, 2000, 600, 4200),
+    "wave": wave_load(100, 2000, 6 * 3600)
+}
+
+@pytest.mark.parametrize("policy", POLICIES)
+@pytest.mark.parametrize("load", LOADS)
+def test_convergence(policy, load):
+    simulator = Simulator(QueueingModel.fibonacci(10), LOADS[load], POLICIES[policy],
+                          startup_intervals=STARTUP_INTERVALS)
+    start = time.perf_counter()
+    result = simulator.run(INTERVALS)
+    elapsed = time.perf_counter() - start
+
+    time_to_target = result["time_to_target"]
+    mean_time_to_target = sum(time_to_target) / len(time_to_target) if time_to_target else 0
+    sys.stdout.write(f"\n{policy} scaling, {load} load, {INTERVALS} intervals in {elapsed:.2f}s: "
+                     f"time to target {mean_time_to_target:.0f}s mean ({len(time_to_target)} rises), "
+                     f"overshoot {result['overshoot']} replicas, "
+                     f"{result['replica_seconds'] / 3600:.0f} replica-hours, "
+                     f"{result['breach_intervals']} breach intervals, {result['scale_events']} scale events\n")
+    assert elapsed <= SIMULATION_BUDGET_S, \
+        f"simulation {elapsed:.2f}s over budget of {SIMULATION_BUDGET_S:.2f}s"
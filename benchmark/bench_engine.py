@@ -0,0 +1,159 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Load engine benchmarks, measuring the requests per second each load engine
+generates per core of CPU time against a local server, failing if the native
+engine goes under budget or generates fewer requests per core than locust
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import subprocess
+import importlib.util
+import pytest
+
+AUTOSCALER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autoscaler")
+
+RUN_TIME = os.getenv("BENCH_ENGINE_RUN_TIME", default="5")
+USERS = os.getenv("BENCH_ENGINE_USERS", default="50")
+MIN_RPS_PER_CORE = float(os.getenv("BENCH_ENGINE_MIN_RPS_PER_CORE", default="2000"))
+
+ENDPOINT = "/fibonacci?n=10"
+
+EVALUATION_CONFIG = f"""
+targets:
+  - method: "GET"
+    endpoint: "{ENDPOINT}"
+    type: "p95"
+    target: 5
+decay:
+  replicas: 1
+  unchangedRuns: 3
+"""
+
+LOCUSTFILE = f"""
+from locust import HttpLocust, TaskSet, task, constant
+
+class UserBehavior(TaskSet):
+    @task(1)
+    def request(self):
+        self.client.get("{ENDPOINT}")
+
+class WebsiteUser(HttpLocust):
+    task_set = UserBehavior
+    wait_time = constant(0)
+"""
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok"
+
+async def handle(reader, writer):
+    """
+    handle responds to every request on a keep-alive connection with a fixed
+    response
+    """
+    try:
+        while True:
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(RESPONSE)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+def serve(port):
+    """
+    serve serves fixed responses on the local port provided until killed
+    """
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", port))
+    loop.run_forever()
+
+def free_port():
+    """
+    free_port returns a local port nothing is listening on
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(name="server_env")
+def fixture_server_env(tmp_path):
+    port = free_port()
+    # the server runs in its own process, so only the load engine's CPU time is measured
+    server = subprocess.Popen([sys.executable, __file__, str(port)])
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except ConnectionRefusedError:
+                assert time.monotonic() < deadline, "server did not start"
+                time.sleep(0.01)
+        eval_config_path = tmp_path / "evaluation_config.yaml"
+        eval_config_path.write_text(EVALUATION_CONFIG)
+        locustfile_path = tmp_path / "locustfile.py"
+        locustfile_path.write_text(LOCUSTFILE)
+        env = dict(os.environ)
+        env.update({
+            "locustHost": f"http://127.0.0.1:{port}",
+            "locustUsers": USERS,
+            "locustHatchRate": USERS,
+            "locustRunTime": RUN_TIME,
+            "locustFilePath": str(locustfile_path),
+            "evaluationConfigFilePath": str(eval_config_path)
+        })
+        yield env
+    finally:
+        server.terminate()
+        server.wait()
+
+def measure(engine, env, tmp_path):
+    """
+    measure runs a metric run with the load engine provided, returning the
+    requests made per second of CPU time the run used, including startup
+    """
+    # locust logs to stderr as it runs, write it to a file so it can't fill the pipe
+    with open(str(tmp_path / f"{engine}.log"), "w+") as stderr:
+        process = subprocess.Popen([sys.executable, os.path.join(AUTOSCALER_DIR, "autoscaler.py"), "metric"],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+                                   env=dict(env, loadTestEngine=engine))
+        process.stdin.write(json.dumps({"spec": {"replicas": 1}}).encode("utf-8"))
+        process.stdin.close()
+        stdout = process.stdout.read()
+        process.stdout.close()
+        _, status, rusage = os.wait4(process.pid, 0)
+        stderr.seek(0)
+        assert os.WEXITSTATUS(status) == 0, stderr.read()
+    num_requests = json.loads(stdout)["num_requests"]
+    cpu_seconds = rusage.ru_utime + rusage.ru_stime
+    sys.stdout.write(f"\n{engine} engine: {num_requests} requests in {RUN_TIME}s, {cpu_seconds:.2f}s CPU, "
+                     f"{num_requests / cpu_seconds:.0f} requests per second per core\n")
+    return num_requests / cpu_seconds
+
+def test_native_engine(server_env, tmp_path):
+    rps_per_core = measure("native", server_env, tmp_path)
+    assert rps_per_core >= MIN_RPS_PER_CORE, \
+        f"native engine {rps_per_core:.0f} requests per second per core under budget of {MIN_RPS_PER_CORE:.0f}"
+
+@pytest.mark.skipif(importlib.util.find_spec("invokust") is None, reason="invokust not installed")
+def test_native_engine_faster_than_locust(server_env, tmp_path):
+    native = measure("native", server_env, tmp_path)
+    locust = measure("locust", server_env, tmp_path)
+    assert native > locust, \
+        f"native engine {native:.0f} requests per second per core, not more than locust's {locust:.0f}"
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]))
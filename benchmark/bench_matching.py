@@ -0,0 +1,74 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Target matching benchmarks, measuring how long it takes to match thousands of
+request names against hundreds of pattern targets, failing if either the first
+match or a match of names that have grown since the last goes over budget
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autoscaler"))
+
+from plan.plan import TargetIndex, compile_targets # pylint: disable=wrong-import-position
+
+RUNS = int(os.getenv("BENCH_MATCHING_RUNS", default="20"))
+REQUEST_NAMES = int(os.getenv("BENCH_MATCHING_REQUEST_NAMES", default="5000"))
+PATTERNS = int(os.getenv("BENCH_MATCHING_PATTERNS", default="200"))
+MATCHING_BUDGET_MS = float(os.getenv("BENCH_MATCHING_BUDGET_MS", default="1"))
+FIRST_MATCHING_BUDGET_MS = float(os.getenv("BENCH_FIRST_MATCHING_BUDGET_MS", default="5"))
+
+def build(request_names, patterns):
+    """
+    build returns pattern targets for distinct resources, half globs and half
+    regexes, and requests with IDs in their names spread across those resources
+    """
+    targets = [{"method": "GET", "endpoint": f"/resource{i}/*", "match": "glob", "type": "mean", "target": 5}
+               if i % 2 == 0 else
+               {"method": "GET", "endpoint": rf"/resource{i}/\d+", "match": "regex", "type": "mean", "target": 5}
+               for i in range(patterns)]
+    requests = {f"GET_/resource{i % (patterns * 2)}/{i}": {"num_requests": 1, "avg_response_time": 1}
+                for i in range(request_names)}
+    return targets, requests
+
+def time_match(index, requests):
+    """
+    time_match returns how long matching the request names to each target
+    took, in milliseconds
+    """
+    start = time.perf_counter()
+    index.match(requests)
+    return (time.perf_counter() - start) * 1000
+
+def test_pattern_matching():
+    # the first match is of a fresh index, as metric projects results in a new process each run,
+    # later matches are of samples taken as the load test runs, each with a new request name
+    targets, requests = build(REQUEST_NAMES + 1, PATTERNS)
+    first_requests = dict(list(requests.items())[:-1])
+    first = []
+    grown = []
+    for _ in range(RUNS):
+        index = TargetIndex(compile_targets(targets))
+        first.append(time_match(index, first_requests))
+        grown.append(time_match(index, requests))
+    first_ms = statistics.median(first)
+    grown_ms = statistics.median(grown)
+    sys.stdout.write(f"\n{REQUEST_NAMES} request names, {PATTERNS} patterns: first match {first_ms:.2f}ms, "
+                     f"one name added {grown_ms:.2f}ms (median of {RUNS})\n")
+    assert first_ms <= FIRST_MATCHING_BUDGET_MS, \
+        f"first match {first_ms:.2f}ms over budget of {FIRST_MATCHING_BUDGET_MS:.2f}ms"
+    assert grown_ms <= MATCHING_BUDGET_MS, \
+        f"matching {grown_ms:.2f}ms over budget of {MATCHING_BUDGET_MS:.2f}ms"
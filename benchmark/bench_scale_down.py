@@ -0,0 +1,95 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Scale down benchmarks, simulating headroom decay against fixed decay on a
+model of the example fibonacci service and reporting the replica-seconds
+headroom decay saves, failing if it uses more replica-seconds shrinking an
+over-provisioned deployment or breaches targets more often than fixed decay
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from simulator import QueueingModel, Simulator, step_load, wave_load
+# pylint: enable=wrong-import-position
+
+INTERVALS = int(os.getenv("BENCH_SCALE_DOWN_INTERVALS", default="2000"))
+OVER_PROVISIONED_INTERVALS = int(os.getenv("BENCH_SCALE_DOWN_OVER_PROVISIONED_INTERVALS", default="240"))
+STARTUP_INTERVALS = int(os.getenv("BENCH_SCALE_DOWN_STARTUP_INTERVALS", default="2"))
+INITIAL_REPLICAS = int(os.getenv("BENCH_SCALE_DOWN_INITIAL_REPLICAS", default="40"))
+
+TARGETS = [{"method": "GET", "endpoint": "/fibonacci?n=10", "type": "p95", "target": 20}]
+SCALING = {"mode": "proportional", "maxStep": 5}
+
+DECAYS = {
+    "fixed": {"replicas": 1, "unchangedRuns": 3},
+    "headroom": {"mode": "headroom", "unchangedRuns": 3}
+}
+
+# request rates, in requests per second, the fibonacci model needs ~20 replicas to serve the peak of
+OVER_PROVISIONED_LOADS = {
+    "low": lambda time: 100,
+    "medium": lambda time: 500,
+    "high": lambda time: 1500
+}
+LOADS = {
+    "step up": step_load(100, 2000, 600),
+    "step down": step_load(2000, 100, 3000),
+    "wave": wave_load(100, 2000, 6 * 3600)
+}
+
+def simulate(decay, load, intervals):
+    """
+    simulate runs the decay provided against the load provided, starting
+    over-provisioned
+    """
+    simulator = Simulator(QueueingModel.fibonacci(10), load,
+                          {"targets": TARGETS, "decay": DECAYS[decay], "scaling": SCALING},
+                          initial_replicas=INITIAL_REPLICAS, startup_intervals=STARTUP_INTERVALS)
+    return simulator.run(intervals)
+
+def report(load, intervals, fixed, headroom):
+    """
+    report writes the replica-seconds headroom decay saved over fixed decay
+    """
+    saved = fixed["replica_seconds"] - headroom["replica_seconds"]
+    sys.stdout.write(f"\n{load} load, {intervals} intervals from {INITIAL_REPLICAS} replicas: "
+                     f"fixed {fixed['replica_seconds'] / 3600:.1f} replica-hours, "
+                     f"{fixed['breach_intervals']} breach intervals, {fixed['scale_events']} scale events; "
+                     f"headroom {headroom['replica_seconds'] / 3600:.1f} replica-hours, "
+                     f"{headroom['breach_intervals']} breach intervals, {headroom['scale_events']} scale events; "
+                     f"saved {saved / 3600:.1f} replica-hours ({100 * saved / fixed['replica_seconds']:.0f}%)\n")
+
+@pytest.mark.parametrize("load", OVER_PROVISIONED_LOADS)
+def test_scale_down_over_provisioned(load):
+    fixed = simulate("fixed", OVER_PROVISIONED_LOADS[load], OVER_PROVISIONED_INTERVALS)
+    headroom = simulate("headroom", OVER_PROVISIONED_LOADS[load], OVER_PROVISIONED_INTERVALS)
+    report(load, OVER_PROVISIONED_INTERVALS, fixed, headroom)
+    assert headroom["replica_seconds"] <= fixed["replica_seconds"], \
+        "headroom decay used more replica-seconds than fixed decay shrinking an over-provisioned deployment"
+    assert headroom["breach_intervals"] <= fixed["breach_intervals"], \
+        "headroom decay breached targets more often than fixed decay"
+
+@pytest.mark.parametrize("load", LOADS)
+def test_scale_down_changing_load(load):
+    fixed = simulate("fixed", LOADS[load], INTERVALS)
+    headroom = simulate("headroom", LOADS[load], INTERVALS)
+    report(load, INTERVALS, fixed, headroom)
+    # fixed decay keeps stepping into breaches under steady load, headroom decay remembers them, trading a few
+    # replica-seconds for far fewer breaches, so only breaches are compared
+    assert headroom["breach_intervals"] <= fixed["breach_intervals"], \
+        "headroom decay breached targets more often than fixed decay"
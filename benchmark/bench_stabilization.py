@@ -0,0 +1,89 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Stabilization benchmarks, simulating proportional scaling with and without
+stabilization against noisy load test results on a model of the example
+fibonacci service, reporting the reduction in scale events and failing if
+stabilization doesn't reduce them or breaches too much more
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from simulator import QueueingModel, Simulator, step_load, wave_load
+# pylint: enable=wrong-import-position
+
+INTERVALS = int(os.getenv("BENCH_STABILIZATION_INTERVALS", default="2000"))
+STARTUP_INTERVALS = int(os.getenv("BENCH_STABILIZATION_STARTUP_INTERVALS", default="2"))
+NOISE = float(os.getenv("BENCH_STABILIZATION_NOISE", default="0.15"))
+SEED = int(os.getenv("BENCH_STABILIZATION_SEED", default="1"))
+# most extra breach intervals stabilization may cost, as a fraction of the intervals simulated
+MAX_EXTRA_BREACH_RATIO = float(os.getenv("BENCH_STABILIZATION_MAX_EXTRA_BREACH_RATIO", default="0.02"))
+
+TARGETS = [{"method": "GET", "endpoint": "/fibonacci?n=10", "type": "p95", "target": 20}]
+DECAY = {"replicas": 1, "unchangedRuns": 3}
+SCALING = {"mode": "proportional", "maxStep": 5}
+
+POLICIES = {
+    "unstabilized": {
+        "targets": TARGETS,
+        "decay": DECAY,
+        "scaling": SCALING
+    },
+    "stabilized": {
+        "targets": TARGETS,
+        "decay": DECAY,
+        "scaling": SCALING,
+        "stabilization": {
+            "upperBand": 1,
+            "lowerBand": 0.8,
+            "consecutiveBreaches": 2,
+            "scaleUpCooldownRuns": 2,
+            "scaleDownCooldownRuns": 10
+        }
+    }
+}
+
+# request rates, in requests per second, the fibonacci model needs ~20 replicas to serve the peak of
+LOADS = {
+    "constant": lambda time: 1000,
+    "step": step_load(100, 2000, 600),
+    "wave": wave_load(100, 2000, 6 * 3600)
+}
+
+@pytest.mark.parametrize("load", LOADS)
+def test_stabilization(load):
+    results = {}
+    for policy, eval_config in POLICIES.items():
+        simulator = Simulator(QueueingModel.fibonacci(10), LOADS[load], eval_config,
+                              startup_intervals=STARTUP_INTERVALS, noise=NOISE, seed=SEED)
+        results[policy] = simulator.run(INTERVALS)
+        sys.stdout.write(f"\n{policy}, {load} load, {NOISE:.0%} noise: "
+                         f"{results[policy]['scale_events']} scale events, "
+                         f"{results[policy]['breach_intervals']} breach intervals, "
+                         f"{results[policy]['replica_seconds'] / 3600:.0f} replica-hours")
+
+    unstabilized, stabilized = results["unstabilized"], results["stabilized"]
+    reduction = 1 - stabilized["scale_events"] / unstabilized["scale_events"] if unstabilized["scale_events"] else 0
+    sys.stdout.write(f"\nstabilization, {load} load: {reduction:.0%} fewer scale events\n")
+    assert stabilized["scale_events"] < unstabilized["scale_events"], \
+        f"stabilization made {stabilized['scale_events']} scale events, no fewer than " \
+        f"{unstabilized['scale_events']} without"
+    extra_breaches = stabilized["breach_intervals"] - unstabilized["breach_intervals"]
+    assert extra_breaches <= MAX_EXTRA_BREACH_RATIO * INTERVALS, \
+        f"stabilization breached in {extra_breaches} more intervals, over budget of " \
+        f"{MAX_EXTRA_BREACH_RATIO * INTERVALS:.0f}"
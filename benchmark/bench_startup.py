@@ -0,0 +1,168 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Startup benchmarks, measuring wall clock time and peak RSS of each autoscaler
+mode starting up, failing if evaluate startup goes over budget
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+import pytest
+
+AUTOSCALER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autoscaler")
+
+RUNS = int(os.getenv("BENCH_STARTUP_RUNS", default="10"))
+EVALUATE_STARTUP_BUDGET_MS = float(os.getenv("BENCH_EVALUATE_STARTUP_BUDGET_MS", default="500"))
+
+LOAD_TEST_MODULES = ["invokust", "locust", "gevent", "httpload.httpload"]
+
+EVALUATION_CONFIG = """
+targets:
+  - method: "GET"
+    endpoint: "/test"
+    type: "mean"
+    target: 5
+decay:
+  replicas: 1
+  unchangedRuns: 3
+"""
+
+EVALUATE_STDIN = json.dumps({
+    "run_type": "scaler",
+    "metrics": [
+        {
+            "resource": "test",
+            "value": json.dumps({
+                "current_replicas": 2,
+                "requests": {
+                    "GET_/test": {
+                        "avg_response_time": 4
+                    }
+                }
+            })
+        }
+    ]
+})
+
+# The peak RSS is read by the child itself from VmHWM at exit, the high water
+# mark of its own address space. The ru_maxrss reported by wait4 or getrusage
+# carries over the high water mark from before exec, which after forking is
+# the benchmark process, so would measure pytest rather than the autoscaler.
+PEAK_RSS_LAUNCHER = """
+import os, sys, atexit, runpy
+
+def write_peak_rss():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                with open(os.environ["BENCH_PEAK_RSS_PATH"], "w") as peak_rss:
+                    peak_rss.write(line.split()[1])
+
+atexit.register(write_peak_rss)
+sys.argv = sys.argv[1:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+def measure(args, stdin, env):
+    """
+    measure runs the Python script and arguments provided a number of times,
+    returning the median wall clock time in milliseconds and the peak RSS in
+    kilobytes
+    """
+    timings = []
+    peak_rss = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        peak_rss_path = os.path.join(tmp_dir, "peak_rss")
+        env = dict(env, BENCH_PEAK_RSS_PATH=peak_rss_path)
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", PEAK_RSS_LAUNCHER] + args,
+                                     input=stdin.encode("utf-8"), stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, env=env)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert process.returncode == 0, process.stderr.decode("utf-8")
+            assert process.stdout
+            with open(peak_rss_path) as peak_rss_file:
+                peak_rss = max(peak_rss, int(peak_rss_file.read()))
+    return statistics.median(timings), peak_rss
+
+def report(name, timing_ms, peak_rss_kb):
+    """
+    report writes a benchmark result line to stdout
+    """
+    sys.stdout.write(f"\n{name}: startup {timing_ms:.1f}ms (median of {RUNS}), peak RSS {peak_rss_kb / 1024:.1f}MB\n")
+
+@pytest.fixture(name="evaluate_env")
+def fixture_evaluate_env(tmp_path):
+    eval_config_path = tmp_path / "evaluation_config.yaml"
+    eval_config_path.write_text(EVALUATION_CONFIG)
+    env = dict(os.environ)
+    env["evaluationConfigFilePath"] = str(eval_config_path)
+    env["decayInfoFilePath"] = str(tmp_path / "decay_info.json")
+    env["workerSocketPath"] = str(tmp_path / "worker.sock")
+    return env
+
+def test_evaluate_startup(evaluate_env):
+    timing_ms, peak_rss_kb = measure([os.path.join(AUTOSCALER_DIR, "autoscaler.py"), "evaluate"],
+                                     EVALUATE_STDIN, evaluate_env)
+    report("evaluate", timing_ms, peak_rss_kb)
+    assert timing_ms <= EVALUATE_STARTUP_BUDGET_MS, \
+        f"evaluate startup {timing_ms:.1f}ms over budget of {EVALUATE_STARTUP_BUDGET_MS:.1f}ms"
+
+def test_evaluate_does_not_import_load_test(evaluate_env):
+    script = (
+        "import sys, json\n"
+        "import autoscaler\n"
+        "autoscaler.gather_evaluation()\n"
+        f"loaded = [name for name in {LOAD_TEST_MODULES!r} if name in sys.modules]\n"
+        "sys.stderr.write(json.dumps(loaded))\n"
+    )
+    process = subprocess.run([sys.executable, "-c", script], input=EVALUATE_STDIN, cwd=AUTOSCALER_DIR,
+                             env=evaluate_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    assert json.loads(process.stderr) == []
+
+def test_client_evaluate_startup(evaluate_env):
+    server = subprocess.Popen([sys.executable, os.path.join(AUTOSCALER_DIR, "autoscaler.py"), "worker"],
+                              env=evaluate_env)
+    try:
+        socket_path = evaluate_env["workerSocketPath"]
+        deadline = time.monotonic() + 10
+        while not os.path.exists(socket_path):
+            assert time.monotonic() < deadline, "worker did not start"
+            time.sleep(0.01)
+        timing_ms, peak_rss_kb = measure([os.path.join(AUTOSCALER_DIR, "client.py"), "evaluate"],
+                                         EVALUATE_STDIN, evaluate_env)
+    finally:
+        server.terminate()
+        server.wait()
+    report("client evaluate (warm worker)", timing_ms, peak_rss_kb)
+    assert timing_ms <= EVALUATE_STARTUP_BUDGET_MS, \
+        f"client evaluate startup {timing_ms:.1f}ms over budget of {EVALUATE_STARTUP_BUDGET_MS:.1f}ms"
+
+@pytest.mark.skipif(importlib.util.find_spec("invokust") is None, reason="invokust not installed")
+def test_metric_startup(evaluate_env, tmp_path):
+    # metric startup is everything before the load test begins, the autoscaler
+    # modules plus the load testing stack
+    script_path = tmp_path / "metric_startup.py"
+    script_path.write_text(f"import sys\nsys.path.insert(0, {AUTOSCALER_DIR!r})\n"
+                           "import autoscaler, invokust\nprint('ok')\n")
+    timing_ms, peak_rss_kb = measure([str(script_path)], "", evaluate_env)
+    report("metric", timing_ms, peak_rss_kb)
@@ -0,0 +1,295 @@
+# Copyright 2020 Locust Pod Autoscaler Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Simulator handles running the real evaluation logic in a closed loop against
+a model of how a service's latency responds to load and replica count, so
+scaling policies can be compared without a cluster
+"""
+import os
+import sys
+import copy
+import math
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autoscaler"))
+
+# pylint: disable=wrong-import-position
+from plan.plan import Plan
+from decay.decay import DecayHandler
+from evaluate.evaluate import Evaluate, PAYLOAD_VERSION
+from histogram.histogram import round_response_time
+# pylint: enable=wrong-import-position
+
+# quantiles the modelled response time distribution is built from, as
+# multiples of the mean of an exponential distribution
+DISTRIBUTION_POINTS = 200
+EXPONENTIAL_QUANTILES = [-math.log(1 - (i + 0.5) / DISTRIBUTION_POINTS) for i in range(DISTRIBUTION_POINTS)]
+# most modelled requests remembered, the same replicas and load recur often
+MAX_CACHED_REQUESTS = 10000
+# utilisation a saturated replica is modelled at, rather than an unbounded queue
+MAX_UTILISATION = 0.99
+
+def fibonacci_calls(n):
+    """
+    fibonacci_calls returns the number of calls the recursive fibonacci in
+    example/app/api.py makes to calculate the nth number
+    """
+    calls = [1, 1]
+    for _ in range(2, n):
+        calls.append(1 + calls[-1] + calls[-2])
+    return calls[min(n, 2) - 1] if n <= 2 else calls[-1]
+
+def step_load(base, peak, at):
+    """
+    step_load returns a load profile stepping from the base to the peak
+    request rate at the time provided, in seconds
+    """
+    return lambda time: peak if time >= at else base
+
+def ramp_load(base, peak, start, end):
+    """
+    ramp_load returns a load profile rising linearly from the base to the
+    peak request rate between the times provided, in seconds
+    """
+    def load(time):
+        if time <= start:
+            return base
+        if time >= end:
+            return peak
+        return base + (peak - base) * (time - start) / (end - start)
+    return load
+
+def wave_load(base, peak, period):
+    """
+    wave_load returns a load profile cycling between the base and peak
+    request rate over the period provided, in seconds, like daily traffic
+    """
+    return lambda time: base + (peak - base) * (1 - math.cos(2 * math.pi * time / period)) / 2
+
+class QueueingModel:
+    """
+    QueueingModel abstracts a service whose replicas each serve one request at
+    a time, as the Flask development server in example/app/api.py does, with
+    load balanced evenly between them. Each replica is modelled as an M/M/1
+    queue, so response times are exponentially distributed with a mean of
+    the service time divided by one minus the utilisation
+    """
+    def __init__(self, service_time, overhead=0):
+        self.service_time = service_time
+        self.overhead = overhead
+        self.cache = {}
+
+    @classmethod
+    def fibonacci(cls, n, call_time=0.02, handling_time=2, overhead=0.5):
+        """
+        fibonacci returns a model of the example fibonacci endpoint, with the
+        time in milliseconds of each recursive call, the time to handle each
+        request outside of the calculation, and the fixed overhead of each
+        request outside of the service, e.g. the network
+        """
+        return cls(handling_time + fibonacci_calls(n) * call_time, overhead)
+
+    def mean(self, replicas, request_rate):
+        """
+        mean returns the mean response time in milliseconds at the replica
+        count and request rate, in requests per second, provided
+        """
+        if replicas <= 0:
+            utilisation = MAX_UTILISATION
+        else:
+            utilisation = min(request_rate * self.service_time / 1000 / replicas, MAX_UTILISATION)
+        return self.service_time / (1 - utilisation)
+
+    def request(self, replicas, request_rate, duration):
+        """
+        request returns the stats of a request name over the duration
+        provided, in seconds, in the shape the metric stage reports them
+        """
+        key = (replicas, request_rate, duration)
+        if key not in self.cache:
+            if len(self.cache) >= MAX_CACHED_REQUESTS:
+                self.cache.clear()
+            self.cache[key] = self.__request(replicas, request_rate, duration)
+        return self.cache[key]
+
+    def __request(self, replicas, request_rate, duration):
+        mean = self.mean(replicas, request_rate)
+        response_times = [round_response_time(self.overhead + mean * quantile) for quantile in EXPONENTIAL_QUANTILES]
+        histogram = {}
+        for response_time in response_times:
+            histogram[response_time] = histogram.get(response_time, 0) + 1
+        return {
+            "num_requests": int(request_rate * duration),
+            "avg_response_time": self.overhead + mean,
+            "median_response_time": response_times[DISTRIBUTION_POINTS // 2],
+            "max_response_time": response_times[-1],
+            "response_time_histogram": [[response_time, histogram[response_time]] for response_time in sorted(histogram)]
+        }
+
+class MemoryStateStore:
+    """
+    MemoryStateStore abstracts a state store held in memory
+    """
+    def __init__(self):
+        self.state = {}
+
+    def get(self):
+        """
+        get returns a copy of the stored state
+        """
+        return copy.deepcopy(self.state)
+
+    def update(self, state):
+        """
+        update replaces the stored state
+        """
+        self.state = copy.deepcopy(state)
+
+class MemoryHistory:
+    """
+    MemoryHistory abstracts a history of load test results held in memory
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = []
+
+    def append(self, entry):
+        """
+        append adds an entry, dropping the oldest if the history is full
+        """
+        self.entries = (self.entries + [entry])[-self.capacity:]
+
+    def latest(self, count):
+        """
+        latest returns up to the count provided of the newest entries
+        """
+        return self.entries[-count:]
+
+class Simulator:
+    """
+    Simulator abstracts running the evaluation logic in a closed loop, each
+    interval modelling the load test results at the current replica count
+    and load, evaluating them, and applying the resulting replica count within
+    the min and max replicas, as the Custom Pod Autoscaler does. New replicas
+    take the startup intervals provided to start serving. Load tests can be
+    given noise, each measuring the request rate off by up to the fraction
+    provided, drawn from a generator seeded with the seed provided
+    """
+    def __init__(self, model, load, eval_config, interval=15, initial_replicas=1, startup_intervals=0,
+                 min_replicas=1, max_replicas=1000, noise=0, seed=0):
+        self.model = model
+        self.load = load
+        self.plan = Plan(eval_config)
+        self.interval = interval
+        self.initial_replicas = initial_replicas
+        self.startup_intervals = startup_intervals
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.noise = noise
+        self.seed = seed
+
+    def required_replicas(self, request_rate):
+        """
+        required_replicas returns the fewest replicas that meet every target
+        at the request rate provided
+        """
+        # latency falls as replicas are added, so search for the first count that
+        # meets every target, doubling to find an upper bound then bisecting
+        low, high = self.min_replicas, self.min_replicas
+        while high < self.max_replicas and self.__breached(high, request_rate):
+            low, high = high + 1, min(high * 2, self.max_replicas)
+        while low < high:
+            mid = (low + high) // 2
+            if self.__breached(mid, request_rate):
+                low = mid + 1
+            else:
+                high = mid
+        return high
+
+    def run(self, intervals):
+        """
+        run simulates the number of intervals provided, returning the
+        replica count of each interval and how well scaling performed:
+        the seconds taken to reach the required replicas after demand rose,
+        the most replicas beyond those required, the replica-seconds used, the
+        intervals in which a target was breached, and the times the replica
+        count changed
+        """
+        decay_handler = DecayHandler(MemoryStateStore())
+        history_config = self.plan.config.get("history")
+        history = None if history_config is None else MemoryHistory(history_config.get("size", 100))
+        evaluate = Evaluate(decay_handler, self.plan.config, "scaler", history, self.plan.index)
+        rng = random.Random(self.seed)
+
+        replicas = self.initial_replicas
+        # replica count requested in each past interval, to model startup time
+        requested = [replicas] * (self.startup_intervals + 1)
+        result = {
+            "replicas": [],
+            "time_to_target": [],
+            "overshoot": 0,
+            "replica_seconds": 0,
+            "breach_intervals": 0,
+            "scale_events": 0
+        }
+        previous_required = 0
+        rising_since = None
+        for i in range(intervals):
+            time = i * self.interval
+            request_rate = self.load(time)
+            # scaling down is immediate, scaling up waits for new replicas to start
+            serving = min(replicas, requested[0])
+            required = self.required_replicas(request_rate)
+
+            if required > previous_required and serving < required and rising_since is None:
+                rising_since = time
+            if rising_since is not None and serving >= required:
+                result["time_to_target"].append(time - rising_since)
+                rising_since = None
+            previous_required = required
+
+            result["replicas"].append(replicas)
+            result["overshoot"] = max(result["overshoot"], replicas - required)
+            result["replica_seconds"] += replicas * self.interval
+            if self.__breached(serving, request_rate):
+                result["breach_intervals"] += 1
+
+            # noise only skews what the load test measures, breaches above are judged on the true load
+            measured_rate = request_rate
+            if self.noise > 0:
+                measured_rate = round(request_rate * (1 + rng.uniform(-self.noise, self.noise)))
+            target_replicas = evaluate.get(self.__metrics(replicas, serving, measured_rate))
+            target_replicas = max(self.min_replicas, min(target_replicas, self.max_replicas))
+            if target_replicas != replicas:
+                result["scale_events"] += 1
+            replicas = target_replicas
+            requested = requested[1:] + [replicas]
+        if rising_since is not None:
+            # never reached the target, count it as taking the rest of the run
+            result["time_to_target"].append(intervals * self.interval - rising_since)
+        return result
+
+    def __metrics(self, replicas, serving, request_rate):
+        request = self.model.request(serving, request_rate, self.interval)
+        return {
+            "version": PAYLOAD_VERSION,
+            "current_replicas": replicas,
+            "num_requests": request["num_requests"],
+            "run_time": self.interval,
+            "requests": {target.name: request for target in self.plan.targets}
+        }
+
+    def __breached(self, replicas, request_rate):
+        request = self.model.request(replicas, request_rate, self.interval)
+        return any(target.ratio(target.extract(request)) > 1 for target in self.plan.targets)